@@ -16,9 +16,9 @@ def get_locale():
     # Force Mongolian locale for the entire application
     return 'mn'
 
-def create_app():
+def create_app(config_class=Config):
     app = Flask(__name__)
-    app.config.from_object(Config)
+    app.config.from_object(config_class)
     # Ensure session permanence
     app.config.setdefault('SESSION_PERMANENT', True)
     
@@ -48,6 +48,18 @@ def create_app():
     from app.commands import init_app
     init_app(app)
     
+    # Keep cached admin counts in step with ORM writes
+    from app import cache
+    cache.init_app(app)
+    
+    # Live statistics notifications for /api/trips/stream
+    from app import events
+    events.init_app(app)
+    
+    # Background writer for LOCATION_WRITE_BEHIND
+    from app import writer
+    writer.init_app(app)
+    
     @login_manager.user_loader
     def load_user(user_id):
         from app.models import User
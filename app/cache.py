@@ -0,0 +1,283 @@
+"""In-process caches for read-heavy views.
+
+Unless a shared backend is configured, each gunicorn worker holds its own
+copy, so every cached value has to be either refreshed on a TTL or cheap to
+rebuild from the database.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from app.models import db, User, FillUp, Vehicle, TriPoint, UserDataVersion
+
+
+class AdminStatsCache:
+    """Row counts shown on the admin dashboard.
+
+    Counts are loaded with COUNT(*) (or PostgreSQL's planner estimate for the
+    tables listed in ADMIN_STATS_ESTIMATED_TABLES) at most once per
+    ADMIN_STATS_TTL_SECONDS. In between, ORM inserts and deletes committed by
+    this worker adjust them; bulk writes that bypass the ORM call
+    record_bulk() or invalidate().
+    """
+
+    MODELS = (User, FillUp, Vehicle, TriPoint)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = None
+        self._loaded_at = 0.0
+
+    def get_counts(self, ttl_seconds, estimated_tables=()):
+        """{table name: row count}, reloaded when older than ttl_seconds"""
+        with self._lock:
+            if self._counts is not None and time.monotonic() - self._loaded_at < ttl_seconds:
+                return dict(self._counts)
+
+        counts = {model.__tablename__: self._count(model, estimated_tables) for model in self.MODELS}
+        with self._lock:
+            self._counts = counts
+            self._loaded_at = time.monotonic()
+        return dict(counts)
+
+    def invalidate(self):
+        with self._lock:
+            self._counts = None
+
+    def apply(self, deltas):
+        """Add committed {table name: delta} changes to the cached counts"""
+        with self._lock:
+            if self._counts is None:
+                return
+            for table, delta in deltas.items():
+                if table in self._counts:
+                    self._counts[table] = max(self._counts[table] + delta, 0)
+
+    def record_bulk(self, session, table, delta):
+        """Queue a change made outside the ORM unit of work; applied on commit"""
+        pending = session.info.setdefault('admin_stats_deltas', {})
+        pending[table] = pending.get(table, 0) + delta
+
+    @staticmethod
+    def _count(model, estimated_tables):
+        table = model.__tablename__
+        if table in estimated_tables and db.session.get_bind().dialect.name == 'postgresql':
+            estimate = db.session.execute(
+                db.text('SELECT reltuples::bigint FROM pg_class WHERE relname = :table'),
+                {'table': table}
+            ).scalar()
+            # reltuples is -1 (or 0) until the table is first analyzed
+            if estimate and estimate > 0:
+                return estimate
+        return db.session.query(db.func.count()).select_from(model).scalar()
+
+
+admin_stats = AdminStatsCache()
+
+
+# Latest stored GPS fix of a user: all the ingest path needs to chain the odometer
+LastPoint = namedtuple('LastPoint', 'lat lon odometer_km trip_date')
+
+
+class NoCacheBackend:
+    """Always misses, so every lookup reads the last point from the database"""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+
+class LocalLRUBackend:
+    """Bounded in-process store; each worker keeps its own"""
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class RedisBackend:
+    """Store shared by every worker; needs the optional `redis` package"""
+
+    def __init__(self, url, prefix='fuel_tracker:last_point:', ttl_seconds=86400):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError('LAST_POINT_CACHE_URL is set but the redis package is not installed') from e
+        self._client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.ttl_seconds = ttl_seconds
+
+    def get(self, key):
+        raw = self._client.get(self.prefix + str(key))
+        if raw is None:
+            return None
+        lat, lon, odometer_km, trip_date = json.loads(raw)
+        return LastPoint(lat, lon, odometer_km, datetime.fromisoformat(trip_date))
+
+    def set(self, key, value):
+        raw = json.dumps([value.lat, value.lon, value.odometer_km, value.trip_date.isoformat()])
+        self._client.set(self.prefix + str(key), raw, ex=self.ttl_seconds)
+
+    def delete(self, key):
+        self._client.delete(self.prefix + str(key))
+
+    def clear(self):
+        for key in self._client.scan_iter(self.prefix + '*'):
+            self._client.delete(key)
+
+
+class LastPointCache:
+    """Per-user last GPS fix, so save_location needs no read query in steady state.
+
+    A miss loads the latest point from the database. Writes are queued on
+    the session and reach the backend only when it commits, so a rolled
+    back insert never leaves a phantom position behind. Nothing is cached
+    unless a backend is configured: LAST_POINT_CACHE_URL shares one store
+    between workers, while the in-process LAST_POINT_CACHE_SIZE store is
+    only safe when a user's fixes all reach the same worker.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend or NoCacheBackend()
+
+    def get(self, user_id):
+        """LastPoint of the user, or None if they have no points yet"""
+        cached = self.backend.get(user_id)
+        if cached is not None:
+            return cached
+        point = TriPoint.get_last_point(user_id)
+        if point is None:
+            return None
+        cached = self._make(point.lat, point.lon, point.odometer_km, point.trip_date)
+        self.backend.set(user_id, cached)
+        return cached
+
+    def remember(self, session, user_id, lat, lon, odometer_km, trip_date):
+        """Queue a newly inserted point; applied when the session commits"""
+        point = self._make(lat, lon, odometer_km, trip_date)
+        pending = session.info.setdefault('last_point_pending', {})
+        previous = pending.get(user_id)
+        if previous is None or point.trip_date >= previous.trip_date:
+            pending[user_id] = point
+
+    def apply(self, pending):
+        for user_id, point in pending.items():
+            cached = self.backend.get(user_id)
+            # The latest point is the one with the newest trip_date, as in
+            # TriPoint.get_last_point; a late fix does not move it back
+            if cached is None or point.trip_date >= cached.trip_date:
+                self.backend.set(user_id, point)
+
+    def invalidate(self, user_id):
+        self.backend.delete(user_id)
+
+    @staticmethod
+    def _make(lat, lon, odometer_km, trip_date):
+        # Stored datetimes come back naive, so compare naive to naive
+        return LastPoint(lat, lon, odometer_km or 0.0, trip_date.replace(tzinfo=None))
+
+
+last_points = LastPointCache()
+
+
+def _track_insert(mapper, connection, target):
+    admin_stats.record_bulk(object_session(target), target.__tablename__, 1)
+
+
+def _track_delete(mapper, connection, target):
+    admin_stats.record_bulk(object_session(target), target.__tablename__, -1)
+
+
+def _track_fillups_change(mapper, connection, target):
+    # Efficiency, tank state and the motor-hour estimate all follow fill-ups
+    # and the vehicle; collected here and bumped once per user per transaction
+    object_session(target).info.setdefault('fillups_version_pending', set()).add(target.user_id)
+
+
+def _bump_fillups_versions(session, flush_context):
+    # The bumps commit with the change itself; a later flush in the same
+    # transaction is covered by the bump already made
+    pending = session.info.pop('fillups_version_pending', None)
+    if not pending:
+        return
+    bumped = session.info.setdefault('fillups_version_bumped', set())
+    connection = session.connection()
+    for user_id in sorted(pending - bumped):
+        UserDataVersion.bump(user_id, fillups=True, connection=connection)
+    bumped |= pending
+
+
+def _apply_committed(session):
+    deltas = session.info.pop('admin_stats_deltas', None)
+    if deltas:
+        admin_stats.apply(deltas)
+    pending = session.info.pop('last_point_pending', None)
+    if pending:
+        last_points.apply(pending)
+    session.info.pop('fillups_version_bumped', None)
+
+
+def _discard_rolled_back(session, previous_transaction):
+    session.info.pop('admin_stats_deltas', None)
+    session.info.pop('last_point_pending', None)
+    session.info.pop('fillups_version_pending', None)
+    session.info.pop('fillups_version_bumped', None)
+
+
+def init_app(app):
+    """Pick the last-point backend and register the hooks that keep caches current"""
+    if app.config.get('LAST_POINT_CACHE_URL'):
+        last_points.backend = RedisBackend(app.config['LAST_POINT_CACHE_URL'])
+    elif app.config.get('LAST_POINT_CACHE_SIZE'):
+        last_points.backend = LocalLRUBackend(app.config['LAST_POINT_CACHE_SIZE'])
+    else:
+        last_points.backend = NoCacheBackend()
+
+    if getattr(init_app, '_registered', False):
+        return
+    for model in AdminStatsCache.MODELS:
+        event.listen(model, 'after_insert', _track_insert)
+        event.listen(model, 'after_delete', _track_delete)
+    for model in (FillUp, Vehicle):
+        for name in ('after_insert', 'after_update', 'after_delete'):
+            event.listen(model, name, _track_fillups_change)
+    event.listen(Session, 'after_flush', _bump_fillups_versions)
+    event.listen(Session, 'after_commit', _apply_committed)
+    event.listen(Session, 'after_soft_rollback', _discard_rolled_back)
+    init_app._registered = True
@@ -1,6 +1,8 @@
+import click
 from flask import current_app
-from app import create_app, db
-from app.models import User
+from datetime import datetime, timedelta
+from app import create_app, db, partitions
+from app.models import User, Vehicle, FillUp, UserFuelStats, TriPoint, UserTripStats, Trip, HeatmapCell, FillUpInterval, OdometerCalibration, TriPointRollup
 
 def init_app(app):
     """Flask app-д command нэмэх"""
@@ -62,3 +64,222 @@ def init_app(app):
             except Exception as e:
                 print(f"❌ Алдаа гарлаа: {e}")
                 db.session.rollback()
+
+    @app.cli.command()
+    @click.option('--chunk-size', default=1000, show_default=True, help='Нэг commit-д шинэчлэх мөрийн тоо')
+    def backfill_efficiency(chunk_size):
+        """Хадгалсан шатахууны хэрэглээний баганыг бүх цэнэглэлтэд бөглөх"""
+        with app.app_context():
+            try:
+                total = 0
+                user_ids = [row[0] for row in db.session.query(FillUp.user_id).distinct()]
+                for user_id in user_ids:
+                    vehicle = Vehicle.get_current_vehicle(user_id)
+                    total += FillUp.refresh_all_stored_efficiency(
+                        user_id, vehicle.tank_capacity_liters, chunk_size=chunk_size, commit=True
+                    )
+                    UserFuelStats.refresh_best_efficiency(user_id)
+                    db.session.commit()
+                    print(f"   Хэрэглэгч #{user_id}: шинэчлэгдлээ")
+                
+                print(f"✅ {len(user_ids)} хэрэглэгчийн {total} цэнэглэлт шинэчлэгдлээ!")
+                
+            except Exception as e:
+                print(f"❌ Алдаа гарлаа: {e}")
+                db.session.rollback()
+
+    @app.cli.command()
+    def check_fuel_stats():
+        """Хэрэглэгчийн статистикийг FillUp мөрүүдээс дахин тооцоолж зөрүүг мэдээлэх"""
+        with app.app_context():
+            try:
+                user_ids = {row[0] for row in db.session.query(FillUp.user_id).distinct()}
+                user_ids |= {row[0] for row in db.session.query(UserFuelStats.user_id)}
+                
+                drifted = 0
+                for user_id in sorted(user_ids):
+                    drift = UserFuelStats.rebuild(user_id)
+                    if drift:
+                        drifted += 1
+                        print(f"⚠️ Хэрэглэгч #{user_id} зөрүүтэй байна:")
+                        for column, (stored, computed) in drift.items():
+                            print(f"   {column}: {stored} → {computed}")
+                db.session.commit()
+                
+                print(f"✅ {len(user_ids)} хэрэглэгч шалгагдлаа, {drifted} нь засагдлаа.")
+                
+            except Exception as e:
+                print(f"❌ Алдаа гарлаа: {e}")
+                db.session.rollback()
+
+    @app.cli.command()
+    def rebuild_trip_stats():
+        """GPS замын нэгтгэсэн статистикийг TriPoint мөрүүдээс дахин тооцоолох"""
+        with app.app_context():
+            try:
+                user_ids = {row[0] for row in db.session.query(TriPoint.user_id).distinct()}
+                user_ids |= {row[0] for row in db.session.query(UserTripStats.user_id)}
+                
+                for user_id in sorted(user_ids):
+                    stats = UserTripStats.rebuild(user_id)
+                    db.session.commit()
+                    print(f"   #{user_id}: {stats.point_count} цэг, {stats.total_distance_km:.1f} км")
+                
+                print(f"✅ {len(user_ids)} хэрэглэгчийн замын статистик шинэчлэгдлээ.")
+                
+            except Exception as e:
+                print(f"❌ Алдаа гарлаа: {e}")
+                db.session.rollback()
+
+    @app.cli.command()
+    def rebuild_trips():
+        """Аяллуудыг TriPoint мөрүүдээс дахин хуваах"""
+        with app.app_context():
+            try:
+                user_ids = {row[0] for row in db.session.query(TriPoint.user_id).distinct()}
+                user_ids |= {row[0] for row in db.session.query(Trip.user_id).distinct()}
+                
+                total = 0
+                for user_id in sorted(user_ids):
+                    count = Trip.rebuild(user_id)
+                    db.session.commit()
+                    total += count
+                    print(f"   #{user_id}: {count} аялал")
+                
+                print(f"✅ {len(user_ids)} хэрэглэгчийн {total} аялал шинэчлэгдлээ.")
+                
+            except Exception as e:
+                print(f"❌ Алдаа гарлаа: {e}")
+                db.session.rollback()
+
+    @app.cli.command()
+    def rebuild_fillup_intervals():
+        """Цэнэглэлт хоорондын интервалуудыг FillUp болон TriPoint мөрүүдээс дахин тооцоолох"""
+        with app.app_context():
+            try:
+                user_ids = sorted(row[0] for row in db.session.query(FillUp.user_id).distinct())
+                
+                total = 0
+                for user_id in user_ids:
+                    count = FillUpInterval.rebuild(user_id)
+                    db.session.commit()
+                    total += count
+                    print(f"   #{user_id}: {count} интервал")
+                
+                print(f"✅ {len(user_ids)} хэрэглэгчийн {total} интервал шинэчлэгдлээ.")
+                
+            except Exception as e:
+                print(f"❌ Алдаа гарлаа: {e}")
+                db.session.rollback()
+
+    @app.cli.command()
+    @click.option('--full', is_flag=True, help='Бүх тохируулгыг устгаж эхнээс нь тооцоолох')
+    def reconcile_odometers(full):
+        """GPS одометрийг цэнэглэлтийн одометрт тааруулах (cron-оор тогтмол ажиллуулна)"""
+        with app.app_context():
+            try:
+                if full:
+                    OdometerCalibration.query.delete()
+                    db.session.commit()
+                
+                pending = OdometerCalibration.pending_users()
+                anchored = 0
+                for user_id, last_point_id in sorted(pending.items()):
+                    anchored += OdometerCalibration.reconcile(user_id, last_point_id)
+                    db.session.commit()
+                
+                print(f"✅ {len(pending)} хэрэглэгч шалгагдлаа, {anchored} цэнэглэлт холбогдлоо.")
+                
+            except Exception as e:
+                print(f"❌ Алдаа гарлаа: {e}")
+                db.session.rollback()
+
+    @app.cli.command()
+    def backfill_geohash():
+        """Хуучин GPS цэгүүдэд geohash бөглөж, heatmap-ийн тоог дахин тооцоолох"""
+        with app.app_context():
+            try:
+                updated = TriPoint.backfill_geohash()
+                print(f"   {updated} цэгт geohash бөглөгдлөө")
+                
+                user_ids = sorted(row[0] for row in db.session.query(TriPoint.user_id).distinct())
+                for user_id in user_ids:
+                    HeatmapCell.rebuild(user_id)
+                    db.session.commit()
+                
+                print(f"✅ {len(user_ids)} хэрэглэгчийн heatmap шинэчлэгдлээ.")
+                
+            except Exception as e:
+                print(f"❌ Алдаа гарлаа: {e}")
+                db.session.rollback()
+
+    @app.cli.command()
+    @click.option('--months-ahead', default=3, show_default=True, help='Ирээдүйн хэдэн сарын хуваалт үүсгэх')
+    def partition_tri_point(months_ahead):
+        """tri_point хүснэгтийг сараар хуваасан (PostgreSQL) бүтэц рүү шилжүүлэх"""
+        with app.app_context():
+            if not partitions.is_supported():
+                print("ℹ️ Хуваалт зөвхөн PostgreSQL дээр ажиллана, өөрчлөлт хийгдсэнгүй.")
+                return
+            try:
+                moved = partitions.convert_to_partitioned(months_ahead)
+                db.session.commit()
+                if moved is None:
+                    print("⚠️ tri_point аль хэдийн хуваагдсан байна.")
+                else:
+                    print(f"✅ tri_point хуваагдлаа, {moved} цэг шилжүүлэв.")
+            except Exception as e:
+                print(f"❌ Алдаа гарлаа: {e}")
+                db.session.rollback()
+
+    @app.cli.command()
+    @click.option('--months-ahead', default=3, show_default=True, help='Ирээдүйн хэдэн сарын хуваалт үүсгэх')
+    def create_tri_point_partitions(months_ahead):
+        """Ирэх саруудын tri_point хуваалтуудыг урьдчилан үүсгэх (сар бүр ажиллуулна)"""
+        with app.app_context():
+            if not partitions.is_partitioned():
+                print("ℹ️ tri_point хуваагдаагүй байна (эсвэл PostgreSQL биш), өөрчлөлт хийгдсэнгүй.")
+                return
+            try:
+                names = partitions.create_future_partitions(months_ahead)
+                db.session.commit()
+                print(f"✅ Хуваалтууд бэлэн: {', '.join(names)}")
+            except Exception as e:
+                print(f"❌ Алдаа гарлаа: {e}")
+                db.session.rollback()
+
+    @app.cli.command()
+    @click.option('--older-than-days', type=int, default=None, help='TRIPOINT_RAW_RETENTION_DAYS-ийг дарж тохируулах')
+    @click.option('--bucket-seconds', type=int, default=None, help='TRIPOINT_ROLLUP_SECONDS-ийг дарж тохируулах')
+    @click.option('--full', is_flag=True, help='Хүрсэн хилийг үл тоон хамгийн хуучин цэгээс эхлэх')
+    def downsample_tri_points(older_than_days, bucket_seconds, full):
+        """Хуучин GPS цэгүүдийг нэг минутад нэг цэг болгон цөөлөх (зай хадгалагдана)"""
+        older_than_days = older_than_days if older_than_days is not None else app.config['TRIPOINT_RAW_RETENTION_DAYS']
+        bucket_seconds = bucket_seconds or app.config['TRIPOINT_ROLLUP_SECONDS']
+        cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+        with app.app_context():
+            try:
+                if full:
+                    TriPointRollup.query.delete()
+                    db.session.commit()
+                
+                total = 0
+                for user_id, first_date in sorted(TriPointRollup.pending_users(cutoff, bucket_seconds).items()):
+                    deleted = 0
+                    # One day per transaction keeps locks and undo short; days
+                    # without points are skipped
+                    while first_date is not None:
+                        day = datetime(first_date.year, first_date.month, first_date.day)
+                        until = min(day + timedelta(days=1), cutoff)
+                        deleted += TriPoint.downsample(user_id, until, bucket_seconds, start=day)
+                        TriPointRollup.advance(user_id, bucket_seconds, until)
+                        db.session.commit()
+                        first_date = TriPointRollup.first_raw_point_date(user_id, until, cutoff)
+                    total += deleted
+                    print(f"   Хэрэглэгч #{user_id}: {deleted} цэг хасагдлаа")
+                
+                print(f"✅ {cutoff:%Y-%m-%d}-с өмнөх {total} цэг {bucket_seconds} секундын нэгтгэл болж цөөрлөө.")
+                
+            except Exception as e:
+                print(f"❌ Алдаа гарлаа: {e}")
+                db.session.rollback()
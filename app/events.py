@@ -0,0 +1,79 @@
+"""In-process pub/sub of "this user's trip statistics changed" notifications.
+
+Ingest marks the user on the session (UserTripStats.record_points) and the
+notification goes out only when that session commits, like the last-point
+cache. GET /api/trips/stream subscribes per open map tab and pushes fresh
+statistics on each notification.
+
+Subscribers only hear about commits made in the same process; the stream
+also re-checks the stored totals on its keepalive interval so points
+ingested by another worker still show up.
+"""
+import queue
+import threading
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+class StatsEvents:
+    """user_id-аар түлхүүрлэсэн статистикийн өөрчлөлтийн мэдэгдэл"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def subscribe(self, user_id):
+        # One pending notification is enough: the stream re-reads the totals
+        subscription = queue.Queue(maxsize=1)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, user_id, subscription):
+        with self._lock:
+            subscriptions = self._subscribers.get(user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscribers[user_id]
+
+    def subscriber_count(self, user_id=None):
+        with self._lock:
+            if user_id is not None:
+                return len(self._subscribers.get(user_id, ()))
+            return sum(len(subscriptions) for subscriptions in self._subscribers.values())
+
+    def publish(self, user_id):
+        with self._lock:
+            subscriptions = list(self._subscribers.get(user_id, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.put_nowait(user_id)
+            except queue.Full:
+                pass  # already notified and not yet read
+
+    def mark_changed(self, session, user_id):
+        """Notify user_id's subscribers once session commits"""
+        session.info.setdefault('stats_changed', set()).add(user_id)
+
+
+stats_events = StatsEvents()
+
+
+def _publish_committed(session):
+    for user_id in session.info.pop('stats_changed', ()):
+        stats_events.publish(user_id)
+
+
+def _discard_rolled_back(session, previous_transaction):
+    session.info.pop('stats_changed', None)
+
+
+def init_app(app):
+    """Register the hooks that publish on commit"""
+    if getattr(init_app, '_registered', False):
+        return
+    event.listen(Session, 'after_commit', _publish_committed)
+    event.listen(Session, 'after_soft_rollback', _discard_rolled_back)
+    init_app._registered = True
@@ -0,0 +1,381 @@
+"""Geodesy over GPS tracks: distances, speeds, jitter and moving/idle time.
+
+Functions take parallel sequences of latitudes, longitudes (degrees) and
+timestamps (datetimes) and work on whole tracks at once. With NumPy
+installed they are vectorized; otherwise the same formulas run as plain
+Python loops, so results agree to floating-point rounding either way.
+"""
+import math
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - exercised when NumPy is not installed
+    np = None
+
+HAVE_NUMPY = np is not None
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Calculate distance between two lat/lon points in kilometers"""
+    dlat = math.radians(lat2 - lat1)
+    dlon = math.radians(lon2 - lon1)
+    a = (
+        math.sin(dlat / 2) ** 2
+        + math.cos(math.radians(lat1))
+        * math.cos(math.radians(lat2))
+        * math.sin(dlon / 2) ** 2
+    )
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    return EARTH_RADIUS_KM * c
+
+
+def segment_distances_km(lats, lons, use_numpy=HAVE_NUMPY):
+    """Distance of each consecutive pair of points (n points -> n-1 segments)"""
+    if use_numpy:
+        lat = np.radians(np.asarray(lats, dtype=float))
+        lon = np.radians(np.asarray(lons, dtype=float))
+        if lat.size < 2:
+            return np.zeros(0)
+        dlat = np.diff(lat)
+        dlon = np.diff(lon)
+        a = np.sin(dlat / 2) ** 2 + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(dlon / 2) ** 2
+        return EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    return [haversine_km(lats[i - 1], lons[i - 1], lats[i], lons[i]) for i in range(1, len(lats))]
+
+
+def stored_steps_km(lats, lons, odometers_km, slack_km=0.001, use_numpy=HAVE_NUMPY):
+    """segment_distances_km of stored points, taking the step of their
+    chained odometers where that is longer by more than slack_km. Between
+    consecutive fixes the two agree up to rounding; between points that were
+    thinned out only the odometer still covers the whole drive.
+    """
+    distances = segment_distances_km(lats, lons, use_numpy)
+    if use_numpy:
+        steps = np.diff(np.asarray(odometers_km, dtype=float))
+        return np.where(steps > distances + slack_km, steps, distances)
+    return [step if step > d + slack_km else d
+            for d, step in zip(distances, (odometers_km[i + 1] - odometers_km[i] for i in range(len(distances))))]
+
+
+def filter_jitter(distances_km, jitter_km, use_numpy=HAVE_NUMPY):
+    """Zero out segments shorter than jitter_km (GPS noise, not movement)"""
+    if use_numpy:
+        distances_km = np.asarray(distances_km, dtype=float)
+        return np.where(distances_km < jitter_km, 0.0, distances_km)
+    return [0.0 if d < jitter_km else d for d in distances_km]
+
+
+def segment_durations_s(timestamps, use_numpy=HAVE_NUMPY):
+    """Seconds between consecutive timestamps (n timestamps -> n-1 segments)"""
+    if use_numpy:
+        times = np.asarray(timestamps, dtype='datetime64[us]')
+        return np.diff(times).astype(float) / 1e6
+    return [(timestamps[i] - timestamps[i - 1]).total_seconds() for i in range(1, len(timestamps))]
+
+
+def segment_speeds_kmh(distances_km, durations_s, use_numpy=HAVE_NUMPY):
+    """Speed of each segment; 0 where the duration is not positive"""
+    if use_numpy:
+        distances_km = np.asarray(distances_km, dtype=float)
+        durations_s = np.asarray(durations_s, dtype=float)
+        speeds = np.zeros_like(distances_km)
+        valid = durations_s > 0
+        speeds[valid] = distances_km[valid] / durations_s[valid] * 3600.0
+        return speeds
+    return [(d / dt) * 3600.0 if dt > 0 else 0.0 for d, dt in zip(distances_km, durations_s)]
+
+
+def summarize_movement(lats, lons, timestamps, jitter_km, idle_speed_kmh,
+                       stationary_is_idle=True, distances_km=None, use_numpy=HAVE_NUMPY):
+    """Distance and moving/idle time of a track ordered by timestamp.
+
+    Segments with a non-positive duration are skipped. After jitter
+    filtering, a segment at or above idle_speed_kmh is moving and one below
+    it is idle; a segment with no distance at all only counts as idle when
+    stationary_is_idle is set. distances_km optionally replaces the
+    haversine length of each segment (see stored_steps_km).
+
+    Returns a dict with distance_km, moving_seconds, idle_seconds,
+    max_speed_kmh, avg_speed_kmh (mean over moving segments), speed_sum_kmh
+    and moving_segments.
+    """
+    if distances_km is None:
+        distances_km = segment_distances_km(lats, lons, use_numpy)
+    distances = filter_jitter(distances_km, jitter_km, use_numpy)
+    durations = segment_durations_s(timestamps, use_numpy)
+    speeds = segment_speeds_kmh(distances, durations, use_numpy)
+
+    if use_numpy:
+        valid = durations > 0
+        moving = valid & (distances > 0) & (speeds >= idle_speed_kmh)
+        idle = valid & ~moving
+        if not stationary_is_idle:
+            idle &= distances > 0
+        moving_segments = int(moving.sum())
+        return {
+            'distance_km': float(distances[valid].sum()),
+            'moving_seconds': float(durations[moving].sum()),
+            'idle_seconds': float(durations[idle].sum()),
+            'max_speed_kmh': float(speeds[moving].max()) if moving_segments else 0.0,
+            'avg_speed_kmh': float(speeds[moving].mean()) if moving_segments else 0.0,
+            'speed_sum_kmh': float(speeds[moving].sum()),
+            'moving_segments': moving_segments,
+        }
+
+    distance_km = moving_seconds = idle_seconds = max_speed_kmh = speed_sum = 0.0
+    moving_segments = 0
+    for d_km, dt, speed_kmh in zip(distances, durations, speeds):
+        if dt <= 0:
+            continue
+        distance_km += d_km
+        if d_km > 0 and speed_kmh >= idle_speed_kmh:
+            moving_seconds += dt
+            max_speed_kmh = max(max_speed_kmh, speed_kmh)
+            speed_sum += speed_kmh
+            moving_segments += 1
+        elif d_km > 0 or stationary_is_idle:
+            idle_seconds += dt
+    return {
+        'distance_km': distance_km,
+        'moving_seconds': moving_seconds,
+        'idle_seconds': idle_seconds,
+        'max_speed_kmh': max_speed_kmh,
+        'avg_speed_kmh': speed_sum / moving_segments if moving_segments else 0.0,
+        'speed_sum_kmh': speed_sum,
+        'moving_segments': moving_segments,
+    }
+
+
+def chain_odometer(start_km, lats, lons, jitter_km, use_numpy=HAVE_NUMPY):
+    """Odometer after each point, continuing from start_km at the first point.
+
+    The first point is the anchor (the previous stored fix) and is not
+    included in the result, so n points give n-1 readings.
+    """
+    distances = filter_jitter(segment_distances_km(lats, lons, use_numpy), jitter_km, use_numpy)
+    if use_numpy:
+        return (start_km + np.cumsum(distances)).tolist()
+    readings = []
+    odometer_km = start_km
+    for d_km in distances:
+        odometer_km += d_km
+        readings.append(odometer_km)
+    return readings
+
+
+def meters_per_pixel(zoom, lat):
+    """Ground resolution of a Web Mercator map tile pixel at zoom and latitude"""
+    return 156543.03392 * math.cos(math.radians(lat)) / (2 ** zoom)
+
+
+def _project_m(lats, lons):
+    """Local equirectangular projection to meters around the track's first point"""
+    lat0 = math.radians(lats[0])
+    kx = math.radians(1) * EARTH_RADIUS_KM * 1000 * math.cos(lat0)
+    ky = math.radians(1) * EARTH_RADIUS_KM * 1000
+    return [lon * kx for lon in lons], [lat * ky for lat in lats]
+
+
+def _segment_offsets_m(xs, ys, first, last, use_numpy):
+    """Distance of points first+1..last-1 from the segment first-last, in meters"""
+    ax, ay, bx, by = xs[first], ys[first], xs[last], ys[last]
+    dx, dy = bx - ax, by - ay
+    length2 = dx * dx + dy * dy
+    if use_numpy:
+        px = np.asarray(xs[first + 1:last]) - ax
+        py = np.asarray(ys[first + 1:last]) - ay
+        if length2 == 0:
+            return np.hypot(px, py)
+        t = np.clip((px * dx + py * dy) / length2, 0.0, 1.0)
+        return np.hypot(px - t * dx, py - t * dy)
+    offsets = []
+    for i in range(first + 1, last):
+        px, py = xs[i] - ax, ys[i] - ay
+        t = 0.0 if length2 == 0 else min(max((px * dx + py * dy) / length2, 0.0), 1.0)
+        offsets.append(math.hypot(px - t * dx, py - t * dy))
+    return offsets
+
+
+def simplify_indexes(lats, lons, tolerance_m, use_numpy=HAVE_NUMPY):
+    """Douglas-Peucker: indexes of the points to keep so that every dropped
+    point lies within tolerance_m of the simplified line. The first and last
+    points are always kept.
+    """
+    count = len(lats)
+    if count <= 2:
+        return list(range(count))
+    xs, ys = _project_m(lats, lons)
+    if use_numpy:
+        xs, ys = np.asarray(xs), np.asarray(ys)
+
+    keep = [False] * count
+    keep[0] = keep[-1] = True
+    stack = [(0, count - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        offsets = _segment_offsets_m(xs, ys, first, last, use_numpy)
+        if use_numpy:
+            worst = int(np.argmax(offsets))
+        else:
+            worst = max(range(len(offsets)), key=offsets.__getitem__)
+        if offsets[worst] > tolerance_m:
+            split = first + 1 + worst
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return [i for i, kept in enumerate(keep) if kept]
+
+
+def simplify_significance(lats, lons, use_numpy=HAVE_NUMPY):
+    """One full Douglas-Peucker pass recording, per point, the largest
+    tolerance at which simplify_indexes would still keep it.
+
+    The split chosen for a range does not depend on the tolerance, so a
+    point is kept at tolerance t exactly when its own offset and those of
+    the splits above it all exceed t. The endpoints get infinity.
+    """
+    count = len(lats)
+    significance = [0.0] * count
+    if count:
+        significance[0] = significance[-1] = math.inf
+    if count <= 2:
+        return significance
+    xs, ys = _project_m(lats, lons)
+    if use_numpy:
+        xs, ys = np.asarray(xs), np.asarray(ys)
+
+    stack = [(0, count - 1, math.inf)]
+    while stack:
+        first, last, ceiling = stack.pop()
+        if last - first < 2:
+            continue
+        offsets = _segment_offsets_m(xs, ys, first, last, use_numpy)
+        if use_numpy:
+            worst = int(np.argmax(offsets))
+        else:
+            worst = max(range(len(offsets)), key=offsets.__getitem__)
+        offset = float(offsets[worst])
+        if offset > 0:
+            split = first + 1 + worst
+            significance[split] = min(offset, ceiling)
+            stack.append((first, split, significance[split]))
+            stack.append((split, last, significance[split]))
+    return significance
+
+
+def simplify_bounded(lats, lons, tolerance_m, max_points, use_numpy=HAVE_NUMPY):
+    """simplify_indexes with at most max_points vertices.
+
+    If the tolerance keeps too many points it is raised to the
+    significance of the first point that has to go, from a single
+    simplify_significance pass. Returns (indexes, tolerance actually used).
+    """
+    tolerance_m = max(tolerance_m, 0.01)
+    significance = simplify_significance(lats, lons, use_numpy)
+    budget = max(max_points, 2) - 2
+    interior = sorted((s for s in significance[1:-1] if s > tolerance_m), reverse=True)
+    if len(interior) > budget:
+        tolerance_m = interior[budget]
+    return [i for i, s in enumerate(significance) if s > tolerance_m], tolerance_m
+
+
+GEOHASH_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def _geohash_bits(precision):
+    """(latitude bits, longitude bits) of a geohash; longitude gets the odd one"""
+    bits = 5 * precision
+    return bits // 2, bits - bits // 2
+
+
+def _geohash_from_indexes(lat_index, lon_index, precision):
+    lat_bits, lon_bits = _geohash_bits(precision)
+    value = 0
+    for k in range(5 * precision):
+        # Bits alternate longitude, latitude, ... from the most significant
+        if k % 2 == 0:
+            bit = (lon_index >> (lon_bits - 1 - k // 2)) & 1
+        else:
+            bit = (lat_index >> (lat_bits - 1 - k // 2)) & 1
+        value = (value << 1) | bit
+    return ''.join(GEOHASH_BASE32[(value >> (5 * (precision - 1 - i))) & 0x1f] for i in range(precision))
+
+
+def _geohash_indexes(lat, lon, precision):
+    """Grid row and column of the precision-level cell containing lat/lon"""
+    lat_bits, lon_bits = _geohash_bits(precision)
+    lat_index = min(int((lat + 90.0) / 180.0 * (1 << lat_bits)), (1 << lat_bits) - 1)
+    lon_index = min(int((lon + 180.0) / 360.0 * (1 << lon_bits)), (1 << lon_bits) - 1)
+    return max(lat_index, 0), max(lon_index, 0)
+
+
+def geohash_encode(lat, lon, precision):
+    """Geohash of a point; a longer geohash is a cell nested inside any prefix of it"""
+    return _geohash_from_indexes(*_geohash_indexes(lat, lon, precision), precision)
+
+
+def geohash_bounds(cell):
+    """(south, west, north, east) of a geohash cell"""
+    lat_bits, lon_bits = _geohash_bits(len(cell))
+    value = 0
+    for char in cell:
+        value = (value << 5) | GEOHASH_BASE32.index(char)
+    lat_index = lon_index = 0
+    for k in range(5 * len(cell)):
+        bit = (value >> (5 * len(cell) - 1 - k)) & 1
+        if k % 2 == 0:
+            lon_index = (lon_index << 1) | bit
+        else:
+            lat_index = (lat_index << 1) | bit
+    height = 180.0 / (1 << lat_bits)
+    width = 360.0 / (1 << lon_bits)
+    south = -90.0 + lat_index * height
+    west = -180.0 + lon_index * width
+    return south, west, south + height, west + width
+
+
+def geohash_cover(south, west, north, east, max_precision, max_cells=32):
+    """(precision, cells): the finest geohash cells, at most max_precision
+    characters and (apart from precision 1) max_cells of them, that together
+    contain the box. The box must not cross the antimeridian.
+    """
+    best = None
+    for precision in range(1, max_precision + 1):
+        south_row, west_col = _geohash_indexes(south, west, precision)
+        north_row, east_col = _geohash_indexes(north, east, precision)
+        if best is not None and (north_row - south_row + 1) * (east_col - west_col + 1) > max_cells:
+            break
+        best = (precision, sorted(
+            _geohash_from_indexes(row, col, precision)
+            for row in range(south_row, north_row + 1)
+            for col in range(west_col, east_col + 1)
+        ))
+    return best
+
+
+def geohash_ranges(cells):
+    """Merge same-length cells into [low, high) string ranges that contain
+    every longer geohash starting with one of them
+    """
+    ranges = []
+    for cell in sorted(cells):
+        value = 0
+        for char in cell:
+            value = (value << 5) | GEOHASH_BASE32.index(char)
+        if ranges and ranges[-1][2] == value:
+            ranges[-1][1:] = [None, value + 1]
+        else:
+            ranges.append([cell, None, value + 1])
+    result = []
+    for low, _, end in ranges:
+        precision = len(low)
+        if end >= 1 << (5 * precision):
+            high = '~'  # past the last cell; sorts after every base-32 character
+        else:
+            high = ''.join(GEOHASH_BASE32[(end >> (5 * (precision - 1 - i))) & 0x1f] for i in range(precision))
+        result.append((low, high))
+    return result
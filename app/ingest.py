@@ -0,0 +1,172 @@
+"""Filtering stages that GPS fixes pass through before they are stored.
+
+A stage is a function (points, context) -> points over an ordered list of
+point dicts (lat, lon, trip_date, accuracy). It may drop fixes, which are
+counted against the stage in the report, or mark them with stored=False:
+such a fix still reaches the trip statistics but gets no row of its own.
+INGEST_FILTERS names the stages to run, in order; register more in STAGES.
+
+Fixes older than the user's last stored fix are passed through untouched.
+"""
+import threading
+
+from app import geo
+
+RECEIVED = 'received'
+SAVED = 'saved'
+
+# A fix this far beyond the previous one is trusted again whatever its
+# implied speed, so a real jump (tracking off while driving) is not
+# rejected forever
+OUTLIER_RESYNC_SECONDS = 300
+
+
+class IngestContext:
+    """Нэг хүсэлтийн шүүлтүүрүүдийн дундын төлөв"""
+
+    def __init__(self, last_point, config):
+        # Previous fix of the user (LastPoint) or None
+        self.last_point = last_point
+        self.config = config
+        # Set when stationary fixes extended the already stored last row
+        self.anchor_dwell_until = None
+        self.dropped = {}
+
+    def reference(self, kept):
+        """The fix new ones are compared to: the last kept one, else last_point"""
+        if kept:
+            return kept[-1]
+        if self.last_point:
+            return {'lat': self.last_point.lat, 'lon': self.last_point.lon, 'trip_date': self.last_point.trip_date}
+        return None
+
+    def is_late(self, point):
+        return self.last_point is not None and point['trip_date'] <= self.last_point.trip_date
+
+
+def accuracy_gate(points, context):
+    """Drop fixes whose reported accuracy is worse than INGEST_MAX_ACCURACY_M"""
+    max_accuracy_m = context.config['INGEST_MAX_ACCURACY_M']
+    return [p for p in points if p.get('accuracy') is None or p['accuracy'] <= max_accuracy_m]
+
+
+def drop_outliers(points, context):
+    """Drop teleport spikes: fixes implying more than INGEST_MAX_SPEED_KMH
+    from the previous accepted fix
+    """
+    max_speed_kmh = context.config['INGEST_MAX_SPEED_KMH']
+    kept = []
+    accepted = []
+    for point in points:
+        if not context.is_late(point):
+            previous = context.reference(accepted)
+            if previous is not None:
+                seconds = (point['trip_date'] - previous['trip_date']).total_seconds()
+                if 0 < seconds <= OUTLIER_RESYNC_SECONDS:
+                    distance_km = geo.haversine_km(previous['lat'], previous['lon'], point['lat'], point['lon'])
+                    if distance_km / seconds * 3600.0 > max_speed_kmh:
+                        continue
+            accepted.append(point)
+        kept.append(point)
+    return kept
+
+
+def coalesce_stationary(points, context):
+    """Fold fixes within INGEST_STATIONARY_RADIUS_M of the last stored one
+    into it: the stored fix gets dwell_until instead of a new row.
+
+    The folded fix stays in the list at the stored fix's position with
+    stored=False, so downstream statistics still see the time spent there.
+    """
+    radius_km = context.config['INGEST_STATIONARY_RADIUS_M'] / 1000.0
+    result = []
+    stored = []
+    for point in points:
+        if context.is_late(point):
+            result.append(point)
+            continue
+        anchor = context.reference(stored)
+        if anchor is not None and point['trip_date'] > anchor['trip_date'] \
+                and geo.haversine_km(anchor['lat'], anchor['lon'], point['lat'], point['lon']) < radius_km:
+            if stored:
+                anchor['dwell_until'] = point['trip_date']
+            else:
+                context.anchor_dwell_until = point['trip_date']
+            result.append({'lat': anchor['lat'], 'lon': anchor['lon'], 'trip_date': point['trip_date'],
+                           'accuracy': point.get('accuracy'), 'stored': False})
+            continue
+        stored.append(point)
+        result.append(point)
+    return result
+
+
+STAGES = {
+    'accuracy': accuracy_gate,
+    'outlier': drop_outliers,
+    'stationary': coalesce_stationary,
+}
+
+
+def enabled_stages(config):
+    names = [name.strip() for name in config.get('INGEST_FILTERS', '').split(',') if name.strip()]
+    unknown = [name for name in names if name not in STAGES]
+    if unknown:
+        raise ValueError(f"Unknown ingest filters: {', '.join(unknown)}")
+    return names
+
+
+def run(points, last_point, config):
+    """Pass an ordered batch through the configured stages.
+
+    Returns (points, context). Fixes in the result without stored=False
+    are the rows to insert; context.dropped counts the fixes each stage
+    removed.
+    """
+    context = IngestContext(last_point, config)
+    for name in enabled_stages(config):
+        before = len(points)
+        points = STAGES[name](points, context)
+        if name == 'stationary':
+            context.dropped[name] = sum(1 for p in points if p.get('stored') is False)
+        else:
+            context.dropped[name] = before - len(points)
+    return points, context
+
+
+def report(received, points, context):
+    """Saved vs received counts of one request, for the API response"""
+    return {
+        RECEIVED: received,
+        SAVED: sum(1 for p in points if p.get('stored', True)),
+        'dropped': context.dropped,
+    }
+
+
+class IngestTotals:
+    """Процесс эхэлснээс хойших хүлээн авсан болон хадгалсан цэгийн тоо"""
+
+    def __init__(self):
+        # Request threads and the write-behind thread add concurrently
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counts = {RECEIVED: 0, SAVED: 0}
+            self.dropped = {}
+
+    def add(self, request_report):
+        with self._lock:
+            self.counts[RECEIVED] += request_report[RECEIVED]
+            self.counts[SAVED] += request_report[SAVED]
+            for name, count in request_report['dropped'].items():
+                self.dropped[name] = self.dropped.get(name, 0) + count
+
+    def as_dict(self):
+        with self._lock:
+            received = self.counts[RECEIVED]
+            return dict(self.counts, dropped=dict(self.dropped),
+                        saved_ratio=round(self.counts[SAVED] / received, 4) if received else None)
+
+
+ingest_totals = IngestTotals()
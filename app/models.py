@@ -1,11 +1,53 @@
 from werkzeug.security import generate_password_hash, check_password_hash
+from flask import g, has_app_context
 from flask_login import UserMixin
-from datetime import datetime, date
+from datetime import datetime, date, time
+import math
+
+from app import geo
 
 # Import db from flask_sqlalchemy to avoid circular imports
 from flask_sqlalchemy import SQLAlchemy
 db = SQLAlchemy()
 
+
+def month_bucket(column):
+    """Truncate a datetime column to its month in SQL.
+
+    Uses date_trunc on PostgreSQL and strftime on SQLite; pass the result
+    through month_key to get a 'YYYY-MM' string on either.
+    """
+    if db.session.get_bind().dialect.name == 'postgresql':
+        return db.func.date_trunc('month', column)
+    return db.func.strftime('%Y-%m', column)
+
+
+def month_key(bucket):
+    """'YYYY-MM' string for a month_bucket value"""
+    if hasattr(bucket, 'strftime'):
+        return bucket.strftime('%Y-%m')
+    return bucket[:7]
+
+
+def _geohash_default(context):
+    params = context.get_current_parameters()
+    return geo.geohash_encode(params['lat'], params['lon'], TriPoint.GEOHASH_PRECISION)
+
+
+def geohash_filter(column, cells):
+    """SQL condition matching geohashes inside any of the given same-length cells"""
+    return db.or_(*(db.and_(column >= low, column < high) for low, high in geo.geohash_ranges(cells)))
+
+
+def time_bucket(column, seconds):
+    """Integer index of the seconds-wide interval a datetime column falls in, in SQL"""
+    if db.session.get_bind().dialect.name == 'postgresql':
+        epoch = db.cast(db.func.floor(db.extract('epoch', column)), db.BigInteger)
+    else:
+        epoch = db.cast(db.func.strftime('%s', column), db.Integer)
+    return epoch // seconds
+
+
 class TriPoint(db.Model):
     """GPS цэгүүдийг хадгалах модель"""
     _tablename_ = "tri_points"
@@ -26,9 +68,271 @@ class TriPoint(db.Model):
     
     # GPS accuracy in meters (optional)
     accuracy = db.Column(db.Float)
+
+    # Last time the vehicle was still at this fix, when later fixes within
+    # the stationary radius were folded into it instead of stored
+    dwell_until = db.Column(db.DateTime)
+
+    # Geohash cell of the fix, filled in on insert (Core or ORM)
+    geohash = db.Column(db.String(12), default=_geohash_default)
+
+    __table_args__ = (
+        # Latest point / recent window per user
+        db.Index('ix_tri_point_user_id_trip_date', 'user_id', 'trip_date'),
+        # Viewport (bbox) queries: one range scan per covering cell
+        db.Index('ix_tri_point_user_id_geohash', 'user_id', 'geohash'),
+    )
     
+    # Steps shorter than this are GPS jitter and do not advance the odometer
+    JITTER_KM = 0.005
+    # ~5 m cells
+    GEOHASH_PRECISION = 9
+    # Most cells a bbox query is split into; coarser cells are used beyond it
+    BBOX_MAX_CELLS = 32
+
     def __repr__(self):
         return f'<TriPoint {self.lat:.6f}, {self.lon:.6f} at {self.trip_date}>'
+
+    @property
+    def dwell_seconds(self):
+        return (self.dwell_until - self.trip_date).total_seconds() if self.dwell_until else 0.0
+
+    @staticmethod
+    def expand_dwell(rows):
+        """(lat, lon, trip_date, odometer_km) fixes of rows with lat, lon,
+        odometer_km, trip_date and dwell_until, adding a fix at the end of
+        each dwell. This is the track the trip statistics saw when the points
+        were ingested.
+        """
+        for row in rows:
+            yield row.lat, row.lon, row.trip_date, row.odometer_km
+            if row.dwell_until and row.dwell_until > row.trip_date:
+                yield row.lat, row.lon, row.dwell_until, row.odometer_km
+
+    @staticmethod
+    def extend_dwell(user_id, dwell_until):
+        """Set dwell_until on the user's latest stored point"""
+        latest = db.select(TriPoint.id).where(TriPoint.user_id == user_id).order_by(
+            TriPoint.trip_date.desc(), TriPoint.id.desc()
+        ).limit(1).scalar_subquery()
+        db.session.execute(
+            db.update(TriPoint).where(TriPoint.id == latest).values(dwell_until=dwell_until)
+            .execution_options(synchronize_session=False)
+        )
+
+    @staticmethod
+    def filter_bbox(query, south, west, north, east):
+        """Restrict a TriPoint query to fixes inside the box.
+
+        The geohash cells covering the box become range conditions on the
+        (user_id, geohash) index, so only those cells are read; the exact
+        lat/lon test then trims the cell edges.
+        """
+        _, cells = geo.geohash_cover(south, west, north, east, TriPoint.GEOHASH_PRECISION, TriPoint.BBOX_MAX_CELLS)
+        return query.filter(
+            geohash_filter(TriPoint.geohash, cells),
+            TriPoint.lat.between(south, north),
+            TriPoint.lon.between(west, east)
+        )
+
+    @staticmethod
+    def backfill_geohash(chunk_size=1000):
+        """Fill in geohash for rows stored before the column existed, a chunk
+        per commit. Returns the number of rows updated.
+        """
+        updated = 0
+        while True:
+            rows = db.session.query(TriPoint.id, TriPoint.lat, TriPoint.lon).filter(
+                TriPoint.geohash.is_(None)
+            ).order_by(TriPoint.id).limit(chunk_size).all()
+            if not rows:
+                return updated
+            db.session.execute(db.update(TriPoint), [
+                {'id': row.id, 'geohash': geo.geohash_encode(row.lat, row.lon, TriPoint.GEOHASH_PRECISION)}
+                for row in rows
+            ])
+            db.session.commit()
+            updated += len(rows)
+
+    @staticmethod
+    def get_last_point(user_id):
+        """(lat, lon, odometer_km, trip_date) of the user's most recent stored
+        point, or None. trip_date is the end of the point's dwell if it has
+        one, the time of the last fix folded into it, as the last-point cache
+        remembers it.
+        """
+        return db.session.query(
+            TriPoint.lat, TriPoint.lon, TriPoint.odometer_km,
+            db.func.coalesce(TriPoint.dwell_until, TriPoint.trip_date).label('trip_date')
+        ).filter(TriPoint.user_id == user_id).order_by(TriPoint.trip_date.desc(), TriPoint.id.desc()).first()
+
+    @staticmethod
+    def iter_track(user_id, since=None, until=None, after=None, limit=None, chunk_size=1000):
+        """Yield a user's points as (id, lat, lon, odometer_km, trip_date, accuracy, dwell_until) rows,
+        oldest first, ordered by (trip_date, id).
+
+        after is a (trip_date, id) keyset position to continue from. Rows are
+        fetched chunk_size at a time through a server-side cursor (yield_per),
+        so callers can stream any number of points in constant memory.
+        """
+        query = db.session.query(
+            TriPoint.id, TriPoint.lat, TriPoint.lon, TriPoint.odometer_km, TriPoint.trip_date, TriPoint.accuracy,
+            TriPoint.dwell_until
+        ).filter(TriPoint.user_id == user_id)
+        if since:
+            query = query.filter(TriPoint.trip_date >= since)
+        if until:
+            query = query.filter(TriPoint.trip_date <= until)
+        if after:
+            after_date, after_id = after
+            # trip_date >= bound keeps the range scan on the (user_id, trip_date) index
+            query = query.filter(
+                TriPoint.trip_date >= after_date,
+                db.or_(TriPoint.trip_date > after_date, TriPoint.id > after_id)
+            )
+        query = query.order_by(TriPoint.trip_date.asc(), TriPoint.id.asc())
+        if limit:
+            query = query.limit(limit)
+        return query.yield_per(chunk_size)
+
+    @staticmethod
+    def downsample(user_id, older_than, bucket_seconds=60, start=None):
+        """Thin a user's raw points before older_than to one per bucket_seconds.
+
+        Keeps the latest point of each bucket, and any point with a dwell (a
+        parked stretch), and deletes the rest. Kept points retain their
+        stored odometer, so odometer deltas still cover the whole drive, but
+        the straight line between two of them is shorter than the road:
+        statistics rebuilt from the rows measure steps with
+        geo.stored_steps_km. The deleted points are taken out of the heatmap
+        counts and UserTripStats.point_count. start optionally bounds the
+        range from below so callers can work in chunks. Idempotent. Returns
+        the number of deleted points; the caller commits.
+        """
+        from app.cache import admin_stats
+
+        in_range = [TriPoint.user_id == user_id, TriPoint.trip_date < older_than]
+        if start is not None:
+            in_range.append(TriPoint.trip_date >= start)
+        ranked = db.session.query(
+            TriPoint.id,
+            TriPoint.dwell_until,
+            db.func.row_number().over(
+                partition_by=time_bucket(TriPoint.trip_date, bucket_seconds),
+                order_by=(TriPoint.trip_date.desc(), TriPoint.id.desc())
+            ).label('rank')
+        ).filter(*in_range).subquery()
+        redundant = db.select(ranked.c.id).where(ranked.c.rank > 1, ranked.c.dwell_until.is_(None))
+
+        cell = db.func.substr(TriPoint.geohash, 1, max(HeatmapCell.PRECISIONS))
+        removed_cells = db.session.query(cell, db.func.count()).filter(
+            TriPoint.id.in_(redundant), TriPoint.geohash.is_not(None)
+        ).group_by(cell).all()
+        deleted = db.session.execute(
+            db.delete(TriPoint).where(TriPoint.id.in_(redundant)).execution_options(synchronize_session=False)
+        ).rowcount
+        if deleted:
+            admin_stats.record_bulk(db.session, TriPoint.__tablename__, -deleted)
+            HeatmapCell.add_counts(user_id, {geohash: -count for geohash, count in removed_cells})
+            UserTripStats.query.filter_by(user_id=user_id).update(
+                {UserTripStats.point_count: UserTripStats.point_count - deleted}, synchronize_session=False
+            )
+            UserDataVersion.bump(user_id, points=True)
+        return deleted
+
+    @staticmethod
+    def make_cursor(row):
+        """Opaque keyset position after row, for iter_track(after=...)"""
+        return f"{row.trip_date.isoformat()}_{row.id}"
+
+    @staticmethod
+    def parse_cursor(cursor):
+        """(trip_date, id) of a make_cursor string, None if empty; ValueError if malformed"""
+        if not cursor:
+            return None
+        trip_date, _, point_id = cursor.rpartition('_')
+        return datetime.fromisoformat(trip_date), int(point_id)
+
+    @staticmethod
+    def step_km(prev_lat, prev_lon, lat, lon):
+        """Odometer increment between two consecutive fixes"""
+        incremental_km = geo.haversine_km(prev_lat, prev_lon, lat, lon)
+        # Treat tiny GPS jitter as zero movement
+        return incremental_km if incremental_km >= TriPoint.JITTER_KM else 0.0
+
+    @staticmethod
+    def chain_rows(user_id, points, last_point=None):
+        """Insert rows for an ordered list of point dicts, continuing last_point's odometer.
+
+        Each point needs lat, lon and trip_date; accuracy and dwell_until are optional. The
+        odometer chain is computed in memory, so a whole batch needs only the
+        one query for last_point.
+        """
+        if not points:
+            return []
+        lats = [point['lat'] for point in points]
+        lons = [point['lon'] for point in points]
+        if last_point:
+            odometers = geo.chain_odometer(last_point.odometer_km or 0.0, [last_point.lat] + lats,
+                                           [last_point.lon] + lons, TriPoint.JITTER_KM)
+        else:
+            odometers = [0.0] + geo.chain_odometer(0.0, lats, lons, TriPoint.JITTER_KM)
+        return [{
+            'user_id': user_id,
+            'lat': point['lat'],
+            'lon': point['lon'],
+            'accuracy': point.get('accuracy'),
+            'trip_date': point['trip_date'],
+            'dwell_until': point.get('dwell_until'),
+            'odometer_km': odometer_km,
+        } for point, odometer_km in zip(points, odometers)]
+
+    @staticmethod
+    def bulk_insert(user_id, points, last_point=None, anchor_dwell_until=None):
+        """Append an ordered batch of points in one multi-row INSERT (caller commits).
+
+        last_point is the user's latest fix (taken from the last-point cache
+        when omitted). Points marked stored=False by the ingest filters get
+        no row but still count towards trip statistics, and
+        anchor_dwell_until extends the dwell of the latest stored row. Returns
+        the inserted row dicts; the last one carries the new odometer, and a
+        single row (one posted fix) also its id.
+        """
+        from app.cache import admin_stats, last_points
+
+        if last_point is None:
+            last_point = last_points.get(user_id)
+        if not points:
+            return []
+        rows = TriPoint.chain_rows(user_id, [p for p in points if p.get('stored', True)], last_point)
+        if anchor_dwell_until is not None:
+            TriPoint.extend_dwell(user_id, anchor_dwell_until)
+        if rows:
+            if len(rows) == 1:
+                # A single fix is inserted on its own so that its id is known
+                rows[0]['id'] = db.session.execute(db.insert(TriPoint).values(rows[0])).inserted_primary_key[0]
+            else:
+                db.session.execute(db.insert(TriPoint), rows)
+            # The Core insert bypasses the ORM hooks that keep admin counts current
+            admin_stats.record_bulk(db.session, TriPoint.__tablename__, len(rows))
+            TankState.record_gps_odometer(user_id, rows[-1]['odometer_km'])
+            HeatmapCell.record_points(user_id, rows)
+        UserTripStats.record_points(user_id, last_point, points)
+        Trip.record_points(user_id, last_point, points)
+        FillUpInterval.record_points(user_id, last_point, points)
+
+        # Folded fixes sit at the stored fix before them, with its odometer
+        odometer_km = (last_point.odometer_km or 0.0) if last_point else 0.0
+        stored = iter(rows)
+        latest = None
+        for point in points:
+            if point.get('stored', True):
+                odometer_km = next(stored)['odometer_km']
+            trip_date = point['trip_date'].replace(tzinfo=None)
+            if latest is None or trip_date >= latest[3]:
+                latest = (point['lat'], point['lon'], odometer_km, trip_date)
+        last_points.remember(db.session, user_id, *latest)
+        return rows
     
 
 class Vehicle(db.Model):
@@ -57,12 +361,113 @@ class Vehicle(db.Model):
     
     @staticmethod
     def get_current_vehicle(user_id):
-        """Get the current vehicle settings, create default if none exists"""
-        vehicle = Vehicle.query.filter_by(user_id=user_id).first()
-        if not vehicle:
-            vehicle = Vehicle(user_id=user_id)
-            db.session.add(vehicle)
-            db.session.commit()
+        """Get the current vehicle settings of a user.
+
+        Read-only: the default vehicle is created at registration (or by the
+        default-vehicle migration), and a user without one gets an unsaved
+        default that vehicle_settings persists on save. Cached on flask.g so
+        a request resolves each user's vehicle once.
+        """
+        cache = g.setdefault('_vehicles', {}) if has_app_context() else {}
+        if user_id not in cache:
+            vehicle = Vehicle.query.filter_by(user_id=user_id).first()
+            cache[user_id] = vehicle or Vehicle.new_default(user_id)
+        return cache[user_id]
+
+    @staticmethod
+    def fleet_totals_query(fuel_type=None):
+        """Per-vehicle fill-up aggregates, grouped in SQL (one row per vehicle).
+
+        Columns: vehicle, total_fillups, total_spent, total_liters,
+        average_price_per_liter, efficiency_distance_km, efficiency_fuel_liters.
+        The last two use the stored distance_since_prev_km column with the
+        get_average_efficiency pairing.
+        """
+        counted = FillUp.distance_since_prev_km > 0
+        query = db.session.query(
+            Vehicle,
+            db.func.count(FillUp.id).label('total_fillups'),
+            db.func.coalesce(db.func.sum(FillUp.total_cost), 0.0).label('total_spent'),
+            db.func.coalesce(db.func.sum(FillUp.fuel_liters), 0.0).label('total_liters'),
+            db.func.avg(FillUp.price_per_liter).label('average_price_per_liter'),
+            db.func.sum(db.case((counted, FillUp.distance_since_prev_km), else_=0.0)).label('efficiency_distance_km'),
+            db.func.sum(db.case((counted, FillUp.fuel_liters), else_=0.0)).label('efficiency_fuel_liters'),
+        ).outerjoin(FillUp, FillUp.user_id == Vehicle.user_id).group_by(Vehicle.id)
+        if fuel_type:
+            query = query.filter(Vehicle.fuel_type == fuel_type)
+        return query
+
+    @staticmethod
+    def get_fleet_page(fuel_type=None, page=1, per_page=20):
+        """One page of per-vehicle statistics as dicts, plus the pagination object"""
+        pagination = Vehicle.fleet_totals_query(fuel_type).order_by(Vehicle.id).paginate(
+            page=page, per_page=per_page, error_out=False
+        )
+        rows = []
+        for vehicle, fillups, spent, liters, avg_price, eff_distance, eff_fuel in pagination.items:
+            rows.append({
+                'user_id': vehicle.user_id,
+                'vehicle_id': vehicle.id,
+                'name': vehicle.name,
+                'fuel_type': vehicle.fuel_type,
+                'tank_capacity': vehicle.tank_capacity_liters,
+                'total_fillups': fillups,
+                'total_spent': spent,
+                'total_liters': liters,
+                'average_cost': (spent / fillups) if fillups else 0,
+                'average_price_per_liter': avg_price or 0,
+                'average_efficiency': (eff_fuel / eff_distance) * 100 if eff_distance else None,
+            })
+        return rows, pagination
+
+    @staticmethod
+    def get_fuel_type_totals():
+        """Totals and averages per fuel type, aggregated over the per-vehicle rows in SQL.
+
+        Average price is the sum of per-vehicle average prices over all vehicles
+        of the type; average efficiency is the mean of per-vehicle averages.
+        """
+        per_vehicle = Vehicle.fleet_totals_query().with_entities(
+            Vehicle.fuel_type.label('fuel_type'),
+            db.func.count(FillUp.id).label('total_fillups'),
+            db.func.coalesce(db.func.sum(FillUp.total_cost), 0.0).label('total_spent'),
+            db.func.coalesce(db.func.sum(FillUp.fuel_liters), 0.0).label('total_liters'),
+            db.func.coalesce(db.func.avg(FillUp.price_per_liter), 0.0).label('average_price_per_liter'),
+            (db.func.sum(db.case((FillUp.distance_since_prev_km > 0, FillUp.fuel_liters), else_=0.0))
+             / db.func.nullif(db.func.sum(db.case((FillUp.distance_since_prev_km > 0, FillUp.distance_since_prev_km), else_=0.0)), 0)
+             * 100).label('average_efficiency'),
+        ).subquery()
+
+        rows = db.session.query(
+            per_vehicle.c.fuel_type,
+            db.func.count().label('total_vehicles'),
+            db.func.sum(per_vehicle.c.total_fillups),
+            db.func.sum(per_vehicle.c.total_spent),
+            db.func.sum(per_vehicle.c.total_liters),
+            db.func.sum(per_vehicle.c.average_price_per_liter) / db.func.count(),
+            db.func.avg(per_vehicle.c.average_efficiency),
+        ).group_by(per_vehicle.c.fuel_type).order_by(per_vehicle.c.fuel_type).all()
+
+        return [
+            {
+                'fuel_type': fuel_type,
+                'total_vehicles': vehicles,
+                'total_fillups': fillups,
+                'total_spent': spent,
+                'total_liters': liters,
+                'average_price_per_liter': avg_price or 0,
+                'average_efficiency': avg_efficiency or 0,
+            }
+            for fuel_type, vehicles, fillups, spent, liters, avg_price, avg_efficiency in rows
+        ]
+
+    @staticmethod
+    def new_default(user_id):
+        """Unsaved vehicle with the column defaults filled in"""
+        vehicle = Vehicle(user_id=user_id)
+        for column in ('name', 'tank_capacity_liters', 'fuel_type', 'updated_at'):
+            default = Vehicle.__table__.c[column].default.arg
+            setattr(vehicle, column, default(None) if callable(default) else default)
         return vehicle
 
 
@@ -76,8 +481,8 @@ class User(UserMixin, db.Model):
     password_hash = db.Column(db.String(256), nullable=False)
     # Admin role
     is_admin = db.Column(db.Boolean, nullable=False, default=False)
-    # Optional created_at
-    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # Optional created_at (indexed for the admin "recent users" list)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
 
     def set_password(self, password: str):
         self.password_hash = generate_password_hash(password)
@@ -118,12 +523,28 @@ class FillUp(db.Model):
     
     # Optional notes
     notes = db.Column(db.Text)
+
+    # Stored efficiency (L/100km) of the interval ending at this fill-up.
+    # Kept in sync by refresh_stored_efficiency / refresh_all_stored_efficiency.
+    efficiency_l_per_100km = db.Column(db.Float)
+
+    # Distance from the immediately preceding fill-up by odometer (0 for equal odometers)
+    distance_since_prev_km = db.Column(db.Float)
+
+    __table_args__ = (
+        # Per-user history in odometer order (efficiency, latest fill-up)
+        db.Index('ix_fill_up_user_id_odometer_km', 'user_id', 'odometer_km'),
+        # Per-user history in date order (charts, range predictor, motor hours)
+        db.Index('ix_fill_up_user_id_date', 'user_id', 'date'),
+        # Fleet-wide newest first (admin dashboard and fill-up list)
+        db.Index('ix_fill_up_date', 'date'),
+    )
     
     def __repr__(self):
         """How this object appears when printed (helpful for debugging)"""
         return f'<FillUp {self.date.strftime("%Y-%m-%d")}: {self.fuel_liters}L>'
     
-    def calculate_efficiency(self):
+    def calculate_efficiency(self, vehicle=None):
         """Calculate fuel efficiency (L/100km) since previous fill-up.
 
         Uses a more robust method that considers tank levels:
@@ -141,13 +562,20 @@ class FillUp(db.Model):
         if not previous_fillup:
             return None
 
-        distance = self.odometer_km - previous_fillup.odometer_km
+        vehicle = vehicle or Vehicle.get_current_vehicle(self.user_id)
+        return FillUp.interval_efficiency(previous_fillup, self, vehicle.tank_capacity_liters)
+
+    @staticmethod
+    def interval_efficiency(previous_fillup, fillup, tank_capacity):
+        """Efficiency (L/100km) of the interval between two fill-ups, or None.
+
+        Shared by calculate_efficiency and walk_intervals so both apply the
+        same tank-level rules.
+        """
+        distance = fillup.odometer_km - previous_fillup.odometer_km
         if distance <= 0:
             return None
 
-        vehicle = Vehicle.get_current_vehicle(self.user_id)
-        tank_capacity = vehicle.tank_capacity_liters
-
         # Determine tank level right after previous fill
         tank_after_prev = None
         if getattr(previous_fillup, 'is_full_tank', False):
@@ -159,29 +587,130 @@ class FillUp(db.Model):
             )
 
         # Determine tank level right before current fill
-        if getattr(self, 'fuel_before_fillup', None) is not None:
-            fuel_before_current = max(self.fuel_before_fillup, 0.0)
+        if getattr(fillup, 'fuel_before_fillup', None) is not None:
+            fuel_before_current = max(fillup.fuel_before_fillup, 0.0)
         else:
             fuel_before_current = None
 
         consumed_liters = None
         if tank_after_prev is not None and fuel_before_current is not None and tank_after_prev >= fuel_before_current:
             consumed_liters = tank_after_prev - fuel_before_current
-        elif getattr(self, 'is_full_tank', False) and getattr(previous_fillup, 'is_full_tank', False):
+        elif getattr(fillup, 'is_full_tank', False) and getattr(previous_fillup, 'is_full_tank', False):
             # Classic method when both fills are full: fuel added now ~= fuel consumed since last
-            consumed_liters = max(self.fuel_liters, 0.0)
+            consumed_liters = max(fillup.fuel_liters, 0.0)
 
         if consumed_liters and consumed_liters > 0:
             return (consumed_liters / distance) * 100.0
         return None
+
+    @staticmethod
+    def walk_intervals(fillups, tank_capacity):
+        """Yield (fillup, efficiency, distance_since_prev_km) in odometer order.
+
+        Each fill-up is paired with the last fill-up at a strictly lower
+        odometer, which is the row calculate_efficiency would query for.
+        The distance is measured from the immediately preceding row, the
+        same pairing get_average_efficiency has always used.
+        """
+        ordered = sorted(fillups, key=lambda f: (f.odometer_km, f.id or 0))
+        previous_fillup = None
+        last_seen = None
+        for fillup in ordered:
+            if last_seen is not None and fillup.odometer_km > last_seen.odometer_km:
+                previous_fillup = last_seen
+            if previous_fillup is not None:
+                efficiency = FillUp.interval_efficiency(previous_fillup, fillup, tank_capacity)
+            else:
+                efficiency = None
+            distance = fillup.odometer_km - last_seen.odometer_km if last_seen is not None else None
+            yield fillup, efficiency, distance
+            last_seen = fillup
+
+    @staticmethod
+    def refresh_stored_efficiency(user_id, odometer_km, tank_capacity):
+        """Recompute the stored columns of the rows affected by a write at odometer_km.
+
+        Only the rows at odometer_km and at the next higher odometer can change
+        when a fill-up is inserted or deleted there. Call after flushing the
+        write; the caller commits.
+
+        Returns (distance_delta, efficiency_fuel_delta): how much the rows'
+        contribution to UserFuelStats changed.
+        """
+        previous_fillup = FillUp.query.filter(
+            FillUp.user_id == user_id, FillUp.odometer_km < odometer_km
+        ).order_by(FillUp.odometer_km.desc(), FillUp.id.desc()).first()
+        next_odometer = db.session.query(db.func.min(FillUp.odometer_km)).filter(
+            FillUp.user_id == user_id, FillUp.odometer_km > odometer_km
+        ).scalar()
+
+        affected = FillUp.query.filter(
+            FillUp.user_id == user_id,
+            FillUp.odometer_km >= odometer_km,
+            FillUp.odometer_km <= (next_odometer if next_odometer is not None else odometer_km)
+        ).all()
+
+        distance_delta = 0.0
+        efficiency_fuel_delta = 0.0
+        window = affected + ([previous_fillup] if previous_fillup else [])
+        for fillup, efficiency, distance in FillUp.walk_intervals(window, tank_capacity):
+            if fillup is previous_fillup:
+                continue
+            old_distance, old_fuel = UserFuelStats.interval_contribution(fillup.distance_since_prev_km, fillup.fuel_liters)
+            new_distance, new_fuel = UserFuelStats.interval_contribution(distance, fillup.fuel_liters)
+            distance_delta += new_distance - old_distance
+            efficiency_fuel_delta += new_fuel - old_fuel
+            fillup.efficiency_l_per_100km = efficiency
+            fillup.distance_since_prev_km = distance
+        return distance_delta, efficiency_fuel_delta
+
+    @staticmethod
+    def refresh_all_stored_efficiency(user_id, tank_capacity, chunk_size=1000, commit=False):
+        """Recompute the stored columns of every fill-up of a user in chunks.
+
+        Rows are read with keyset paging on (odometer_km, id); the last two rows
+        of each chunk are carried over so intervals spanning a chunk boundary
+        are paired correctly. Returns the number of rows updated.
+        """
+        carry = []
+        updated = 0
+        last_key = None
+        while True:
+            query = FillUp.query.filter(FillUp.user_id == user_id)
+            if last_key is not None:
+                query = query.filter(db.or_(
+                    FillUp.odometer_km > last_key[0],
+                    db.and_(FillUp.odometer_km == last_key[0], FillUp.id > last_key[1])
+                ))
+            chunk = query.order_by(FillUp.odometer_km, FillUp.id).limit(chunk_size).all()
+            if not chunk:
+                break
+
+            for fillup, efficiency, distance in FillUp.walk_intervals(carry + chunk, tank_capacity):
+                if fillup in carry:
+                    continue
+                fillup.efficiency_l_per_100km = efficiency
+                fillup.distance_since_prev_km = distance
+            updated += len(chunk)
+
+            # The pairing only ever looks back at the last row of the previous
+            # odometer group and the immediately preceding row
+            last = chunk[-1]
+            lower = [f for f in carry + chunk if f.odometer_km < last.odometer_km]
+            carry = ([lower[-1]] if lower else []) + [last]
+            last_key = (last.odometer_km, last.id)
+
+            if commit:
+                db.session.commit()
+        return updated
     
-    def get_remaining_fuel(self):
+    def get_remaining_fuel(self, vehicle=None):
         """Calculate remaining fuel for this specific fill-up.
         
         For historical fill-ups: returns the fuel level right after this fill-up
         For the latest fill-up: returns the fuel level right after this fill-up (current status calculated separately)
         """
-        vehicle = Vehicle.get_current_vehicle(self.user_id)
+        vehicle = vehicle or Vehicle.get_current_vehicle(self.user_id)
         tank_capacity = vehicle.tank_capacity_liters
         
         # Calculate what the fuel level was right after this fill-up
@@ -191,9 +720,9 @@ class FillUp(db.Model):
             fuel_before = getattr(self, 'fuel_before_fillup', 0.0) or 0.0
             return min(fuel_before + self.fuel_liters, tank_capacity)
     
-    def get_fuel_after_fillup(self):
+    def get_fuel_after_fillup(self, vehicle=None):
         """Get the fuel level immediately after this fill-up"""
-        vehicle = Vehicle.get_current_vehicle(self.user_id)
+        vehicle = vehicle or Vehicle.get_current_vehicle(self.user_id)
         tank_capacity = vehicle.tank_capacity_liters
         
         if getattr(self, 'is_full_tank', False):
@@ -202,20 +731,58 @@ class FillUp(db.Model):
             fuel_before = getattr(self, 'fuel_before_fillup', 0.0) or 0.0
             return min(fuel_before + self.fuel_liters, tank_capacity)
     
-    def predict_range(self):
+    def predict_range(self, vehicle=None):
         """Predict driving range based on current fuel and efficiency"""
-        efficiency = self.calculate_efficiency()
+        efficiency = self.calculate_efficiency(vehicle)
         if not efficiency:
             return None
         
         # Get remaining fuel
-        remaining_fuel = self.get_remaining_fuel()
+        remaining_fuel = self.get_remaining_fuel(vehicle)
         if remaining_fuel <= 0:
             return 0
         
         # Calculate range: (remaining fuel ÷ efficiency) × 100
         return (remaining_fuel / efficiency) * 100
     
+    @staticmethod
+    def get_monthly_totals(user_id):
+        """Spending, volume and average stored efficiency per month, grouped in SQL.
+
+        Returns a list of {'month', 'spent', 'liters', 'efficiency'} dicts in
+        month order, one per month with fill-ups.
+        """
+        bucket = month_bucket(FillUp.date).label('month')
+        rows = db.session.query(
+            bucket,
+            db.func.sum(FillUp.total_cost),
+            db.func.sum(FillUp.fuel_liters),
+            db.func.avg(FillUp.efficiency_l_per_100km)
+        ).filter(FillUp.user_id == user_id).group_by(bucket).order_by(bucket).all()
+        return [
+            {'month': month_key(month), 'spent': spent, 'liters': liters, 'efficiency': efficiency}
+            for month, spent, liters, efficiency in rows
+        ]
+
+    @staticmethod
+    def get_chart_summary(user_id):
+        """Fill-up count, best/worst stored efficiency, average price and distance in one query"""
+        count, best, worst, avg_price, min_odometer, max_odometer = db.session.query(
+            db.func.count(FillUp.id),
+            db.func.min(FillUp.efficiency_l_per_100km),
+            db.func.max(FillUp.efficiency_l_per_100km),
+            db.func.avg(FillUp.price_per_liter),
+            db.func.min(FillUp.odometer_km),
+            db.func.max(FillUp.odometer_km)
+        ).filter(FillUp.user_id == user_id).one()
+        return {
+            'fillup_count': count,
+            'best_efficiency': best or 0,
+            'worst_efficiency': worst or 0,
+            'avg_price': avg_price or 0,
+            'total_distance': (max_odometer - min_odometer) if count > 1 else 0,
+        }
+
     @staticmethod
     def get_total_spent(user_id):
         """Calculate total amount spent on fuel"""
@@ -224,116 +791,37 @@ class FillUp(db.Model):
     
     @staticmethod
     def get_average_efficiency(user_id):
-        """Calculate average fuel efficiency across all fill-ups"""
-        fillups = FillUp.query.filter_by(user_id=user_id).order_by(FillUp.odometer_km).all()
-        
-        if len(fillups) < 2:
-            return None
-            
-        total_distance = 0
-        total_fuel = 0
-        
-        for i in range(1, len(fillups)):
-            distance = fillups[i].odometer_km - fillups[i-1].odometer_km
-            fuel = fillups[i].fuel_liters
-            
-            if distance > 0:  # Valid distance
-                total_distance += distance
-                total_fuel += fuel
-        
-        if total_distance > 0:
+        """Calculate average fuel efficiency across all fill-ups
+
+        Reads the UserFuelStats snapshot when there is one. Otherwise sums the
+        stored distance_since_prev_km column, so it relies on the stored
+        columns being populated (see the backfill-efficiency command).
+        """
+        stats = db.session.get(UserFuelStats, user_id)
+        if stats is not None:
+            return stats.average_efficiency
+
+        total_distance, total_fuel = db.session.query(
+            db.func.sum(FillUp.distance_since_prev_km),
+            db.func.sum(FillUp.fuel_liters)
+        ).filter(FillUp.user_id == user_id, FillUp.distance_since_prev_km > 0).one()
+
+        if total_distance:
             return (total_fuel / total_distance) * 100  # L/100km
         return None
     
     @staticmethod
-    def get_current_fuel_status(user_id):
-        """Get current fuel status and predictions"""
-        # Get all fill-ups ordered by odometer (oldest first)
-        fillups = FillUp.query.filter_by(user_id=user_id).order_by(FillUp.odometer_km.asc()).all()
-        
-        if not fillups:
-            return None
-        
-        vehicle = Vehicle.get_current_vehicle(user_id)
-        efficiency = FillUp.get_average_efficiency(user_id)
-        
-        if not efficiency:
+    def get_current_fuel_status(user_id, vehicle=None):
+        """Get current fuel status and predictions
+
+        Reads the stored TankState, so the cost does not grow with the
+        number of fill-ups or GPS points.
+        """
+        vehicle = vehicle or Vehicle.get_current_vehicle(user_id)
+        state = TankState.get_state(user_id, vehicle)
+        if state is None:
             return None
-        
-        # Get the latest fill-up
-        latest_fillup = fillups[-1]
-        
-        # Calculate the TOTAL fuel in the tank right now
-        # Start with the fuel level after the latest fill-up
-        if getattr(latest_fillup, 'is_full_tank', False):
-            current_fuel = vehicle.tank_capacity_liters
-        else:
-            fuel_before = getattr(latest_fillup, 'fuel_before_fillup', 0.0) or 0.0
-            current_fuel = min(fuel_before + latest_fillup.fuel_liters, vehicle.tank_capacity_liters)
-        
-        # Now we need to subtract ALL fuel consumed since the latest fill-up
-        # Get current odometer reading (either from GPS or use the latest fill-up as reference)
-        current_odometer = FillUp.get_current_odometer_from_gps(user_id)
-        
-        if current_odometer and current_odometer > latest_fillup.odometer_km:
-            # We have real distance data - calculate actual consumption since last fill-up
-            distance_driven = current_odometer - latest_fillup.odometer_km
-            fuel_consumed = (efficiency / 100.0) * distance_driven
-            
-            # Calculate remaining fuel: fuel after fill-up MINUS fuel consumed since then
-            remaining_fuel = max(0.0, current_fuel - fuel_consumed)
-            
-            # Store the calculation details
-            distance_driven_actual = distance_driven
-            fuel_consumed_actual = fuel_consumed
-            days_since_fillup = (date.today() - latest_fillup.date.date()).days
-            estimated_daily_consumption = None
-            
-        else:
-            # No GPS data - estimate based on time since last fill-up
-            days_since_fillup = (date.today() - latest_fillup.date.date()).days
-            
-            if days_since_fillup > 0:
-                # Estimate daily fuel consumption based on average efficiency
-                # Assume average daily driving of 30km (adjust as needed)
-                estimated_daily_distance = 30  # km per day
-                estimated_daily_consumption = (efficiency / 100.0) * estimated_daily_distance
-                estimated_total_consumption = estimated_daily_consumption * days_since_fillup
-                
-                # Calculate remaining fuel: fuel after fill-up MINUS estimated consumption
-                remaining_fuel = max(0.0, current_fuel - estimated_total_consumption)
-                
-                # Store the calculation details
-                distance_driven_actual = None
-                fuel_consumed_actual = estimated_total_consumption
-                
-            else:
-                # Fill-up was today, so use the fuel level after fill-up
-                remaining_fuel = current_fuel
-                distance_driven_actual = None
-                fuel_consumed_actual = 0.0
-                estimated_daily_consumption = 0.0
-        
-        fuel_percentage = (remaining_fuel / vehicle.tank_capacity_liters) * 100
-        
-        # Calculate predicted range
-        predicted_range = (remaining_fuel / efficiency) * 100
-        
-        return {
-            'remaining_fuel': remaining_fuel,
-            'fuel_percentage': fuel_percentage,
-            'tank_capacity': vehicle.tank_capacity_liters,
-            'predicted_range': predicted_range,
-            'efficiency': efficiency,
-            'last_fillup_date': latest_fillup.date,
-            'last_odometer': latest_fillup.odometer_km,
-            'current_odometer': current_odometer,
-            'distance_driven': distance_driven_actual,
-            'fuel_consumed_since_last_fillup': fuel_consumed_actual,
-            'fuel_after_last_fillup': current_fuel,
-            'days_since_fillup': days_since_fillup,
-            'estimated_daily_consumption': estimated_daily_consumption
-        }
+        return state.fuel_status(vehicle.tank_capacity_liters)
     
     @staticmethod
     def get_current_odometer_from_gps(user_id):
@@ -350,9 +838,1277 @@ class FillUp(db.Model):
         return None
     
     @staticmethod
-    def get_current_fuel_level(user_id):
+    def get_current_fuel_level(user_id, vehicle=None):
         """Get the current fuel level in the tank based on the latest fill-up and estimated consumption"""
-        fuel_status = FillUp.get_current_fuel_status(user_id)
+        fuel_status = FillUp.get_current_fuel_status(user_id, vehicle)
         if fuel_status:
             return fuel_status['remaining_fuel']
-        return 0.0
\ No newline at end of file
+        return 0.0
+
+
+class UserFuelStats(db.Model):
+    """Хэрэглэгч бүрийн цэнэглэлтийн нэгтгэсэн статистик (нүүр хуудсанд уншина)"""
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+
+    fillup_count = db.Column(db.Integer, nullable=False, default=0)
+    total_spent = db.Column(db.Float, nullable=False, default=0.0)
+    total_liters = db.Column(db.Float, nullable=False, default=0.0)
+
+    # Sum of positive distance_since_prev_km, i.e. last minus first odometer
+    total_distance_km = db.Column(db.Float, nullable=False, default=0.0)
+
+    # Fuel of the fill-ups that close a positive-distance interval
+    efficiency_fuel_liters = db.Column(db.Float, nullable=False, default=0.0)
+
+    # Lowest stored efficiency (L/100km) of any fill-up, the motor-hour baseline
+    best_efficiency_l_per_100km = db.Column(db.Float)
+
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    user = db.relationship('User', backref=db.backref('fuel_stats', uselist=False))
+
+    SUMMED_COLUMNS = ('fillup_count', 'total_spent', 'total_liters', 'total_distance_km', 'efficiency_fuel_liters')
+
+    def __repr__(self):
+        return f'<UserFuelStats user={self.user_id}: {self.fillup_count} fill-ups>'
+
+    @property
+    def average_efficiency(self):
+        """Running average efficiency (L/100km), same formula as get_average_efficiency"""
+        if self.total_distance_km and self.total_distance_km > 0:
+            return (self.efficiency_fuel_liters / self.total_distance_km) * 100
+        return None
+
+    @staticmethod
+    def interval_contribution(distance_since_prev_km, fuel_liters):
+        """(distance, fuel) a fill-up adds to the efficiency totals"""
+        if distance_since_prev_km and distance_since_prev_km > 0:
+            return distance_since_prev_km, fuel_liters
+        return 0.0, 0.0
+
+    @staticmethod
+    def record_fillup(fillup, interval_delta, removed=False):
+        """Apply an inserted or deleted fill-up to its user's snapshot.
+
+        interval_delta is the value returned by FillUp.refresh_stored_efficiency
+        for the same write. The update is a single UPDATE with relative
+        increments so it commits atomically with the fill-up itself. Call
+        after the write is flushed; the caller commits.
+        """
+        sign = -1 if removed else 1
+        distance_delta, efficiency_fuel_delta = interval_delta
+        if removed:
+            # The deleted row no longer contributes its own interval
+            own_distance, own_fuel = UserFuelStats.interval_contribution(fillup.distance_since_prev_km, fillup.fuel_liters)
+            distance_delta -= own_distance
+            efficiency_fuel_delta -= own_fuel
+
+        updated = UserFuelStats.query.filter_by(user_id=fillup.user_id).update({
+            UserFuelStats.fillup_count: UserFuelStats.fillup_count + sign,
+            UserFuelStats.total_spent: UserFuelStats.total_spent + sign * fillup.total_cost,
+            UserFuelStats.total_liters: UserFuelStats.total_liters + sign * fillup.fuel_liters,
+            UserFuelStats.total_distance_km: UserFuelStats.total_distance_km + distance_delta,
+            UserFuelStats.efficiency_fuel_liters: UserFuelStats.efficiency_fuel_liters + efficiency_fuel_delta,
+            UserFuelStats.updated_at: datetime.utcnow(),
+        }, synchronize_session='fetch')
+
+        if not updated:
+            # First write since the snapshot table was introduced: build it from
+            # the rows, which already include this (flushed) write
+            UserFuelStats.rebuild(fillup.user_id)
+            return
+
+        later = db.session.query(FillUp.id).filter(
+            FillUp.user_id == fillup.user_id, FillUp.odometer_km > fillup.odometer_km
+        ).first()
+        if removed or later is not None:
+            # The write re-paired a neighbour, whose efficiency may have risen
+            # above the old minimum
+            UserFuelStats.refresh_best_efficiency(fillup.user_id)
+        elif fillup.efficiency_l_per_100km is not None:
+            # Appended at the top odometer: only its own efficiency is new
+            efficiency = fillup.efficiency_l_per_100km
+            UserFuelStats.query.filter_by(user_id=fillup.user_id).update({
+                UserFuelStats.best_efficiency_l_per_100km: db.case(
+                    (UserFuelStats.best_efficiency_l_per_100km.is_(None), efficiency),
+                    (UserFuelStats.best_efficiency_l_per_100km > efficiency, efficiency),
+                    else_=UserFuelStats.best_efficiency_l_per_100km
+                ),
+            }, synchronize_session='fetch')
+
+    @staticmethod
+    def best_efficiency_query(user_id):
+        return db.session.query(db.func.min(FillUp.efficiency_l_per_100km)).filter(FillUp.user_id == user_id)
+
+    @staticmethod
+    def refresh_best_efficiency(user_id):
+        """Recompute the stored minimum from the fill-ups' stored efficiencies. The caller commits."""
+        UserFuelStats.query.filter_by(user_id=user_id).update({
+            UserFuelStats.best_efficiency_l_per_100km: UserFuelStats.best_efficiency_query(user_id).scalar_subquery(),
+        }, synchronize_session='fetch')
+
+    @staticmethod
+    def get_snapshot(user_id):
+        """The stored snapshot, or an unsaved one computed from raw rows if missing"""
+        stats = db.session.get(UserFuelStats, user_id)
+        if stats is None:
+            stats = UserFuelStats(user_id=user_id, **UserFuelStats.compute(user_id))
+        return stats
+
+    @staticmethod
+    def compute(user_id):
+        """Snapshot values computed from the raw FillUp rows of a user"""
+        rows = db.session.query(
+            FillUp.odometer_km, FillUp.fuel_liters, FillUp.total_cost
+        ).filter_by(user_id=user_id).order_by(FillUp.odometer_km, FillUp.id)
+
+        values = dict.fromkeys(UserFuelStats.SUMMED_COLUMNS, 0.0)
+        values['fillup_count'] = 0
+        previous_odometer = None
+        for odometer_km, fuel_liters, total_cost in rows:
+            values['fillup_count'] += 1
+            values['total_spent'] += total_cost
+            values['total_liters'] += fuel_liters
+            if previous_odometer is not None:
+                distance, fuel = UserFuelStats.interval_contribution(odometer_km - previous_odometer, fuel_liters)
+                values['total_distance_km'] += distance
+                values['efficiency_fuel_liters'] += fuel
+            previous_odometer = odometer_km
+        values['best_efficiency_l_per_100km'] = UserFuelStats.best_efficiency_query(user_id).scalar()
+        return values
+
+    @staticmethod
+    def rebuild(user_id):
+        """Recompute a user's snapshot from raw rows.
+
+        Returns {column: (stored, computed)} for every column that drifted;
+        a missing snapshot counts as stored zeros. The caller commits.
+        """
+        values = UserFuelStats.compute(user_id)
+        stats = db.session.get(UserFuelStats, user_id)
+        if stats is None:
+            stats = UserFuelStats(user_id=user_id, **dict.fromkeys(UserFuelStats.SUMMED_COLUMNS, 0))
+            db.session.add(stats)
+
+        drift = {}
+        for column, computed in values.items():
+            stored = getattr(stats, column)
+            if column in UserFuelStats.SUMMED_COLUMNS:
+                stored = stored or 0
+            if stored is None or computed is None:
+                drifted = stored is not computed
+            else:
+                drifted = not math.isclose(stored, computed, rel_tol=1e-9, abs_tol=1e-6)
+            if drifted:
+                drift[column] = (stored, computed)
+            setattr(stats, column, computed)
+        stats.updated_at = datetime.utcnow()
+        return drift
+
+
+class TankState(db.Model):
+    """Машины савны сүүлийн төлөв: сүүлийн цэнэглэлтийн дараах шатахуун, одометр, хэрэглээ.
+
+    Хэрэглэгч бүр нэг машинтай тул user_id-аар хадгална.
+    """
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+
+    # Latest fill-up by odometer
+    last_fillup_id = db.Column(db.Integer, db.ForeignKey('fill_up.id', ondelete='SET NULL'))
+    last_fillup_date = db.Column(db.DateTime, nullable=False)
+    last_fillup_odometer_km = db.Column(db.Float, nullable=False)
+
+    # Fuel in the tank right after the latest fill-up (liters, capped by capacity)
+    fuel_after_fillup = db.Column(db.Float, nullable=False)
+
+    # Current efficiency estimate (L/100km), the user's average efficiency
+    efficiency_l_per_100km = db.Column(db.Float)
+
+    # Odometer of the latest GPS point
+    current_odometer_km = db.Column(db.Float)
+
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    # Loaded in the same query as the state, so reads stay a single lookup
+    calibration = db.relationship(
+        'OdometerCalibration', primaryjoin='TankState.user_id == foreign(OdometerCalibration.user_id)',
+        uselist=False, viewonly=True, lazy='joined'
+    )
+
+    # Assumed daily driving when there is no GPS distance since the last fill-up
+    ESTIMATED_DAILY_DISTANCE_KM = 30
+
+    def __repr__(self):
+        return f'<TankState user={self.user_id}: {self.fuel_after_fillup}L at {self.last_fillup_odometer_km}km>'
+
+    @staticmethod
+    def compute(user_id, vehicle):
+        """Unsaved state built from the latest fill-up and GPS point, or None without fill-ups"""
+        latest_fillup = FillUp.query.filter_by(user_id=user_id).order_by(
+            FillUp.odometer_km.desc(), FillUp.id.desc()
+        ).first()
+        if latest_fillup is None:
+            return None
+        return TankState(
+            user_id=user_id,
+            last_fillup_id=latest_fillup.id,
+            last_fillup_date=latest_fillup.date,
+            last_fillup_odometer_km=latest_fillup.odometer_km,
+            fuel_after_fillup=latest_fillup.get_fuel_after_fillup(vehicle),
+            efficiency_l_per_100km=FillUp.get_average_efficiency(user_id),
+            current_odometer_km=FillUp.get_current_odometer_from_gps(user_id),
+            updated_at=datetime.utcnow(),
+        )
+
+    @staticmethod
+    def get_state(user_id, vehicle):
+        """The stored state, or an unsaved computed one if it was never stored"""
+        state = db.session.get(TankState, user_id)
+        if state is None:
+            state = TankState.compute(user_id, vehicle)
+        return state
+
+    @staticmethod
+    def refresh(user_id, vehicle):
+        """Advance the stored state after a fill-up write or tank capacity change.
+
+        Keeps the stored GPS odometer. The caller commits.
+        """
+        computed = TankState.compute(user_id, vehicle)
+        state = db.session.get(TankState, user_id)
+        if computed is None:
+            if state is not None:
+                db.session.delete(state)
+            return None
+        if state is None:
+            db.session.add(computed)
+            return computed
+        for column in ('last_fillup_id', 'last_fillup_date', 'last_fillup_odometer_km',
+                       'fuel_after_fillup', 'efficiency_l_per_100km', 'updated_at'):
+            setattr(state, column, getattr(computed, column))
+        return state
+
+    @staticmethod
+    def record_gps_odometer(user_id, odometer_km):
+        """Advance the GPS odometer after points are ingested. The caller commits."""
+        TankState.query.filter_by(user_id=user_id).update(
+            {TankState.current_odometer_km: odometer_km}, synchronize_session='fetch'
+        )
+
+    def fuel_status(self, tank_capacity):
+        """Remaining fuel and range prediction from the stored state.
+
+        current_odometer_km is the GPS odometer; once the user has an
+        OdometerCalibration it is converted to the vehicle's odometer before
+        it is compared to the fill-up reading.
+        """
+        efficiency = self.efficiency_l_per_100km
+        if not efficiency:
+            return None
+
+        current_fuel = self.fuel_after_fillup
+        current_odometer = self.current_odometer_km
+        if self.calibration is not None and current_odometer is not None:
+            current_odometer = self.calibration.to_odometer(current_odometer)
+        days_since_fillup = (date.today() - self.last_fillup_date.date()).days
+
+        if current_odometer and current_odometer > self.last_fillup_odometer_km:
+            # We have real distance data - calculate actual consumption since last fill-up
+            distance_driven = current_odometer - self.last_fillup_odometer_km
+            fuel_consumed = (efficiency / 100.0) * distance_driven
+            remaining_fuel = max(0.0, current_fuel - fuel_consumed)
+            estimated_daily_consumption = None
+        elif days_since_fillup > 0:
+            # No GPS data - estimate based on time since last fill-up
+            distance_driven = None
+            estimated_daily_consumption = (efficiency / 100.0) * TankState.ESTIMATED_DAILY_DISTANCE_KM
+            fuel_consumed = estimated_daily_consumption * days_since_fillup
+            remaining_fuel = max(0.0, current_fuel - fuel_consumed)
+        else:
+            # Fill-up was today, so use the fuel level after fill-up
+            distance_driven = None
+            fuel_consumed = 0.0
+            estimated_daily_consumption = 0.0
+            remaining_fuel = current_fuel
+
+        return {
+            'remaining_fuel': remaining_fuel,
+            'fuel_percentage': (remaining_fuel / tank_capacity) * 100,
+            'tank_capacity': tank_capacity,
+            'predicted_range': (remaining_fuel / efficiency) * 100,
+            'efficiency': efficiency,
+            'last_fillup_date': self.last_fillup_date,
+            'last_odometer': self.last_fillup_odometer_km,
+            'current_odometer': current_odometer,
+            'distance_driven': distance_driven,
+            'fuel_consumed_since_last_fillup': fuel_consumed,
+            'fuel_after_last_fillup': current_fuel,
+            'days_since_fillup': days_since_fillup,
+            'estimated_daily_consumption': estimated_daily_consumption
+        }
+
+
+class UserTripStats(db.Model):
+    """Хэрэглэгч бүрийн GPS замын нэгтгэсэн статистик (цэг бүрийг хүлээн авахад шинэчлэгдэнэ)"""
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+
+    point_count = db.Column(db.Integer, nullable=False, default=0)
+    total_distance_km = db.Column(db.Float, nullable=False, default=0.0)
+    moving_seconds = db.Column(db.Float, nullable=False, default=0.0)
+    idle_seconds = db.Column(db.Float, nullable=False, default=0.0)
+    max_speed_kmh = db.Column(db.Float, nullable=False, default=0.0)
+
+    # Average speed is speed_sum_kmh / moving_segments
+    speed_sum_kmh = db.Column(db.Float, nullable=False, default=0.0)
+    moving_segments = db.Column(db.Integer, nullable=False, default=0)
+
+    last_point_date = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    user = db.relationship('User', backref=db.backref('trip_stats', uselist=False))
+
+    # Classification used by /api/trips/stats: steps under 5 m are GPS noise,
+    # below 2 km/h is idle, and a step that did not move is neither
+    JITTER_KM = 0.005
+    IDLE_SPEED_KMH = 2.0
+
+    SUMMED_COLUMNS = ('point_count', 'total_distance_km', 'moving_seconds', 'idle_seconds',
+                      'speed_sum_kmh', 'moving_segments')
+
+    def __repr__(self):
+        return f'<UserTripStats user={self.user_id}: {self.total_distance_km:.1f}km over {self.point_count} points>'
+
+    @property
+    def avg_speed_kmh(self):
+        return self.speed_sum_kmh / self.moving_segments if self.moving_segments else 0.0
+
+    @staticmethod
+    def summarize(lats, lons, dates, odometers=None):
+        """Movement summary of a track with the trips_stats thresholds.
+        Stored rows pass their odometers, whose steps still cover what
+        downsample-tri-points thinned out.
+        """
+        distances = geo.stored_steps_km(lats, lons, odometers) if odometers is not None else None
+        return geo.summarize_movement(lats, lons, dates, UserTripStats.JITTER_KM, UserTripStats.IDLE_SPEED_KMH,
+                                      stationary_is_idle=False, distances_km=distances)
+
+    @staticmethod
+    def record_points(user_id, last_point, points):
+        """Add newly ingested points to the running totals.
+
+        last_point is the fix the batch was chained from (None for a user's
+        first points) and points are the new dicts with lat, lon and
+        trip_date, in ingest order. A single relative UPDATE, so it commits
+        atomically with the points, and /api/trips/stream subscribers are
+        notified when it does. Call after they are flushed; the caller
+        commits.
+        """
+        from app.events import stats_events
+
+        if not points:
+            return
+        stats_events.mark_changed(db.session, user_id)
+        UserDataVersion.bump(user_id, points=True)
+        anchor = [last_point] if last_point else []
+        lats = [p.lat for p in anchor] + [p['lat'] for p in points]
+        lons = [p.lon for p in anchor] + [p['lon'] for p in points]
+        dates = [p.trip_date for p in anchor] + [p['trip_date'] for p in points]
+        movement = UserTripStats.summarize(lats, lons, dates)
+        newest = max(dates)
+
+        max_speed = movement['max_speed_kmh']
+        updated = UserTripStats.query.filter_by(user_id=user_id).update({
+            UserTripStats.point_count: UserTripStats.point_count + sum(1 for p in points if p.get('stored', True)),
+            UserTripStats.total_distance_km: UserTripStats.total_distance_km + movement['distance_km'],
+            UserTripStats.moving_seconds: UserTripStats.moving_seconds + movement['moving_seconds'],
+            UserTripStats.idle_seconds: UserTripStats.idle_seconds + movement['idle_seconds'],
+            UserTripStats.speed_sum_kmh: UserTripStats.speed_sum_kmh + movement['speed_sum_kmh'],
+            UserTripStats.moving_segments: UserTripStats.moving_segments + movement['moving_segments'],
+            UserTripStats.max_speed_kmh: db.case(
+                (UserTripStats.max_speed_kmh < max_speed, max_speed), else_=UserTripStats.max_speed_kmh
+            ),
+            UserTripStats.last_point_date: db.case(
+                (UserTripStats.last_point_date.is_(None), newest),
+                (UserTripStats.last_point_date < newest, newest),
+                else_=UserTripStats.last_point_date
+            ),
+            UserTripStats.updated_at: datetime.utcnow(),
+        }, synchronize_session='fetch')
+
+        if not updated:
+            # No totals yet: build them from the rows, which already include
+            # these (flushed) points
+            UserTripStats.rebuild(user_id)
+
+    @staticmethod
+    def get_stats(user_id):
+        """The stored totals, or unsaved ones computed from the points if missing"""
+        stats = db.session.get(UserTripStats, user_id)
+        if stats is None:
+            stats = UserTripStats(user_id=user_id, **UserTripStats.compute(user_id))
+        return stats
+
+    @staticmethod
+    def compute(user_id):
+        """Totals computed from all of a user's points in trip_date order"""
+        rows = db.session.query(
+            TriPoint.lat, TriPoint.lon, TriPoint.odometer_km, TriPoint.trip_date, TriPoint.dwell_until
+        ).filter(TriPoint.user_id == user_id).order_by(TriPoint.trip_date, TriPoint.id).all()
+        if not rows:
+            values = dict.fromkeys(UserTripStats.SUMMED_COLUMNS, 0)
+            values.update(max_speed_kmh=0.0, last_point_date=None)
+            return values
+        lats, lons, dates, odometers = zip(*TriPoint.expand_dwell(rows))
+        movement = UserTripStats.summarize(lats, lons, dates, odometers)
+        return {
+            'point_count': len(rows),
+            'total_distance_km': movement['distance_km'],
+            'moving_seconds': movement['moving_seconds'],
+            'idle_seconds': movement['idle_seconds'],
+            'speed_sum_kmh': movement['speed_sum_kmh'],
+            'moving_segments': movement['moving_segments'],
+            'max_speed_kmh': movement['max_speed_kmh'],
+            'last_point_date': dates[-1],
+        }
+
+    @staticmethod
+    def rebuild(user_id):
+        """Recompute a user's totals from their points. The caller commits."""
+        values = UserTripStats.compute(user_id)
+        stats = db.session.get(UserTripStats, user_id)
+        if stats is None:
+            stats = UserTripStats(user_id=user_id)
+            db.session.add(stats)
+        for column, value in values.items():
+            setattr(stats, column, value)
+        stats.updated_at = datetime.utcnow()
+        return stats
+
+
+class Trip(db.Model):
+    """GPS цэгүүдийн урсгалаас автоматаар хуваасан аялал (цэг хүлээн авах бүрт шинэчлэгдэнэ)"""
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+
+    # The trip that new points extend; at most one per user
+    is_open = db.Column(db.Boolean, nullable=False, default=True)
+
+    # From the fix the vehicle started moving at to the last moving fix
+    start_time = db.Column(db.DateTime, nullable=False)
+    end_time = db.Column(db.DateTime, nullable=False)
+    start_lat = db.Column(db.Float, nullable=False)
+    start_lon = db.Column(db.Float, nullable=False)
+    end_lat = db.Column(db.Float, nullable=False)
+    end_lon = db.Column(db.Float, nullable=False)
+
+    distance_km = db.Column(db.Float, nullable=False, default=0.0)
+    moving_seconds = db.Column(db.Float, nullable=False, default=0.0)
+    idle_seconds = db.Column(db.Float, nullable=False, default=0.0)
+    max_speed_kmh = db.Column(db.Float, nullable=False, default=0.0)
+
+    # Average speed is speed_sum_kmh / moving_segments
+    speed_sum_kmh = db.Column(db.Float, nullable=False, default=0.0)
+    moving_segments = db.Column(db.Integer, nullable=False, default=0)
+
+    # Estimated with the user's average efficiency when the trip was last extended
+    fuel_liters = db.Column(db.Float, nullable=False, default=0.0)
+
+    # Stop since the last moving fix; it becomes part of the trip only if
+    # the vehicle moves again within STATIONARY_SECONDS
+    pending_idle_seconds = db.Column(db.Float, nullable=False, default=0.0)
+    pending_distance_km = db.Column(db.Float, nullable=False, default=0.0)
+
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    user = db.relationship('User', backref='trips')
+
+    __table_args__ = (
+        # Trip listing, newest first
+        db.Index('ix_trip_user_id_start_time', 'user_id', 'start_time'),
+        # The open trip that ingest extends
+        db.Index('ix_trip_user_id_is_open', 'user_id', 'is_open'),
+    )
+
+    # A gap between fixes longer than this ends the trip (tracking was off)
+    GAP_SECONDS = 300
+    # Standing still longer than this ends the trip at the last moving fix
+    STATIONARY_SECONDS = 300
+    # Closed trips shorter than this were GPS drift, not driving
+    MIN_DISTANCE_KM = 0.1
+    DEFAULT_EFFICIENCY_L_PER_100KM = 10.0
+    IDLE_FUEL_LPH = 0.8
+
+    def __repr__(self):
+        return f'<Trip {self.id} user={self.user_id}: {self.distance_km:.1f}km from {self.start_time}>'
+
+    @property
+    def duration_seconds(self):
+        return (self.end_time - self.start_time).total_seconds()
+
+    @property
+    def avg_speed_kmh(self):
+        return self.speed_sum_kmh / self.moving_segments if self.moving_segments else 0.0
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'is_open': self.is_open,
+            'start_time': self.start_time.isoformat(),
+            'end_time': self.end_time.isoformat(),
+            'start_location': [self.start_lat, self.start_lon],
+            'end_location': [self.end_lat, self.end_lon],
+            'distance_km': round(self.distance_km, 3),
+            'duration_seconds': round(self.duration_seconds, 1),
+            'moving_seconds': round(self.moving_seconds, 1),
+            'idle_seconds': round(self.idle_seconds, 1),
+            'max_speed_kmh': round(self.max_speed_kmh, 1),
+            'avg_speed_kmh': round(self.avg_speed_kmh, 1),
+            'fuel_liters': round(self.fuel_liters, 2),
+        }
+
+    @staticmethod
+    def get_open(user_id):
+        return Trip.query.filter_by(user_id=user_id, is_open=True).first()
+
+    @staticmethod
+    def list_recent(user_id, before=None, limit=20):
+        """A page of trips, newest first; before is a start_time to continue from"""
+        query = Trip.query.filter(Trip.user_id == user_id)
+        if before is not None:
+            query = query.filter(Trip.start_time < before)
+        return query.order_by(Trip.start_time.desc()).limit(limit).all()
+
+    @staticmethod
+    def _open_at(user_id, point):
+        trip = Trip(user_id=user_id, is_open=True, start_time=point['trip_date'], end_time=point['trip_date'],
+                    start_lat=point['lat'], start_lon=point['lon'], end_lat=point['lat'], end_lon=point['lon'],
+                    distance_km=0.0, moving_seconds=0.0, idle_seconds=0.0, max_speed_kmh=0.0,
+                    speed_sum_kmh=0.0, moving_segments=0, fuel_liters=0.0,
+                    pending_idle_seconds=0.0, pending_distance_km=0.0)
+        db.session.add(trip)
+        return trip
+
+    def _extend(self, point, distance_km, duration_s, speed_kmh):
+        """Add a moving segment ending at point, keeping the stop before it"""
+        self.idle_seconds += self.pending_idle_seconds
+        self.distance_km += self.pending_distance_km + distance_km
+        self.pending_idle_seconds = self.pending_distance_km = 0.0
+        self.moving_seconds += duration_s
+        self.max_speed_kmh = max(self.max_speed_kmh, speed_kmh)
+        self.speed_sum_kmh += speed_kmh
+        self.moving_segments += 1
+        self.end_time = point['trip_date']
+        self.end_lat, self.end_lon = point['lat'], point['lon']
+
+    def _close(self):
+        """End the trip at its last moving fix; drop it if it never really went anywhere"""
+        self.is_open = False
+        self.pending_idle_seconds = self.pending_distance_km = 0.0
+        if self.distance_km < Trip.MIN_DISTANCE_KM:
+            if db.inspect(self).pending:
+                db.session.expunge(self)
+            else:
+                db.session.delete(self)
+
+    def _kept(self):
+        return self in db.session and self not in db.session.deleted
+
+    def _estimate_fuel(self, efficiency_l_per_100km):
+        self.fuel_liters = (efficiency_l_per_100km / 100.0) * self.distance_km \
+            + Trip.IDLE_FUEL_LPH * (self.idle_seconds / 3600.0)
+
+    @staticmethod
+    def record_points(user_id, last_point, points):
+        """Run newly ingested points through the segmentation.
+
+        Same arguments as UserTripStats.record_points. Each step between
+        consecutive fixes is classified with the trips_stats thresholds. A
+        moving step extends the open trip or starts one at its first fix. A
+        step longer than GAP_SECONDS, or standing still for more than
+        STATIONARY_SECONDS, closes the open trip at its last moving fix.
+        Points older than the previous fix are not segmented. When every
+        point (and last_point) carries odometer_km, as in rebuild, steps
+        are measured with geo.stored_steps_km. Only the open trip is read, so
+        the cost does not grow with the history; the caller commits.
+        """
+        if not points:
+            return
+        anchor = [{'lat': last_point.lat, 'lon': last_point.lon, 'trip_date': last_point.trip_date,
+                   'odometer_km': last_point.odometer_km}] if last_point else []
+        track = anchor + [{'lat': p['lat'], 'lon': p['lon'], 'trip_date': p['trip_date'].replace(tzinfo=None),
+                           'odometer_km': p.get('odometer_km')} for p in points]
+        if len(track) < 2:
+            return
+        lats, lons = [p['lat'] for p in track], [p['lon'] for p in track]
+        if all(p['odometer_km'] is not None for p in track):
+            distances = geo.stored_steps_km(lats, lons, [p['odometer_km'] for p in track])
+        else:
+            distances = geo.segment_distances_km(lats, lons)
+        distances = geo.filter_jitter(distances, UserTripStats.JITTER_KM)
+        durations = geo.segment_durations_s([p['trip_date'] for p in track])
+        speeds = geo.segment_speeds_kmh(distances, durations)
+
+        trip = Trip.get_open(user_id)
+        touched = set()
+        for i in range(1, len(track)):
+            point = track[i]
+            distance_km, duration_s, speed_kmh = float(distances[i - 1]), float(durations[i - 1]), float(speeds[i - 1])
+            if duration_s <= 0:
+                continue
+            moving = distance_km > 0 and speed_kmh >= UserTripStats.IDLE_SPEED_KMH
+
+            if trip is not None and (
+                duration_s > Trip.GAP_SECONDS
+                or (not moving and (point['trip_date'] - trip.end_time).total_seconds() > Trip.STATIONARY_SECONDS)
+            ):
+                trip._close()
+                trip = None
+            if trip is None:
+                if not moving or duration_s > Trip.GAP_SECONDS:
+                    continue
+                trip = Trip._open_at(user_id, track[i - 1])
+            if moving:
+                trip._extend(point, distance_km, duration_s, speed_kmh)
+            else:
+                trip.pending_idle_seconds += duration_s
+                trip.pending_distance_km += distance_km
+            touched.add(trip)
+
+        live = [t for t in touched if t._kept()]
+        if live:
+            efficiency = FillUp.get_average_efficiency(user_id) or Trip.DEFAULT_EFFICIENCY_L_PER_100KM
+            now = datetime.utcnow()
+            for t in live:
+                t._estimate_fuel(efficiency)
+                t.updated_at = now
+
+    @staticmethod
+    def close_open(user_id):
+        """Close the user's open trip now (tracking stopped). Returns it, or None
+        if there was none or it was too short to keep. The caller commits.
+        """
+        trip = Trip.get_open(user_id)
+        if trip is None:
+            return None
+        trip._close()
+        return trip if trip._kept() else None
+
+    @staticmethod
+    def rebuild(user_id, chunk_size=1000):
+        """Re-segment all of a user's points from scratch. The caller commits.
+        Returns the number of trips.
+        """
+        from app.cache import LastPoint
+
+        Trip.query.filter_by(user_id=user_id).delete()
+        previous = None
+        chunk = []
+        track = TriPoint.expand_dwell(TriPoint.iter_track(user_id, chunk_size=chunk_size))
+        for lat, lon, trip_date, odometer_km in track:
+            chunk.append({'lat': lat, 'lon': lon, 'trip_date': trip_date, 'odometer_km': odometer_km})
+            if len(chunk) >= chunk_size:
+                Trip.record_points(user_id, previous, chunk)
+                previous = LastPoint(lat, lon, odometer_km, trip_date)
+                chunk = []
+        Trip.record_points(user_id, previous, chunk)
+        db.session.flush()
+        return Trip.query.filter_by(user_id=user_id).count()
+
+
+class HeatmapCell(db.Model):
+    """Хэрэглэгч бүрийн GPS цэгийн тоо geohash нүд болон нарийвчлалаар (цэг хүлээн авахад нэмэгдэнэ)"""
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    precision = db.Column(db.Integer, primary_key=True)
+    cell = db.Column(db.String(12), primary_key=True)
+    point_count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        # Fleet-wide heatmap of a viewport
+        db.Index('ix_heatmap_cell_precision_cell', 'precision', 'cell'),
+    )
+
+    # Geohash lengths kept, from ~156 km down to ~150 m cells
+    PRECISIONS = (3, 4, 5, 6, 7)
+    # Target on-screen size of a heatmap cell
+    CELL_PIXELS = 16
+
+    def __repr__(self):
+        return f'<HeatmapCell user={self.user_id} {self.cell}: {self.point_count}>'
+
+    @staticmethod
+    def record_points(user_id, points):
+        """Count newly stored points (dicts with lat and lon) into their cells
+        at every precision. One upsert statement; the caller commits.
+        """
+        counts = {}
+        for point in points:
+            geohash = geo.geohash_encode(point['lat'], point['lon'], max(HeatmapCell.PRECISIONS))
+            counts[geohash] = counts.get(geohash, 0) + 1
+        HeatmapCell.add_counts(user_id, counts)
+
+    @staticmethod
+    def add_counts(user_id, geohash_counts):
+        """Add {geohash: count} into the cells at every precision; geohashes
+        are at least max(PRECISIONS) long and a negative count takes points
+        out. One upsert statement, and cells left empty are deleted. The
+        caller commits.
+        """
+        counts = {}
+        for geohash, count in geohash_counts.items():
+            for precision in HeatmapCell.PRECISIONS:
+                key = (precision, geohash[:precision])
+                counts[key] = counts.get(key, 0) + count
+        if not counts:
+            return
+        values = [{'user_id': user_id, 'precision': precision, 'cell': cell, 'point_count': count}
+                  for (precision, cell), count in sorted(counts.items())]
+
+        dialect = db.session.get_bind().dialect.name
+        if dialect in ('postgresql', 'sqlite'):
+            if dialect == 'postgresql':
+                from sqlalchemy.dialects.postgresql import insert
+            else:
+                from sqlalchemy.dialects.sqlite import insert
+            statement = insert(HeatmapCell).values(values)
+            db.session.execute(statement.on_conflict_do_update(
+                index_elements=['user_id', 'precision', 'cell'],
+                set_={'point_count': HeatmapCell.point_count + statement.excluded.point_count}
+            ))
+        else:
+            for value in values:
+                updated = HeatmapCell.query.filter_by(
+                    user_id=user_id, precision=value['precision'], cell=value['cell']
+                ).update({HeatmapCell.point_count: HeatmapCell.point_count + value['point_count']},
+                         synchronize_session=False)
+                if not updated:
+                    db.session.add(HeatmapCell(**value))
+        if any(value['point_count'] < 0 for value in values):
+            HeatmapCell.query.filter(
+                HeatmapCell.user_id == user_id, HeatmapCell.point_count <= 0
+            ).delete(synchronize_session=False)
+
+    @staticmethod
+    def precision_for_zoom(zoom, lat):
+        """Finest kept precision whose cells are still CELL_PIXELS wide on a
+        map at zoom
+        """
+        min_width_m = HeatmapCell.CELL_PIXELS * geo.meters_per_pixel(zoom, lat)
+        chosen = HeatmapCell.PRECISIONS[0]
+        for precision in HeatmapCell.PRECISIONS:
+            south, west, north, east = geo.geohash_bounds(geo.geohash_encode(lat, 0.0, precision))
+            if geo.haversine_km(lat, west, lat, east) * 1000 >= min_width_m:
+                chosen = precision
+        return chosen
+
+    @staticmethod
+    def get_cells(precision, south, west, north, east, user_id=None):
+        """(cell, count) pairs of a user's, or with no user_id the whole
+        fleet's, heatmap cells of the given precision that overlap the box
+        """
+        _, cover = geo.geohash_cover(south, west, north, east, precision, TriPoint.BBOX_MAX_CELLS)
+        query = db.session.query(HeatmapCell.cell, db.func.sum(HeatmapCell.point_count)).filter(
+            HeatmapCell.precision == precision, geohash_filter(HeatmapCell.cell, cover)
+        )
+        if user_id is not None:
+            query = query.filter(HeatmapCell.user_id == user_id)
+        rows = query.group_by(HeatmapCell.cell).order_by(HeatmapCell.cell).all()
+        result = []
+        for cell, count in rows:
+            cell_south, cell_west, cell_north, cell_east = geo.geohash_bounds(cell)
+            if cell_north >= south and cell_south <= north and cell_east >= west and cell_west <= east:
+                result.append((cell, int(count)))
+        return result
+
+    @staticmethod
+    def rebuild(user_id):
+        """Recount a user's cells from their stored points. The caller commits."""
+        HeatmapCell.query.filter_by(user_id=user_id).delete()
+        for precision in HeatmapCell.PRECISIONS:
+            cell = db.func.substr(TriPoint.geohash, 1, precision)
+            db.session.execute(db.insert(HeatmapCell).from_select(
+                ['user_id', 'precision', 'cell', 'point_count'],
+                db.select(TriPoint.user_id, db.literal(precision), cell, db.func.count()).where(
+                    TriPoint.user_id == user_id, TriPoint.geohash.is_not(None)
+                ).group_by(TriPoint.user_id, cell)
+            ))
+
+
+class FillUpInterval(db.Model):
+    """Дараалсан хоёр цэнэглэлтийн хоорондох GPS замын нэгтгэл (моторын цагийн тооцоонд).
+
+    Цэнэглэлт бүр огноогоороо дараагийн цэнэглэлт хүртэлх нэг интервалыг эхлүүлнэ;
+    сүүлийн цэнэглэлтийн интервал нээлттэй бөгөөд цэг хүлээн авахад нэмэгдэнэ.
+    """
+
+    __tablename__ = 'fill_up_interval'
+
+    # The fill-up that starts the interval (fill-ups in date order)
+    start_fillup_id = db.Column(db.Integer, db.ForeignKey('fill_up.id', ondelete='CASCADE'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    # The next fill-up by date; NULL while the interval is still open
+    end_fillup_id = db.Column(db.Integer, db.ForeignKey('fill_up.id', ondelete='CASCADE'))
+    start_date = db.Column(db.DateTime, nullable=False)
+    end_date = db.Column(db.DateTime)
+
+    distance_km = db.Column(db.Float, nullable=False, default=0.0)
+    moving_seconds = db.Column(db.Float, nullable=False, default=0.0)
+    idle_seconds = db.Column(db.Float, nullable=False, default=0.0)
+    point_count = db.Column(db.Integer, nullable=False, default=0)
+
+    # Newest fix counted, so a back-dated fill-up can tell whether it splits the interval
+    last_point_date = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        # Open interval (end_date IS NULL) and past intervals newest first
+        db.Index('ix_fill_up_interval_user_id_end_date', 'user_id', 'end_date'),
+        db.Index('ix_fill_up_interval_end_fillup_id', 'end_fillup_id'),
+    )
+
+    # Classification used by /api/motor_hour: steps under 10 m are GPS
+    # noise, below 2 km/h (or standing still) is idle
+    JITTER_KM = 0.01
+    IDLE_SPEED_KMH = 2.0
+
+    SUMMED_COLUMNS = ('distance_km', 'moving_seconds', 'idle_seconds', 'point_count')
+
+    def __repr__(self):
+        return f'<FillUpInterval {self.start_fillup_id}->{self.end_fillup_id}: {self.distance_km:.1f}km>'
+
+    @property
+    def is_open(self):
+        return self.end_fillup_id is None
+
+    @staticmethod
+    def summarize(lats, lons, dates, odometers=None):
+        """Movement summary of a track with the motor-hour thresholds;
+        odometers as in UserTripStats.summarize
+        """
+        distances = geo.stored_steps_km(lats, lons, odometers) if odometers is not None else None
+        return geo.summarize_movement(lats, lons, dates, FillUpInterval.JITTER_KM, FillUpInterval.IDLE_SPEED_KMH,
+                                      distances_km=distances)
+
+    @staticmethod
+    def compute(user_id, start_date, end_date=None):
+        """Totals of the user's points with start_date <= trip_date <= end_date"""
+        query = db.session.query(
+            TriPoint.lat, TriPoint.lon, TriPoint.odometer_km, TriPoint.trip_date, TriPoint.dwell_until
+        ).filter(TriPoint.user_id == user_id, TriPoint.trip_date >= start_date)
+        if end_date is not None:
+            query = query.filter(TriPoint.trip_date <= end_date)
+        rows = query.order_by(TriPoint.trip_date, TriPoint.id).all()
+        track = [fix for fix in TriPoint.expand_dwell(rows) if end_date is None or fix[2] <= end_date]
+        values = dict.fromkeys(FillUpInterval.SUMMED_COLUMNS, 0)
+        values['point_count'] = len(rows)
+        values['last_point_date'] = track[-1][2] if track else None
+        if len(track) > 1:
+            movement = FillUpInterval.summarize(*zip(*track))
+            values.update(distance_km=movement['distance_km'], moving_seconds=movement['moving_seconds'],
+                          idle_seconds=movement['idle_seconds'])
+        return values
+
+    @staticmethod
+    def fillup_date(fillup):
+        """The fill-up's date as a datetime; the form assigns a plain date
+        that stays on the object until it is reloaded
+        """
+        value = fillup.date
+        return value if isinstance(value, datetime) else datetime.combine(value, datetime.min.time())
+
+    @staticmethod
+    def _neighbours(fillup):
+        """(previous, next) fill-up of the same user by (date, id)"""
+        key = db.tuple_(FillUp.date, FillUp.id)
+        own_key = (FillUpInterval.fillup_date(fillup), fillup.id)
+        siblings = FillUp.query.filter(FillUp.user_id == fillup.user_id, FillUp.id != fillup.id)
+        previous_fillup = siblings.filter(key < own_key).order_by(FillUp.date.desc(), FillUp.id.desc()).first()
+        next_fillup = siblings.filter(key > own_key).order_by(FillUp.date, FillUp.id).first()
+        return previous_fillup, next_fillup
+
+    @staticmethod
+    def _store(start, end, values=None):
+        """Write the interval from fill-up start to end (None: open) with values,
+        computing them from the points when omitted
+        """
+        start_date = FillUpInterval.fillup_date(start)
+        end_date = FillUpInterval.fillup_date(end) if end else None
+        if values is None:
+            values = FillUpInterval.compute(start.user_id, start_date, end_date)
+        interval = db.session.get(FillUpInterval, start.id)
+        if interval is None:
+            interval = FillUpInterval(start_fillup_id=start.id, user_id=start.user_id)
+            db.session.add(interval)
+        interval.start_date = start_date
+        interval.end_fillup_id = end.id if end else None
+        interval.end_date = end_date
+        for column, value in values.items():
+            setattr(interval, column, value)
+        interval.updated_at = datetime.utcnow()
+        return interval
+
+    @staticmethod
+    def record_points(user_id, last_point, points):
+        """Add newly ingested points to the user's open interval.
+
+        Same arguments as UserTripStats.record_points. Points from before the
+        open interval belong to a closed one and are left to rebuild. A
+        single relative UPDATE; the caller commits.
+        """
+        start_date = db.session.query(FillUpInterval.start_date).filter(
+            FillUpInterval.user_id == user_id, FillUpInterval.end_date.is_(None)
+        ).scalar()
+        if start_date is None:
+            return
+        track = [(p['lat'], p['lon'], p['trip_date'].replace(tzinfo=None), p.get('stored', True)) for p in points]
+        track = [fix for fix in track if fix[2] >= start_date]
+        if not track:
+            return
+        if last_point and last_point.trip_date >= start_date:
+            track.insert(0, (last_point.lat, last_point.lon, last_point.trip_date, False))
+        lats, lons, dates, stored = zip(*track)
+        movement = FillUpInterval.summarize(lats, lons, dates)
+        newest = max(dates)
+        FillUpInterval.query.filter(
+            FillUpInterval.user_id == user_id, FillUpInterval.end_date.is_(None)
+        ).update({
+            FillUpInterval.distance_km: FillUpInterval.distance_km + movement['distance_km'],
+            FillUpInterval.moving_seconds: FillUpInterval.moving_seconds + movement['moving_seconds'],
+            FillUpInterval.idle_seconds: FillUpInterval.idle_seconds + movement['idle_seconds'],
+            FillUpInterval.point_count: FillUpInterval.point_count + sum(stored),
+            FillUpInterval.last_point_date: db.case(
+                (FillUpInterval.last_point_date.is_(None), newest),
+                (FillUpInterval.last_point_date < newest, newest),
+                else_=FillUpInterval.last_point_date
+            ),
+            FillUpInterval.updated_at: datetime.utcnow(),
+        }, synchronize_session='fetch')
+
+    @staticmethod
+    def record_fillup(fillup, removed=False):
+        """Re-split the user's intervals around an inserted or deleted fill-up.
+
+        Call after an insert is flushed, or before a delete is flushed. A
+        fill-up recorded after the newest point just closes the open
+        interval and opens an empty one; other writes recompute the one or
+        two affected intervals from their points. The caller commits.
+        """
+        previous_fillup, next_fillup = FillUpInterval._neighbours(fillup)
+        if removed:
+            FillUpInterval.query.filter(db.or_(
+                FillUpInterval.start_fillup_id == fillup.id, FillUpInterval.end_fillup_id == fillup.id
+            )).delete(synchronize_session='fetch')
+            if previous_fillup is not None:
+                FillUpInterval._store(previous_fillup, next_fillup)
+            return
+
+        if next_fillup is None and previous_fillup is not None:
+            fillup_date = FillUpInterval.fillup_date(fillup)
+            open_interval = db.session.get(FillUpInterval, previous_fillup.id)
+            if open_interval is not None and open_interval.is_open and (
+                    open_interval.last_point_date is None or open_interval.last_point_date <= fillup_date):
+                open_interval.end_fillup_id = fillup.id
+                open_interval.end_date = fillup_date
+                open_interval.updated_at = datetime.utcnow()
+                empty = dict.fromkeys(FillUpInterval.SUMMED_COLUMNS, 0)
+                FillUpInterval._store(fillup, None, dict(empty, last_point_date=None))
+                return
+        if previous_fillup is not None:
+            FillUpInterval._store(previous_fillup, fillup)
+        FillUpInterval._store(fillup, next_fillup)
+
+    @staticmethod
+    def get_interval(user_id, end_fillup_id=None):
+        """The closed interval ending at end_fillup_id (default: the latest one).
+
+        Falls back to an unsaved interval computed from the points when the
+        user's intervals were never built. None if there is no such interval.
+        """
+        query = FillUpInterval.query.filter(FillUpInterval.user_id == user_id, FillUpInterval.end_date.isnot(None))
+        if end_fillup_id is not None:
+            query = query.filter(FillUpInterval.end_fillup_id == end_fillup_id)
+        interval = query.order_by(FillUpInterval.end_date.desc()).first()
+        if interval is not None or db.session.query(FillUpInterval.start_fillup_id).filter(
+                FillUpInterval.user_id == user_id).first() is not None:
+            return interval
+
+        fillups = FillUp.query.filter_by(user_id=user_id)
+        if end_fillup_id is not None:
+            end = fillups.filter(FillUp.id == end_fillup_id).first()
+        else:
+            end = fillups.order_by(FillUp.date.desc(), FillUp.id.desc()).first()
+        start = FillUpInterval._neighbours(end)[0] if end else None
+        if start is None:
+            return None
+        start_date, end_date = FillUpInterval.fillup_date(start), FillUpInterval.fillup_date(end)
+        return FillUpInterval(start_fillup_id=start.id, user_id=user_id, end_fillup_id=end.id,
+                              start_date=start_date, end_date=end_date,
+                              **FillUpInterval.compute(user_id, start_date, end_date))
+
+    @staticmethod
+    def rebuild(user_id):
+        """Recompute all of a user's intervals from fill-ups and points.
+
+        Returns the number of intervals. The caller commits.
+        """
+        FillUpInterval.query.filter_by(user_id=user_id).delete()
+        fillups = FillUp.query.filter_by(user_id=user_id).order_by(FillUp.date, FillUp.id).all()
+        for start, end in zip(fillups, fillups[1:] + [None]):
+            FillUpInterval._store(start, end)
+        return len(fillups)
+
+
+class OdometerCalibration(db.Model):
+    """GPS цэгүүдээс тооцсон одометрийг цэнэглэлтийн одометрийн заалттай тааруулах тохируулга.
+
+    Машины одометр = GPS одометр * scale + offset_km. Шинэ цэнэглэлт бүрийг
+    тухайн үеийн GPS одометртой холбож (anchor), өмнөх anchor-аас хойших
+    зайн харьцаагаар scale-ийг шинэчилнэ.
+    """
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+
+    # The latest fill-up tied to the GPS odometer, and both readings at that moment
+    anchor_fillup_id = db.Column(db.Integer, db.ForeignKey('fill_up.id', ondelete='SET NULL'))
+    anchor_date = db.Column(db.DateTime)
+    anchor_gps_km = db.Column(db.Float)
+    anchor_odometer_km = db.Column(db.Float)
+
+    # Vehicle km per GPS km over the last anchored interval, and the offset
+    # that maps the anchor's GPS odometer onto its fill-up reading
+    scale = db.Column(db.Float, nullable=False, default=1.0)
+    offset_km = db.Column(db.Float, nullable=False, default=0.0)
+
+    # Newest point of the user seen by the reconciliation job; the highest
+    # across users is where the job's next run starts reading
+    last_point_id = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    # Ratios outside this range mean tracking was off for part of the
+    # interval (or the reading was mistyped), not a calibration error
+    MIN_SCALE = 0.8
+    MAX_SCALE = 1.25
+
+    def __repr__(self):
+        return f'<OdometerCalibration user={self.user_id}: x{self.scale:.3f} {self.offset_km:+.1f}km>'
+
+    def to_odometer(self, gps_km):
+        """The vehicle odometer reading matching a GPS odometer value"""
+        return gps_km * self.scale + self.offset_km
+
+    @staticmethod
+    def gps_odometer_at(user_id, moment):
+        """GPS odometer of the user's last point at or before moment, or None"""
+        return db.session.query(TriPoint.odometer_km).filter(
+            TriPoint.user_id == user_id, TriPoint.trip_date <= moment
+        ).order_by(TriPoint.trip_date.desc(), TriPoint.id.desc()).limit(1).scalar()
+
+    @staticmethod
+    def anchor_moment(fillup_date):
+        """When the reading of a fill-up dated fillup_date was taken, as far
+        as is known. The fill-up form records only the day, stored at
+        midnight; such a fill-up is placed at the end of its day, so the
+        whole day's driving counts towards the interval it closes.
+        """
+        if fillup_date.time() == time.min:
+            return datetime.combine(fillup_date.date(), time.max)
+        return fillup_date
+
+    @staticmethod
+    def after_anchor(anchor_date, anchor_fillup_id):
+        """Filter for fill-ups after the anchor in (date, id) order, so a
+        second fill-up on the anchor's date is not skipped. Without an
+        anchor fill-up id (it was deleted) every fill-up on that date counts.
+        """
+        return db.or_(FillUp.date > anchor_date,
+                      db.and_(FillUp.date == anchor_date, FillUp.id > db.func.coalesce(anchor_fillup_id, 0)))
+
+    @staticmethod
+    def reconcile(user_id, last_point_id=None):
+        """Anchor the fill-ups recorded since the last run. The caller commits.
+
+        Only fill-ups after the current anchor whose anchor_moment has been
+        reached, by the newest point or by the clock, are considered, each
+        with one indexed lookup, so the cost does not grow with the history.
+        last_point_id advances the job's cursor. Returns the number of
+        fill-ups anchored.
+        """
+        calibration = db.session.get(OdometerCalibration, user_id)
+        if calibration is None:
+            calibration = OdometerCalibration(user_id=user_id, scale=1.0, offset_km=0.0, last_point_id=0)
+            db.session.add(calibration)
+        if last_point_id is not None:
+            calibration.last_point_id = max(calibration.last_point_id or 0, last_point_id)
+
+        newest_point = db.session.query(db.func.max(TriPoint.trip_date)).filter(TriPoint.user_id == user_id).scalar()
+        if newest_point is None:
+            return 0
+        pending = FillUp.query.filter(FillUp.user_id == user_id, FillUp.date <= newest_point)
+        if calibration.anchor_date is not None:
+            pending = pending.filter(OdometerCalibration.after_anchor(calibration.anchor_date,
+                                                                      calibration.anchor_fillup_id))
+
+        anchored = 0
+        now = datetime.utcnow()
+        for fillup in pending.order_by(FillUp.date, FillUp.id):
+            moment = OdometerCalibration.anchor_moment(fillup.date)
+            if moment > newest_point and moment > now:
+                break  # its day is still running; the next run anchors it
+            gps_km = OdometerCalibration.gps_odometer_at(user_id, moment)
+            if gps_km is None:
+                continue  # before the first point
+            if calibration.anchor_gps_km is not None:
+                gps_distance = gps_km - calibration.anchor_gps_km
+                distance = fillup.odometer_km - calibration.anchor_odometer_km
+                if gps_distance > 0 and distance > 0 and \
+                        OdometerCalibration.MIN_SCALE <= distance / gps_distance <= OdometerCalibration.MAX_SCALE:
+                    calibration.scale = distance / gps_distance
+            calibration.anchor_fillup_id = fillup.id
+            calibration.anchor_date = fillup.date
+            calibration.anchor_gps_km = gps_km
+            calibration.anchor_odometer_km = fillup.odometer_km
+            calibration.offset_km = fillup.odometer_km - gps_km * calibration.scale
+            anchored += 1
+        if anchored:
+            calibration.updated_at = datetime.utcnow()
+        return anchored
+
+    @staticmethod
+    def pending_users():
+        """{user_id: newest point id or None} of users with points or fill-ups
+        the job has not seen yet.
+
+        New points are read by id range above the highest id the previous
+        run saw, so only rows ingested since then are touched.
+        """
+        cursor = db.session.query(db.func.max(OdometerCalibration.last_point_id)).scalar() or 0
+        pending = dict(db.session.query(TriPoint.user_id, db.func.max(TriPoint.id)).filter(
+            TriPoint.id > cursor
+        ).group_by(TriPoint.user_id).all())
+
+        # Fill-ups entered after the points around them were already seen
+        late_fillups = db.session.query(FillUp.user_id).join(
+            OdometerCalibration, OdometerCalibration.user_id == FillUp.user_id
+        ).filter(db.or_(
+            OdometerCalibration.anchor_date.is_(None),
+            OdometerCalibration.after_anchor(OdometerCalibration.anchor_date, OdometerCalibration.anchor_fillup_id)
+        )).distinct()
+        for (user_id,) in late_fillups:
+            pending.setdefault(user_id, None)
+        return pending
+
+
+class UserDataVersion(db.Model):
+    """Хэрэглэгчийн GPS цэг болон цэнэглэлтийн өгөгдөл өөрчлөгдөх бүрт нэмэгддэг тоолуур (ETag-д ашиглана)"""
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    # Bumped when points are ingested or downsampled
+    points_version = db.Column(db.Integer, nullable=False, default=0)
+    # Bumped on any fill-up or vehicle insert, update or delete
+    fillups_version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<UserDataVersion user={self.user_id} points={self.points_version} fillups={self.fillups_version}>'
+
+    @staticmethod
+    def get_versions(user_id):
+        """(points_version, fillups_version); (0, 0) before the first change.
+
+        Read from the database rather than the identity map, so a bump made
+        earlier in the same session is always seen.
+        """
+        row = db.session.query(UserDataVersion.points_version, UserDataVersion.fillups_version).filter(
+            UserDataVersion.user_id == user_id
+        ).first()
+        return tuple(row) if row else (0, 0)
+
+    @staticmethod
+    def bump(user_id, points=False, fillups=False, connection=None):
+        """Increment the chosen counters in the caller's transaction.
+
+        Pass connection from inside flush events; otherwise the session is
+        used. One upsert statement.
+        """
+        executor = connection if connection is not None else db.session
+        changes = {}
+        if points:
+            changes['points_version'] = UserDataVersion.points_version + 1
+        if fillups:
+            changes['fillups_version'] = UserDataVersion.fillups_version + 1
+        values = {'user_id': user_id, 'points_version': int(points), 'fillups_version': int(fillups)}
+
+        dialect = (connection.dialect if connection is not None else db.session.get_bind().dialect).name
+        if dialect in ('postgresql', 'sqlite'):
+            if dialect == 'postgresql':
+                from sqlalchemy.dialects.postgresql import insert
+            else:
+                from sqlalchemy.dialects.sqlite import insert
+            executor.execute(insert(UserDataVersion).values(values).on_conflict_do_update(
+                index_elements=['user_id'], set_=changes
+            ))
+            return
+        updated = executor.execute(
+            db.update(UserDataVersion).where(UserDataVersion.user_id == user_id).values(changes)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not updated:
+            executor.execute(db.insert(UserDataVersion).values(values))
+
+
+class TriPointRollup(db.Model):
+    """downsample-tri-points-ийн хэрэглэгч бүрээр хүрсэн хил (түүнээс өмнөх GPS цэгүүд цөөлөгдсөн)"""
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    # Points before thinned_until are down to one per bucket_seconds
+    thinned_until = db.Column(db.DateTime, nullable=False)
+    bucket_seconds = db.Column(db.Integer, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<TriPointRollup user={self.user_id} until={self.thinned_until} per {self.bucket_seconds}s>'
+
+    @staticmethod
+    def first_raw_point_date(user_id, since, until):
+        """trip_date of the user's first point with since <= trip_date < until, or None"""
+        query = db.session.query(db.func.min(TriPoint.trip_date)).filter(
+            TriPoint.user_id == user_id, TriPoint.trip_date < until
+        )
+        if since is not None:
+            query = query.filter(TriPoint.trip_date >= since)
+        return query.scalar()
+
+    @staticmethod
+    def pending_users(cutoff, bucket_seconds):
+        """{user_id: trip_date of the first point still to thin} of users with
+        points between their watermark and cutoff.
+
+        One indexed lookup per user, so a run only reads what arrived since
+        the previous one. A watermark left with another bucket_seconds is
+        ignored. Points stored later with an older timestamp than the
+        watermark stay raw until a --full run.
+        """
+        watermarks = dict(db.session.query(TriPointRollup.user_id, TriPointRollup.thinned_until).filter(
+            TriPointRollup.bucket_seconds == bucket_seconds
+        ).all())
+        pending = {}
+        for (user_id,) in db.session.query(User.id).order_by(User.id):
+            first = TriPointRollup.first_raw_point_date(user_id, watermarks.get(user_id), cutoff)
+            if first is not None:
+                pending[user_id] = first
+        return pending
+
+    @staticmethod
+    def advance(user_id, bucket_seconds, thinned_until):
+        """Record that the user's points before thinned_until are thinned. The caller commits."""
+        rollup = db.session.get(TriPointRollup, user_id)
+        if rollup is None:
+            rollup = TriPointRollup(user_id=user_id)
+            db.session.add(rollup)
+        rollup.bucket_seconds = bucket_seconds
+        rollup.thinned_until = thinned_until
+        rollup.updated_at = datetime.utcnow()
+        return rollup
@@ -0,0 +1,110 @@
+"""Opt-in monthly range partitioning of tri_point on PostgreSQL.
+
+Partitions are named tri_point_yYYYYmMM and cover [first of month, first of
+next month) on trip_date; a DEFAULT partition catches anything outside the
+created range. Create partitions ahead of time (`flask
+create-tri-point-partitions`, e.g. from a monthly cron) so the default
+partition stays empty: PostgreSQL refuses to attach a month whose rows are
+already sitting in the default partition.
+
+On any other database every function here is a no-op that returns False
+or an empty list.
+"""
+from datetime import date, datetime
+
+from app.models import db
+
+TABLE = 'tri_point'
+
+
+def is_supported():
+    return db.session.get_bind().dialect.name == 'postgresql'
+
+
+def is_partitioned():
+    """True if tri_point is already a partitioned table"""
+    if not is_supported():
+        return False
+    return db.session.execute(db.text(
+        "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+        "WHERE c.relname = :table"
+    ), {'table': TABLE}).first() is not None
+
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f'{TABLE}_y{month.year}m{month.month:02d}'
+
+
+def create_partitions(first_month, last_month):
+    """Create the monthly partitions from first_month through last_month.
+
+    Existing partitions are left alone. Returns the names of all partitions
+    in the range; the caller commits.
+    """
+    if not is_partitioned():
+        return []
+    names = []
+    month = month_start(first_month)
+    while month <= month_start(last_month):
+        name = partition_name(month)
+        db.session.execute(db.text(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {TABLE} "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+        ))
+        names.append(name)
+        month = add_months(month, 1)
+    return names
+
+
+def create_future_partitions(months_ahead, today=None):
+    """Partitions from the current month through months_ahead months from now"""
+    this_month = month_start(today or datetime.utcnow())
+    return create_partitions(this_month, add_months(this_month, months_ahead))
+
+
+def convert_to_partitioned(months_ahead):
+    """Rebuild tri_point as a partitioned table and move every row into it.
+
+    Runs in the caller's transaction (PostgreSQL DDL is transactional), so a
+    failure leaves the old table in place. The table is locked while the
+    rows are copied; run it in a maintenance window. The id sequence is
+    kept, and the primary key becomes (id, trip_date) because PostgreSQL
+    requires the partition key in every unique constraint. Returns the
+    number of rows moved, or None if there was nothing to do.
+    """
+    if not is_supported() or is_partitioned():
+        return None
+    old = f'{TABLE}_unpartitioned'
+    for statement in (
+        f"ALTER TABLE {TABLE} RENAME TO {old}",
+        # Index and constraint names are schema-wide; free them for the new table
+        f"ALTER INDEX ix_{TABLE}_user_id_trip_date RENAME TO ix_{old}_user_id_trip_date",
+        f"ALTER INDEX ix_{TABLE}_user_id_geohash RENAME TO ix_{old}_user_id_geohash",
+        f"ALTER TABLE {old} RENAME CONSTRAINT {TABLE}_pkey TO {old}_pkey",
+        f"CREATE TABLE {TABLE} (LIKE {old} INCLUDING DEFAULTS) PARTITION BY RANGE (trip_date)",
+        f"ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey PRIMARY KEY (id, trip_date)",
+        f'ALTER TABLE {TABLE} ADD FOREIGN KEY (user_id) REFERENCES "user" (id)',
+        f"CREATE INDEX ix_{TABLE}_user_id_trip_date ON {TABLE} (user_id, trip_date)",
+        f"CREATE INDEX ix_{TABLE}_user_id_geohash ON {TABLE} (user_id, geohash)",
+        f"CREATE TABLE {TABLE}_default PARTITION OF {TABLE} DEFAULT",
+    ):
+        db.session.execute(db.text(statement))
+
+    oldest = db.session.execute(db.text(f"SELECT min(trip_date) FROM {old}")).scalar()
+    this_month = month_start(datetime.utcnow())
+    create_partitions(month_start(oldest) if oldest else this_month, add_months(this_month, months_ahead))
+
+    moved = db.session.execute(db.text(f"INSERT INTO {TABLE} SELECT * FROM {old}")).rowcount
+    # The sequence belongs to the old id column and would be dropped with it
+    db.session.execute(db.text(f"ALTER SEQUENCE {TABLE}_id_seq OWNED BY {TABLE}.id"))
+    db.session.execute(db.text(f"DROP TABLE {old}"))
+    return moved
@@ -0,0 +1,115 @@
+"""Compact wire format for GPS tracks.
+
+Each column of a track is sent as one string in Google's encoded polyline
+alphabet: values are scaled to integers, delta-encoded against the previous
+point, zigzag-signed and written as base-32 varints offset into printable
+ASCII. lat/lon together form a standard precision-5 polyline, so any
+polyline decoder can draw the path. map.html carries the matching decoder.
+"""
+from datetime import datetime, timedelta
+
+MIMETYPE = 'application/vnd.fuel-tracker.track+json'
+
+EPOCH = datetime(1970, 1, 1)
+
+# Scale of each column before rounding to integers; times are milliseconds
+LATLON_SCALE = 1e5      # ~1.1 m
+ODOMETER_SCALE = 1000   # meters
+
+
+def _append_signed(chunks, delta):
+    delta = ~(delta << 1) if delta < 0 else delta << 1
+    while delta >= 0x20:
+        chunks.append(chr((0x20 | (delta & 0x1f)) + 63))
+        delta >>= 5
+    chunks.append(chr(delta + 63))
+
+
+def _read_signed(encoded):
+    """The signed integers of an encoded string, without delta decoding"""
+    index = 0
+    while index < len(encoded):
+        result = shift = 0
+        while True:
+            byte = ord(encoded[index]) - 63
+            index += 1
+            result |= (byte & 0x1f) << shift
+            shift += 5
+            if byte < 0x20:
+                break
+        yield ~(result >> 1) if result & 1 else result >> 1
+
+
+def _running_sum(deltas):
+    total = 0
+    values = []
+    for delta in deltas:
+        total += delta
+        values.append(total)
+    return values
+
+
+def encode_values(values):
+    """Delta + zigzag varint encode a sequence of integers"""
+    chunks = []
+    previous = 0
+    for value in values:
+        _append_signed(chunks, value - previous)
+        previous = value
+    return ''.join(chunks)
+
+
+def decode_values(encoded):
+    """Inverse of encode_values"""
+    return _running_sum(_read_signed(encoded))
+
+
+def encode_polyline(lats, lons):
+    """Google encoded polyline (precision 5) of a path"""
+    chunks = []
+    previous_lat = previous_lon = 0
+    for lat, lon in zip(lats, lons):
+        lat, lon = round(lat * LATLON_SCALE), round(lon * LATLON_SCALE)
+        _append_signed(chunks, lat - previous_lat)
+        _append_signed(chunks, lon - previous_lon)
+        previous_lat, previous_lon = lat, lon
+    return ''.join(chunks)
+
+
+def decode_polyline(encoded):
+    """(lats, lons) of a Google encoded polyline (precision 5)"""
+    deltas = list(_read_signed(encoded))
+    lats = _running_sum(deltas[0::2])
+    lons = _running_sum(deltas[1::2])
+    return [v / LATLON_SCALE for v in lats], [v / LATLON_SCALE for v in lons]
+
+
+def encode_track(points):
+    """Compact payload for rows with id, lat, lon, odometer_km, trip_date and accuracy"""
+    return {
+        'format': 'polyline5',
+        'count': len(points),
+        'path': encode_polyline([p.lat for p in points], [p.lon for p in points]),
+        'id': encode_values(p.id for p in points),
+        'time_ms': encode_values((p.trip_date - EPOCH) // timedelta(milliseconds=1) for p in points),
+        'odometer_m': encode_values(round((p.odometer_km or 0.0) * ODOMETER_SCALE) for p in points),
+        # Whole meters; -1 stands for unknown
+        'accuracy_m': encode_values(-1 if p.accuracy is None else round(p.accuracy) for p in points),
+    }
+
+
+def decode_track(payload):
+    """Point dicts in the JSON format of GET /api/location, from encode_track output"""
+    lats, lons = decode_polyline(payload['path'])
+    ids = decode_values(payload['id'])
+    times = decode_values(payload['time_ms'])
+    odometers = decode_values(payload['odometer_m'])
+    accuracies = decode_values(payload['accuracy_m'])
+    return [{
+        'id': ids[i],
+        'lat': lats[i],
+        'lon': lons[i],
+        'odometer_km': odometers[i] / ODOMETER_SCALE,
+        'date': (EPOCH + timedelta(milliseconds=times[i])).isoformat(),
+        'accuracy': None if accuracies[i] < 0 else float(accuracies[i]),
+    } for i in range(payload['count'])]
@@ -1,13 +1,20 @@
-from flask import Blueprint, jsonify, render_template, redirect, url_for, flash, request, send_from_directory
+from flask import Blueprint, Response, current_app, jsonify, render_template, redirect, url_for, flash, request, send_from_directory, stream_with_context
 from flask_babel import gettext as _
 from app import db
-from app.models import FillUp, TriPoint, Vehicle, User
+from app.models import FillUp, TriPoint, Vehicle, User, UserFuelStats, TankState, UserTripStats, Trip, HeatmapCell, UserDataVersion, FillUpInterval, OdometerCalibration, TriPointRollup
+from app.cache import admin_stats, last_points
+from app.ingest import ingest_totals
+from app.writer import point_writer
+from app.events import stats_events
+from app import geo, ingest, polyline
 from app.forms import FillUpForm, VehicleSettingsForm, LoginForm, RegisterForm, AdminPasswordResetForm
-from datetime import datetime
+from datetime import datetime, timezone
+import queue
+import time
  
-import math
 from flask_login import login_user, logout_user, current_user, login_required
 from functools import wraps
+import json
 
 # Create a blueprint (think of it as a mini-app)
 main = Blueprint('main', __name__)
@@ -22,21 +29,61 @@ def admin_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def data_etag(*kinds, variant=None, vary=()):
+    """Conditional GET keyed on the user's UserDataVersion counters.
+
+    kinds names the counters the response depends on ('points',
+    'fillups'). The ETag is built from them before the view runs, so a
+    matching If-None-Match gets 304 after a single primary-key lookup.
+    variant, if given, returns a tag for representations of the same URL
+    that differ by request header (listed in vary).
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            points_version, fillups_version = UserDataVersion.get_versions(current_user.id)
+            parts = [str(current_user.id)]
+            if 'points' in kinds:
+                parts.append(f'p{points_version}')
+            if 'fillups' in kinds:
+                parts.append(f'f{fillups_version}')
+            tag = variant() if variant else None
+            if tag:
+                parts.append(tag)
+            etag = '-'.join(parts)
+
+            if request.if_none_match.contains_weak(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            # Weak: the body is equivalent, not byte-identical (compression, key order)
+            response.set_etag(etag, weak=True)
+            # Cacheable by the browser only, and always revalidated
+            response.headers['Cache-Control'] = 'private, no-cache'
+            for header in vary:
+                response.vary.add(header)
+            return response
+        return decorated_function
+    return decorator
+
 @main.route('/')
 @login_required
 def index():
     """Home page route"""
-    # Get some basic stats for the homepage
-    total_fillups = FillUp.query.filter_by(user_id=current_user.id).count()
-    total_spent = FillUp.get_total_spent(current_user.id)
-    average_efficiency = FillUp.get_average_efficiency(current_user.id)
-    
-    # Get current fuel status and predictions
-    fuel_status = FillUp.get_current_fuel_status(current_user.id)
+    # Get some basic stats for the homepage from the per-user snapshot
+    stats = UserFuelStats.get_snapshot(current_user.id)
+    total_fillups = stats.fillup_count
+    total_spent = stats.total_spent
+    average_efficiency = stats.average_efficiency
     
     # Get vehicle settings
     vehicle = Vehicle.get_current_vehicle(current_user.id)
     
+    # Get current fuel status and predictions
+    fuel_status = FillUp.get_current_fuel_status(current_user.id, vehicle)
+    
     return render_template('index.html', 
                          total_fillups=total_fillups,
                          total_spent=total_spent,
@@ -58,9 +105,12 @@ def register():
             user = User(license_number=form.license_number.data)
             user.set_password(form.password.data)
             db.session.add(user)
+            db.session.flush()
+            # No fill-ups yet, so the snapshot starts at zero
+            db.session.add(UserFuelStats(user_id=user.id, **dict.fromkeys(UserFuelStats.SUMMED_COLUMNS, 0)))
+            # Create the default vehicle here so read paths never have to
+            db.session.add(Vehicle(user_id=user.id))
             db.session.commit()
-            # Ensure a default vehicle exists for this user
-            Vehicle.get_current_vehicle(user.id)
             flash(_('Бүртгэл үүсгэгдлээ. Одоо нэвтэрч болно.'), 'success')
             return redirect(url_for('main.login'))
     return render_template('register.html', form=form)
@@ -99,6 +149,8 @@ def add_fillup():
     form = FillUpForm()
     
     if form.validate_on_submit():
+        vehicle = Vehicle.get_current_vehicle(current_user.id)
+        
         # Calculate total cost
         total_cost = form.fuel_liters.data * form.price_per_liter.data
         
@@ -108,8 +160,6 @@ def add_fillup():
         # Calculate fuel_before_fillup automatically if not provided
         fuel_before_fillup = form.fuel_before_fillup.data
         if fuel_before_fillup is None and previous_fillup:
-            # Get vehicle for efficiency calculation
-            vehicle = Vehicle.get_current_vehicle(current_user.id)
             efficiency = FillUp.get_average_efficiency(current_user.id)
             
             if efficiency and previous_fillup:
@@ -121,7 +171,7 @@ def add_fillup():
                     fuel_consumed = (efficiency / 100.0) * distance_km
                     
                     # Get fuel level after the previous fill-up
-                    fuel_after_prev = previous_fillup.get_fuel_after_fillup()
+                    fuel_after_prev = previous_fillup.get_fuel_after_fillup(vehicle)
                     
                     # Calculate remaining fuel before this fill-up
                     calculated_fuel_before = max(0.0, fuel_after_prev - fuel_consumed)
@@ -143,10 +193,17 @@ def add_fillup():
         try:
             # Add to database
             db.session.add(fillup)
+            db.session.flush()
+            
+            # Update stored efficiency of this fill-up and the one after it
+            interval_delta = FillUp.refresh_stored_efficiency(current_user.id, fillup.odometer_km, vehicle.tank_capacity_liters)
+            UserFuelStats.record_fillup(fillup, interval_delta)
+            FillUpInterval.record_fillup(fillup)
+            TankState.refresh(current_user.id, vehicle)
             db.session.commit()
             
             # Calculate efficiency if possible
-            efficiency = fillup.calculate_efficiency()
+            efficiency = fillup.efficiency_l_per_100km
             if efficiency:
                 flash(_('Цэнэглэлт амжилттай нэмэгдлээ! Шатахууны хэрэглээ: %(efficiency).1f л/100км', efficiency=efficiency), 'success')
             else:
@@ -169,7 +226,8 @@ def history():
     fillups = FillUp.query.filter_by(user_id=current_user.id).order_by(FillUp.odometer_km.asc()).all()
     
     # Get current fuel status for display
-    current_fuel_level = FillUp.get_current_fuel_level(current_user.id)
+    vehicle = Vehicle.get_current_vehicle(current_user.id)
+    current_fuel_level = FillUp.get_current_fuel_level(current_user.id, vehicle)
     
     return render_template('history.html', 
                          fillups=fillups,
@@ -179,80 +237,52 @@ def history():
 @login_required
 def charts():
     """Display charts and analytics"""
-    fillups = FillUp.query.filter_by(user_id=current_user.id).order_by(FillUp.date.asc()).all()
+    import calendar
+    
+    # Totals and monthly series are aggregated in the database, so the cost
+    # depends on the number of months rather than the number of fill-ups
+    summary = FillUp.get_chart_summary(current_user.id)
     
-    if len(fillups) < 2:
+    if summary['fillup_count'] < 2:
         return render_template('charts.html', 
-                         fillups=fillups,
+                         fillup_count=summary['fillup_count'],
                          spending_labels=[], spending_data=[],
                          efficiency_labels=[], efficiency_data=[],
                          volume_labels=[], volume_data=[])
     
-    # Process data for charts
-    from datetime import datetime
-    import calendar
-    from collections import defaultdict
-    
-    # Group data by month
-    monthly_spending = defaultdict(float)
-    monthly_volume = defaultdict(float)
-    monthly_efficiency = []
-    
-    for fillup in fillups:
-        month_key = fillup.date.strftime('%Y-%m')
-        monthly_spending[month_key] += fillup.total_cost
-        monthly_volume[month_key] += fillup.fuel_liters
-    
-    # Calculate efficiency for each fillup
-    efficiency_labels = []
-    efficiency_data = []
-    
-    for i, fillup in enumerate(fillups):
-        if i > 0: # Skip first fillup as it has no previous reference
-            efficiency = fillup.calculate_efficiency()
-            if efficiency:
-                efficiency_labels.append(fillup.date.strftime('%Y-%m-%d'))
-                efficiency_data.append(round(efficiency, 2))
-    
-    # Prepare spending chart data
     spending_labels = []
     spending_data = []
-    
-    for month_key in sorted(monthly_spending.keys()):
-        year, month = month_key.split('-')
-        month_name = calendar.month_abbr[int(month)] + ' ' + year
-        spending_labels.append(month_name)
-        spending_data.append(round(monthly_spending[month_key], 2))
-    
-    # Prepare volume chart data
     volume_labels = []
     volume_data = []
+    efficiency_labels = []
+    efficiency_data = []
     
-    for month_key in sorted(monthly_volume.keys()):
-        year, month = month_key.split('-')
-        month_name = calendar.month_abbr[int(month)] + ' ' + year
+    for month in FillUp.get_monthly_totals(current_user.id):
+        year, month_number = month['month'].split('-')
+        month_name = calendar.month_abbr[int(month_number)] + ' ' + year
+        
+        spending_labels.append(month_name)
+        spending_data.append(round(month['spent'], 2))
         volume_labels.append(month_name)
-        volume_data.append(round(monthly_volume[month_key], 1))
-    
-    # Calculate statistics
-    efficiencies = [e for e in efficiency_data if e]
-    best_efficiency = min(efficiencies) if efficiencies else 0
-    worst_efficiency = max(efficiencies) if efficiencies else 0
-    avg_price = sum(f.price_per_liter for f in fillups) / len(fillups)
-    total_distance = fillups[-1].odometer_km - fillups[0].odometer_km if len(fillups) > 1 else 0
+        volume_data.append(round(month['liters'], 1))
+        
+        # Monthly average of the stored per-fill-up efficiency
+        if month['efficiency']:
+            efficiency_labels.append(month_name)
+            efficiency_data.append(round(month['efficiency'], 2))
     
     return render_template('charts.html',
-                         fillups=fillups,
+                         fillup_count=summary['fillup_count'],
                          spending_labels=spending_labels,
                          spending_data=spending_data,
                          efficiency_labels=efficiency_labels,
                          efficiency_data=efficiency_data,
                          volume_labels=volume_labels,
                          volume_data=volume_data,
-                         best_efficiency=best_efficiency,
-                         worst_efficiency=worst_efficiency,
-                         avg_price=avg_price,
-                         total_distance=total_distance)
+                         best_efficiency=summary['best_efficiency'],
+                         worst_efficiency=summary['worst_efficiency'],
+                         avg_price=summary['avg_price'],
+                         total_distance=summary['total_distance'])
 
 @main.route('/range_predictor', methods=['GET', 'POST'])
 @login_required
@@ -272,7 +302,7 @@ def range_predictor():
     # Calculate efficiency stats
     efficiencies = []
     for i in range(1, len(fillups)):
-        efficiency = fillups[i].calculate_efficiency()
+        efficiency = fillups[i].efficiency_l_per_100km
         if efficiency:
             efficiencies.append(efficiency)
     
@@ -314,7 +344,16 @@ def delete_fillup(id):
     fillup = FillUp.query.filter_by(id=id, user_id=current_user.id).first_or_404()
     
     try:
+        # Before the flush, so no interval still points at the deleted row
+        FillUpInterval.record_fillup(fillup, removed=True)
         db.session.delete(fillup)
+        db.session.flush()
+        
+        # Neighbours of the deleted fill-up now pair with a different row
+        vehicle = Vehicle.get_current_vehicle(current_user.id)
+        interval_delta = FillUp.refresh_stored_efficiency(current_user.id, fillup.odometer_km, vehicle.tank_capacity_liters)
+        UserFuelStats.record_fillup(fillup, interval_delta, removed=True)
+        TankState.refresh(current_user.id, vehicle)
         db.session.commit()
         flash(_('%(date)s-ны цэнэглэлт амжилттай устгагдлаа.', date=fillup.date.strftime("%Y-%m-%d")), 'success')
     except Exception as e:
@@ -333,10 +372,20 @@ def vehicle_settings():
     if form.validate_on_submit():
         try:
             # Update vehicle settings
+            capacity_changed = vehicle.tank_capacity_liters != form.tank_capacity_liters.data
             vehicle.name = form.name.data
             vehicle.fuel_type = form.fuel_type.data
             vehicle.tank_capacity_liters = form.tank_capacity_liters.data
             vehicle.updated_at = datetime.utcnow()
+            if vehicle.id is None:
+                # Users created before registration saved a default vehicle
+                db.session.add(vehicle)
+            
+            # Tank capacity caps every stored efficiency of this user
+            if capacity_changed:
+                FillUp.refresh_all_stored_efficiency(current_user.id, vehicle.tank_capacity_liters)
+                UserFuelStats.refresh_best_efficiency(current_user.id)
+                TankState.refresh(current_user.id, vehicle)
             
             db.session.commit()
             flash(_('Машины тохиргоо амжилттай шинэчлэгдлээ!'), 'success')
@@ -354,82 +403,172 @@ def vehicle_settings():
     
     return render_template('vehicle_settings.html', form=form, vehicle=vehicle)
 
-@main.route("/api/location", methods=["POST"])
-@login_required
-def save_location():
-    """Save location to database"""
-    data = request.json
+def parse_location(data):
+    """Validate one posted GPS fix; returns a point dict or None if unusable"""
+    if not isinstance(data, dict):
+        return None
     lat = data.get("lat")
     lon = data.get("lon")
-    accuracy = data.get("accuracy")
-    timestamp_iso = data.get("timestamp")
-
     if lat is None or lon is None:
-        return jsonify({"error": "Missing required fields"}), 400
+        return None
 
     # Determine timestamp
+    timestamp_iso = data.get("timestamp")
     try:
         date_value = datetime.fromisoformat(timestamp_iso) if timestamp_iso else datetime.utcnow()
     except Exception:
         date_value = datetime.utcnow()
+    # Stored naive in UTC, like datetime.utcnow()
+    if date_value.tzinfo is not None:
+        date_value = date_value.astimezone(timezone.utc).replace(tzinfo=None)
 
-    # Compute odometer based on last point distance if available
-    last_point = TriPoint.query.filter_by(user_id=current_user.id).order_by(TriPoint.trip_date.desc()).first()
-
-    def haversine_km(lat1, lon1, lat2, lon2):
-        """Calculate distance between two lat/lon points in kilometers"""
-        R = 6371.0
-        dlat = math.radians(lat2 - lat1)
-        dlon = math.radians(lon2 - lon1)
-        a = (
-            math.sin(dlat / 2) ** 2
-            + math.cos(math.radians(lat1))
-            * math.cos(math.radians(lat2))
-            * math.sin(dlon / 2) ** 2
-        )
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-        return R * c
-
-    if last_point:
-        incremental_km = haversine_km(last_point.lat, last_point.lon, lat, lon)
-        # Treat tiny GPS jitter as zero movement (increased threshold for better accuracy)
-        if incremental_km < 0.005:  # 5 meters threshold
-            incremental_km = 0.0
-        odometer_km = (last_point.odometer_km or 0.0) + incremental_km
-    else:
-        odometer_km = 0.0
-    
-    # Create point with enhanced data
-    point = TriPoint(
-        user_id=current_user.id, 
-        lat=lat, 
-        lon=lon, 
-        odometer_km=odometer_km, 
-        trip_date=date_value
-    )
-    
-    # Store accuracy if provided
-    if accuracy is not None:
-        point.accuracy = accuracy
-    
-    db.session.add(point)
+    return {"lat": lat, "lon": lon, "accuracy": data.get("accuracy"), "trip_date": date_value}
+
+
+@main.route("/api/location", methods=["POST"])
+@login_required
+def save_location():
+    """Save location to database"""
+    location = parse_location(request.json)
+    if location is None:
+        return jsonify({"error": "Missing required fields"}), 400
+    if point_writer.enabled:
+        return enqueue_locations([location])
+
+    last_point = last_points.get(current_user.id)
+    start_km = (last_point.odometer_km or 0.0) if last_point else 0.0
+    points, context = ingest.run([location], last_point, current_app.config)
+    rows = TriPoint.bulk_insert(current_user.id, points, last_point, context.anchor_dwell_until)
     db.session.commit()
-    
-    return jsonify({
+    report = ingest.report(1, points, context)
+    ingest_totals.add(report)
+    if not rows:
+        # Filtered out, or folded into the previous fix as dwell time
+        return jsonify(dict(report, message="Location filtered", point_id=None,
+                            odometer_km=start_km, incremental_km=0.0))
+
+    return jsonify(dict(report, **{
         "message": "Location saved successfully",
-        "point_id": point.id,
+        "point_id": rows[0]["id"],
+        "odometer_km": rows[0]["odometer_km"],
+        "incremental_km": rows[0]["odometer_km"] - start_km
+    })), 201
+
+@main.route("/api/location/batch", methods=["POST"])
+@login_required
+def save_location_batch():
+    """Save an ordered array of buffered locations in one transaction"""
+    data = request.json
+    raw_points = data.get("points") if isinstance(data, dict) else data
+    if not isinstance(raw_points, list) or not raw_points:
+        return jsonify({"error": "Expected a non-empty array of points"}), 400
+
+    max_points = current_app.config['LOCATION_BATCH_MAX_POINTS']
+    if len(raw_points) > max_points:
+        return jsonify({"error": f"At most {max_points} points per batch"}), 413
+
+    points = [parse_location(raw) for raw in raw_points]
+    invalid = [i for i, point in enumerate(points) if point is None]
+    if invalid:
+        return jsonify({"error": "Missing required fields", "invalid_indexes": invalid}), 400
+    if point_writer.enabled:
+        return enqueue_locations(points)
+
+    last_point = last_points.get(current_user.id)
+    start_km = (last_point.odometer_km or 0.0) if last_point else 0.0
+    received = len(points)
+    points, context = ingest.run(points, last_point, current_app.config)
+    rows = TriPoint.bulk_insert(current_user.id, points, last_point, context.anchor_dwell_until)
+    db.session.commit()
+    report = ingest.report(received, points, context)
+    ingest_totals.add(report)
+
+    odometer_km = rows[-1]["odometer_km"] if rows else start_km
+    return jsonify(dict(report, **{
+        "message": "Locations saved successfully",
         "odometer_km": odometer_km,
-        "incremental_km": incremental_km if 'incremental_km' in locals() else 0.0
-    }), 201
+        "incremental_km": odometer_km - start_km
+    })), 201
+
+def enqueue_locations(points):
+    """Write-behind mode: hand validated points to the background writer"""
+    if not point_writer.submit(current_user.id, points):
+        return jsonify({"error": "Too many queued locations, retry later"}), 503, {"Retry-After": "1"}
+    return jsonify({"message": "Locations queued", "queued": len(points)}), 202
+
 
 @main.route("/api/location", methods=["GET"])
 @login_required
+@data_etag('points', variant=lambda: 'c' if wants_compact_track() else None, vary=('Accept',))
 def get_location():
-    """Get location from database"""
-    limit = request.args.get("limit", type=int) or 500
-    points = TriPoint.query.filter_by(user_id=current_user.id).order_by(TriPoint.trip_date.desc()).limit(limit).all()
-    # Return in chronological order
-    points = list(reversed(points))
+    """Get location from database.
+
+    Optional since/until (ISO datetimes) restrict the time range and
+    bbox=west,south,east,north the area, read through the geohash index. With
+    ?tolerance_m= or ?zoom= the range (at most its latest
+    TRACK_SIMPLIFY_MAX_SOURCE_POINTS points) is simplified (Douglas-Peucker)
+    down to the points needed at that resolution, capped at
+    TRACK_SIMPLIFY_MAX_POINTS; otherwise the latest `limit` raw points are
+    returned. Clients that accept polyline.MIMETYPE (or pass
+    ?format=polyline) get the compact encoded-polyline payload. Full
+    history is read page by page through /api/location/export.
+    """
+    try:
+        since = parse_time_arg("since")
+        until = parse_time_arg("until")
+    except ValueError:
+        return jsonify({"error": "since/until must be ISO datetimes"}), 400
+    try:
+        bbox = parse_bbox_arg()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    tolerance_m = request.args.get("tolerance_m", type=float)
+    zoom = request.args.get("zoom", type=int)
+
+    query = db.session.query(
+        TriPoint.id, TriPoint.lat, TriPoint.lon, TriPoint.odometer_km, TriPoint.trip_date, TriPoint.accuracy
+    ).filter(TriPoint.user_id == current_user.id)
+    if since:
+        query = query.filter(TriPoint.trip_date >= since)
+    if until:
+        query = query.filter(TriPoint.trip_date <= until)
+    columns = TriPoint
+    if bbox:
+        # Materialized so the planner reads the viewport's cells first
+        # instead of walking the whole history in trip_date order
+        viewport = TriPoint.filter_bbox(query, *bbox).cte("viewport").prefix_with("MATERIALIZED")
+        query = db.session.query(viewport)
+        columns = viewport.c
+
+    headers = {}
+    if tolerance_m is not None or zoom is not None:
+        # Newest first so an over-long range keeps its most recent part
+        max_source = current_app.config['TRACK_SIMPLIFY_MAX_SOURCE_POINTS']
+        points = query.order_by(columns.trip_date.desc(), columns.id.desc()).limit(max_source + 1).all()
+        if len(points) > max_source:
+            headers["X-Track-Source-Truncated"] = "1"
+        points = list(reversed(points[:max_source]))
+        if points:
+            lats = [p.lat for p in points]
+            lons = [p.lon for p in points]
+            if tolerance_m is None:
+                # One screen pixel at this zoom, at the track's latitude
+                tolerance_m = geo.meters_per_pixel(min(max(zoom, 0), 22), lats[0])
+            indexes, tolerance_m = geo.simplify_bounded(
+                lats, lons, tolerance_m, current_app.config['TRACK_SIMPLIFY_MAX_POINTS']
+            )
+            headers.update({"X-Track-Source-Points": str(len(points)), "X-Track-Tolerance-M": f"{tolerance_m:.2f}"})
+            points = [points[i] for i in indexes]
+    else:
+        limit = request.args.get("limit", type=int) or 500
+        points = query.order_by(columns.trip_date.desc()).limit(limit).all()
+        # Return in chronological order
+        points = list(reversed(points))
+
+    headers["Vary"] = "Accept"
+    if wants_compact_track():
+        return jsonify(polyline.encode_track(points)), 200, dict(headers, **{"Content-Type": polyline.MIMETYPE})
+
     return jsonify([
         {
             "id": p.id,
@@ -437,29 +576,163 @@ def get_location():
             "lon": p.lon,
             "odometer_km": p.odometer_km,
             "date": p.trip_date.isoformat(),
-            "accuracy": getattr(p, 'accuracy', None)
+            "accuracy": p.accuracy
         }
         for p in points
-    ])
+    ]), 200, headers
+
+
+@main.route("/api/location/export", methods=["GET"])
+@login_required
+def export_locations():
+    """Stream the track oldest-first as NDJSON, one point per line.
+
+    Paged by keyset on (trip_date, id): pass the `next_cursor` of a
+    previous response as ?after= to continue. since/until bound the time
+    range and ?limit= caps the page; when a capped page has more points
+    behind it, the last line is {"next_cursor": ...}. Rows come from a
+    server-side cursor in chunks, so memory stays flat for any track size.
+    """
+    try:
+        since = parse_time_arg("since")
+        until = parse_time_arg("until")
+        after = TriPoint.parse_cursor(request.args.get("after"))
+    except ValueError:
+        return jsonify({"error": "since/until must be ISO datetimes and after a cursor from a previous page"}), 400
+    limit = request.args.get("limit", type=int)
+
+    rows = TriPoint.iter_track(current_user.id, since=since, until=until, after=after,
+                               limit=limit + 1 if limit else None,
+                               chunk_size=current_app.config['TRACK_EXPORT_CHUNK_SIZE'])
+
+    def generate():
+        sent = 0
+        last = None
+        for p in rows:
+            if limit and sent == limit:
+                yield json.dumps({"next_cursor": TriPoint.make_cursor(last)}) + "\n"
+                return
+            yield json.dumps({
+                "id": p.id,
+                "lat": p.lat,
+                "lon": p.lon,
+                "odometer_km": p.odometer_km,
+                "date": p.trip_date.isoformat(),
+                "accuracy": p.accuracy,
+                "dwell_until": p.dwell_until.isoformat() if p.dwell_until else None
+            }) + "\n"
+            sent += 1
+            last = p
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+
+def wants_compact_track():
+    """True if the client asked for the encoded-polyline track format"""
+    if request.args.get("format") == "polyline":
+        return True
+    # Browsers send */*, which prefers neither; only an explicit preference counts
+    accept = request.accept_mimetypes
+    return accept.quality(polyline.MIMETYPE) > accept.quality("application/json")
+
+
+def parse_bbox_arg():
+    """(south, west, north, east) from ?bbox=west,south,east,north (degrees),
+    None if absent; ValueError if malformed
+    """
+    value = request.args.get("bbox")
+    if not value:
+        return None
+    try:
+        west, south, east, north = (float(part) for part in value.split(","))
+    except ValueError:
+        raise ValueError("bbox must be west,south,east,north")
+    if not (-90 <= south <= north <= 90 and -180 <= west <= 180 and -180 <= east <= 180):
+        raise ValueError("bbox is out of range")
+    if west > east:
+        raise ValueError("bbox must not cross the antimeridian")
+    return south, west, north, east
+
+
+def parse_time_arg(name):
+    """Naive-UTC datetime from an ISO query argument, None if absent; ValueError if malformed"""
+    value = request.args.get(name)
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+@main.route("/api/heatmap", methods=["GET"])
+@login_required
+def heatmap():
+    """Point counts per geohash cell inside ?bbox=west,south,east,north.
+
+    The cell size follows ?zoom= (or an explicit ?precision= from
+    HeatmapCell.PRECISIONS). Counts are kept up to date on ingest, so no
+    points are read. Admins can pass ?scope=fleet for all users.
+    """
+    try:
+        bbox = parse_bbox_arg()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if bbox is None:
+        return jsonify({"error": "bbox is required"}), 400
+    south, west, north, east = bbox
+
+    precision = request.args.get("precision", type=int)
+    if precision is None:
+        zoom = min(max(request.args.get("zoom", 12, type=int), 0), 22)
+        precision = HeatmapCell.precision_for_zoom(zoom, (south + north) / 2)
+    elif precision not in HeatmapCell.PRECISIONS:
+        return jsonify({"error": f"precision must be one of {list(HeatmapCell.PRECISIONS)}"}), 400
+
+    fleet = request.args.get("scope") == "fleet"
+    if fleet and not current_user.is_admin:
+        return jsonify({"error": "Admin access required"}), 403
+
+    cells = HeatmapCell.get_cells(precision, south, west, north, east, user_id=None if fleet else current_user.id)
+    result = []
+    for cell, count in cells:
+        cell_south, cell_west, cell_north, cell_east = geo.geohash_bounds(cell)
+        result.append({
+            "cell": cell,
+            "lat": (cell_south + cell_north) / 2,
+            "lon": (cell_west + cell_east) / 2,
+            "count": count
+        })
+    return jsonify({"precision": precision, "scope": "fleet" if fleet else "user", "cells": result})
 
 
 @main.route('/map')
 @login_required
 def map_view():
     """Render the tracking map view"""
-    return render_template('map.html')
+    return render_template('map.html', stats_stream=current_app.config['STATS_STREAM_ENABLED'])
 
 
 @main.route('/api/trips/stats', methods=['GET'])
 @login_required
+@data_etag('points', 'fillups')
 def trips_stats():
-    """Return aggregate movement vs idle time and fuel estimates"""
-    # Fetch recent points
-    limit = request.args.get("limit", type=int) or 2000
-    points = TriPoint.query.filter_by(user_id=current_user.id).order_by(TriPoint.trip_date.desc()).limit(limit).all()
-    points = list(reversed(points))
+    """Return aggregate movement vs idle time and fuel estimates.
+
+    By default the running totals kept in UserTripStats are returned without
+    reading any points. ?limit=N recomputes them over the last N points.
+    """
+    limit = request.args.get("limit", type=int)
+    if not limit:
+        return jsonify(running_trip_stats(current_user.id))
 
-    if len(points) < 2:
+    # Windowed mode: fetch recent points (columns only)
+    rows = db.session.query(TriPoint.lat, TriPoint.lon, TriPoint.trip_date).filter(
+        TriPoint.user_id == current_user.id
+    ).order_by(TriPoint.trip_date.desc()).limit(limit).all()
+    rows.reverse()
+
+    if len(rows) < 2:
         return jsonify({
             "total_distance_km": 0.0,
             "moving_time_minutes": 0.0,
@@ -468,67 +741,39 @@ def trips_stats():
             "moving_fuel_liters": 0.0,
             "total_fuel_liters": 0.0,
             "total_points": 0,
-            "last_update": None
+            "last_update": None,
+            "mode": "window"
         })
 
-    def haversine_km(lat1, lon1, lat2, lon2):
-        R = 6371.0
-        dlat = math.radians(lat2 - lat1)
-        dlon = math.radians(lon2 - lon1)
-        a = (
-            math.sin(dlat / 2) ** 2
-            + math.cos(math.radians(lat1))
-            * math.cos(math.radians(lat2))
-            * math.sin(dlon / 2) ** 2
-        )
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-        return R * c
-
-    total_distance_km = 0.0
-    moving_time_seconds = 0.0
-    idle_time_seconds = 0.0
-    max_speed_kmh = 0.0
-    avg_speed_kmh = 0.0
-    speed_samples = 0
-
-    # Thresholds
-    speed_threshold_kmh = 2.0  # below this is considered idle
-    jitter_distance_km = 0.005  # ignore GPS noise (5 meters)
-
-    for i in range(1, len(points)):
-        p1 = points[i - 1]
-        p2 = points[i]
-        dt = (p2.trip_date - p1.trip_date).total_seconds()
-        if dt <= 0:
-            continue
-        d_km = haversine_km(p1.lat, p1.lon, p2.lat, p2.lon)
-        if d_km < jitter_distance_km:
-            d_km = 0.0
-        total_distance_km += d_km
-        
-        if d_km > 0 and dt > 0:
-            speed_kmh = (d_km / dt) * 3600.0
-            if speed_kmh >= speed_threshold_kmh:
-                moving_time_seconds += dt
-                max_speed_kmh = max(max_speed_kmh, speed_kmh)
-                avg_speed_kmh += speed_kmh
-                speed_samples += 1
-            else:
-                idle_time_seconds += dt
+    lats, lons, dates = zip(*rows)
+    movement = UserTripStats.summarize(lats, lons, dates)
+    return jsonify(trip_stats_payload(current_user.id, movement['distance_km'], movement['moving_seconds'],
+                                      movement['idle_seconds'], movement['max_speed_kmh'],
+                                      movement['avg_speed_kmh'], len(rows), dates[-1], "window"))
 
-    # Calculate average speed
-    if speed_samples > 0:
-        avg_speed_kmh = avg_speed_kmh / speed_samples
 
+def running_trip_stats(user_id):
+    """/api/trips/stats payload from the stored running totals, with the current GPS odometer"""
+    stats = UserTripStats.get_stats(user_id)
+    payload = trip_stats_payload(user_id, stats.total_distance_km, stats.moving_seconds, stats.idle_seconds,
+                                 stats.max_speed_kmh, stats.avg_speed_kmh, stats.point_count,
+                                 stats.last_point_date, "running")
+    last_point = last_points.get(user_id)
+    payload["odometer_km"] = round(last_point.odometer_km, 3) if last_point else 0.0
+    return payload
+
+
+def trip_stats_payload(user_id, total_distance_km, moving_time_seconds, idle_time_seconds,
+                       max_speed_kmh, avg_speed_kmh, total_points, last_update, mode):
     # Fuel estimates using user's actual efficiency
-    avg_eff_l_per_100km = FillUp.get_average_efficiency(current_user.id) or 10.0  # default
+    avg_eff_l_per_100km = FillUp.get_average_efficiency(user_id) or 10.0  # default
     moving_fuel_liters = (avg_eff_l_per_100km / 100.0) * total_distance_km
 
     # Idle fuel consumption (can be customized per user)
     idle_fuel_lph = 0.8  # default idle fuel consumption liters/hour
     idle_fuel_liters = idle_fuel_lph * (idle_time_seconds / 3600.0)
 
-    return jsonify({
+    return {
         "total_distance_km": round(total_distance_km, 3),
         "moving_time_minutes": round(moving_time_seconds / 60.0, 1),
         "idle_time_minutes": round(idle_time_seconds / 60.0, 1),
@@ -537,117 +782,151 @@ def trips_stats():
         "total_fuel_liters": round(idle_fuel_liters + moving_fuel_liters, 2),
         "max_speed_kmh": round(max_speed_kmh, 1),
         "avg_speed_kmh": round(avg_speed_kmh, 1),
-        "total_points": len(points),
-        "last_update": points[-1].trip_date.isoformat() if points else None,
-        "efficiency_l_per_100km": round(avg_eff_l_per_100km, 1)
-    })
+        "total_points": total_points,
+        "last_update": last_update.isoformat() if last_update else None,
+        "efficiency_l_per_100km": round(avg_eff_l_per_100km, 1),
+        "mode": mode
+    }
+
+
+@main.route('/api/trips/stream', methods=['GET'])
+@login_required
+def trips_stats_stream():
+    """Server-Sent Events: the running /api/trips/stats payload (plus
+    odometer_km) as a "stats" event, sent on connect and again whenever
+    new points for the user are committed.
+
+    Notifications come from this process; every
+    STATS_STREAM_KEEPALIVE_SECONDS the stored totals are also re-checked
+    (one primary-key read) for points ingested by other workers, and a
+    comment line keeps proxies from timing the stream out. The stream
+    ends after STATS_STREAM_MAX_SECONDS and EventSource reconnects, so a
+    worker is never held by one tab indefinitely. Disabled (404) unless
+    STATS_STREAM_ENABLED is set.
+    """
+    if not current_app.config['STATS_STREAM_ENABLED']:
+        return jsonify({"error": "Stats stream is disabled"}), 404
+    user_id = current_user.id
+    keepalive = current_app.config['STATS_STREAM_KEEPALIVE_SECONDS']
+    max_seconds = current_app.config['STATS_STREAM_MAX_SECONDS']
+    subscription = stats_events.subscribe(user_id)
+
+    def stats_version():
+        stats = db.session.get(UserTripStats, user_id)
+        return (stats.point_count, stats.updated_at) if stats else None
+
+    def event(payload):
+        return f"event: stats\ndata: {json.dumps(payload)}\n\n"
+
+    def generate():
+        try:
+            yield f"retry: {current_app.config['STATS_STREAM_RETRY_MS']}\n"
+            sent_version = stats_version()
+            yield event(running_trip_stats(user_id))
+            # Do not hold a connection while waiting
+            db.session.remove()
+            deadline = time.monotonic() + max_seconds
+            while time.monotonic() < deadline:
+                try:
+                    subscription.get(timeout=min(keepalive, max(deadline - time.monotonic(), 0)))
+                    changed = True
+                except queue.Empty:
+                    changed = stats_version() != sent_version
+                if changed:
+                    sent_version = stats_version()
+                    yield event(running_trip_stats(user_id))
+                else:
+                    yield ": keepalive\n\n"
+                db.session.remove()
+        finally:
+            stats_events.unsubscribe(user_id, subscription)
+
+    return Response(stream_with_context(generate()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 @main.route('/api/trips', methods=['POST'])
 @login_required
 def save_trip():
-    """Save completed trip data"""
-    data = request.json
-    
-    if not data or 'distance_km' not in data or 'duration_seconds' not in data:
-        return jsonify({"error": "Missing required trip data"}), 400
-    
-    # Here you could save trip data to a separate table
-    # For now, we'll just return success
-    trip_data = {
-        "user_id": current_user.id,
-        "start_time": data.get('start_time'),
-        "end_time": data.get('end_time'),
-        "distance_km": data.get('distance_km'),
-        "duration_seconds": data.get('duration_seconds'),
-        "fuel_consumed_liters": data.get('fuel_consumed_liters'),
-        "start_location": data.get('start_location'),
-        "end_location": data.get('end_location'),
-        "max_speed_kmh": data.get('max_speed_kmh'),
-        "avg_speed_kmh": data.get('avg_speed_kmh')
-    }
-    
-    # Log trip data (you could save this to database)
-    print(f"Trip completed: {trip_data}")
-    
+    """Close the trip in progress when tracking stops.
+
+    Trips are segmented on the server as points arrive, so the body is not
+    needed; the closed trip is returned as stored.
+    """
+    trip = Trip.close_open(current_user.id)
+    db.session.commit()
+    if trip is None:
+        return jsonify({"message": "No trip in progress", "trip_id": None, "data": None})
     return jsonify({
         "message": "Trip saved successfully",
-        "trip_id": f"trip_{datetime.utcnow().timestamp()}",
-        "data": trip_data
+        "trip_id": trip.id,
+        "data": trip.to_dict()
     }), 201
 
 
+@main.route('/api/trips', methods=['GET'])
+@login_required
+def list_trips():
+    """Trips newest first, ?limit=N per page; ?before=<start_time> continues"""
+    limit = min(max(request.args.get("limit", 20, type=int), 1), 100)
+    try:
+        before = parse_time_arg("before")
+    except ValueError:
+        return jsonify({"error": "before must be an ISO datetime"}), 400
+    trips = Trip.list_recent(current_user.id, before=before, limit=limit)
+    return jsonify({
+        "trips": [trip.to_dict() for trip in trips],
+        "next_before": trips[-1].start_time.isoformat() if len(trips) == limit else None
+    })
+
+
+@main.route('/api/trips/<int:trip_id>', methods=['GET'])
+@login_required
+def get_trip(trip_id):
+    trip = Trip.query.filter_by(id=trip_id, user_id=current_user.id).first()
+    if trip is None:
+        return jsonify({"error": "Trip not found"}), 404
+    return jsonify(trip.to_dict())
+
+
 @main.route('/api/motor_hour', methods=['GET'])
 @login_required
+@data_etag('points', 'fillups')
 def motor_hour_norm():
-    """Estimate engine idle consumption rate (liters/hour) between last two fill-ups.
+    """Estimate engine idle consumption rate (liters/hour) between two fill-ups.
 
     Approach:
-    - Use last two fill-ups to define interval [prev, curr].
-    - Compute distance and idle time from TriPoint samples within interval.
-    - Estimate total fuel consumed from curr.calculate_efficiency() and distance.
-    - Estimate moving baseline fuel using best historical efficiency.
+    - The interval is [previous fill-up, fill-up] by date: the latest one,
+      or the one ending at ?fillup_id=.
+    - Distance and idle time come from the stored FillUpInterval totals,
+      kept up to date as points arrive, so no GPS points are read.
+    - Estimate total fuel consumed from the closing fill-up's stored efficiency and distance.
+    - Estimate moving baseline fuel using the best historical efficiency (UserFuelStats).
     - idle_lph = max(total - moving_baseline, 0) / idle_hours.
     """
-    fillups = FillUp.query.filter_by(user_id=current_user.id).order_by(FillUp.date.asc()).all()
-    if len(fillups) < 2:
+    fillup_id = request.args.get("fillup_id", type=int)
+    interval = FillUpInterval.get_interval(current_user.id, fillup_id)
+    if interval is None:
+        if fillup_id is not None:
+            return jsonify({"error": "No interval ends at this fill-up"}), 404
         return jsonify({"error": "Not enough fill-ups"}), 400
-
-    prev = fillups[-2]
-    curr = fillups[-1]
-
-    # Points in window
-    points = TriPoint.query.filter(TriPoint.trip_date >= prev.date, TriPoint.trip_date <= curr.date, TriPoint.user_id == current_user.id).order_by(TriPoint.trip_date.asc()).all()
-    if len(points) < 2:
+    if interval.point_count < 2:
         return jsonify({"error": "Not enough GPS points in interval"}), 400
 
-    def haversine_km(lat1, lon1, lat2, lon2):
-        R = 6371.0
-        dlat = math.radians(lat2 - lat1)
-        dlon = math.radians(lon2 - lon1)
-        a = (
-            math.sin(dlat / 2) ** 2
-            + math.cos(math.radians(lat1))
-            * math.cos(math.radians(lat2))
-            * math.sin(dlon / 2) ** 2
-        )
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-        return R * c
-
-    distance_km = 0.0
-    idle_seconds = 0.0
-    speed_threshold_kmh = 2.0
-    jitter_km = 0.01
-
-    for i in range(1, len(points)):
-        p1, p2 = points[i - 1], points[i]
-        dt = (p2.trip_date - p1.trip_date).total_seconds()
-        if dt <= 0:
-            continue
-        d_km = haversine_km(p1.lat, p1.lon, p2.lat, p2.lon)
-        if d_km < jitter_km:
-            d_km = 0.0
-        distance_km += d_km
-        speed_kmh = (d_km / dt) * 3600.0
-        if speed_kmh < speed_threshold_kmh:
-            idle_seconds += dt
-
-    # Total consumed in interval using current fill efficiency
-    interval_eff = curr.calculate_efficiency()
+    distance_km = interval.distance_km
+    idle_seconds = interval.idle_seconds
+
+    # Total consumed in interval using the closing fill-up's efficiency
+    curr = db.session.get(FillUp, interval.end_fillup_id)
+    interval_eff = curr.efficiency_l_per_100km
     if not interval_eff:
         return jsonify({"error": "Cannot compute efficiency for interval"}), 400
     total_consumed_l = (interval_eff / 100.0) * max(distance_km, 0.0)
 
     # Baseline moving efficiency: best historical efficiency (lower is better)
-    all_fillups = FillUp.query.filter_by(user_id=current_user.id).order_by(FillUp.date.asc()).all()
-    efficiencies = []
-    for i in range(1, len(all_fillups)):
-        e = all_fillups[i].calculate_efficiency()
-        if e:
-            efficiencies.append(e)
-    if not efficiencies:
+    best_eff = UserFuelStats.get_snapshot(current_user.id).best_efficiency_l_per_100km
+    if not best_eff:
         return jsonify({"error": "No efficiency data available"}), 400
-    best_eff = min(efficiencies)
     moving_baseline_l = (best_eff / 100.0) * max(distance_km, 0.0)
 
     idle_liters = max(total_consumed_l - moving_baseline_l, 0.0)
@@ -655,8 +934,10 @@ def motor_hour_norm():
     idle_lph = (idle_liters / idle_hours) if idle_hours > 0 else None
 
     return jsonify({
-        "interval_start": prev.date.isoformat(),
-        "interval_end": curr.date.isoformat(),
+        "start_fillup_id": interval.start_fillup_id,
+        "end_fillup_id": interval.end_fillup_id,
+        "interval_start": interval.start_date.isoformat(),
+        "interval_end": interval.end_date.isoformat(),
         "distance_km": round(distance_km, 3),
         "idle_hours": round(idle_hours, 2),
         "total_consumed_liters": round(total_consumed_l, 2),
@@ -667,32 +948,28 @@ def motor_hour_norm():
 
 @main.route('/api/last_fillup')
 @login_required
+@data_etag('fillups')
 def api_last_fillup():
     """API endpoint to get last fillup data for fuel calculation"""
     try:
-        # Get the most recent fillup
-        latest_fillup = FillUp.query.filter_by(user_id=current_user.id).order_by(FillUp.odometer_km.desc()).first()
+        # The tank state holds the most recent fillup and average efficiency
+        vehicle = Vehicle.get_current_vehicle(current_user.id)
+        state = TankState.get_state(current_user.id, vehicle)
         
-        if not latest_fillup:
+        if not state:
             return jsonify({
                 'success': False,
                 'message': 'No fillups found'
             })
         
-        # Get average efficiency
-        average_efficiency = FillUp.get_average_efficiency(current_user.id)
-        
-        # Get fuel after the last fillup using the model method
-        fuel_after_fillup = latest_fillup.get_fuel_after_fillup()
-        
         return jsonify({
             'success': True,
             'last_fillup': {
-                'odometer_km': latest_fillup.odometer_km,
-                'fuel_after_fillup': fuel_after_fillup,
-                'date': latest_fillup.date.isoformat()
+                'odometer_km': state.last_fillup_odometer_km,
+                'fuel_after_fillup': state.fuel_after_fillup,
+                'date': state.last_fillup_date.isoformat()
             },
-            'average_efficiency': average_efficiency
+            'average_efficiency': state.efficiency_l_per_100km
         })
         
     except Exception as e:
@@ -707,7 +984,9 @@ def test_fuel_calculation():
     """Test route to demonstrate fuel calculation logic"""
     try:
         # Get current fuel status
-        fuel_status = FillUp.get_current_fuel_status(current_user.id)
+        vehicle = Vehicle.get_current_vehicle(current_user.id)
+        state = TankState.get_state(current_user.id, vehicle)
+        fuel_status = state.fuel_status(vehicle.tank_capacity_liters) if state else None
         
         if not fuel_status:
             return jsonify({
@@ -716,7 +995,7 @@ def test_fuel_calculation():
             })
         
         # Get the latest fillup for comparison
-        latest_fillup = FillUp.query.filter_by(user_id=current_user.id).order_by(FillUp.odometer_km.desc()).first()
+        latest_fillup = db.session.get(FillUp, state.last_fillup_id)
         
         return jsonify({
             'success': True,
@@ -748,27 +1027,36 @@ def test_fuel_calculation():
 @admin_required
 def admin_dashboard():
     """Admin dashboard"""
-    # Get statistics
-    total_users = User.query.count()
-    total_fillups = FillUp.query.count()
-    total_vehicles = Vehicle.query.count()
-    total_tripoints = TriPoint.query.count()
+    # Get cached statistics
+    counts = admin_stats.get_counts(current_app.config['ADMIN_STATS_TTL_SECONDS'],
+                                    current_app.config['ADMIN_STATS_ESTIMATED_TABLES'])
     
-    # Get recent users
+    # Get recent users (top-N on the created_at index)
     recent_users = User.query.order_by(User.created_at.desc()).limit(5).all()
     
-    # Get recent fillups
+    # Get recent fillups (top-N on the date index)
     recent_fillups = FillUp.query.order_by(FillUp.date.desc()).limit(5).all()
     
     return render_template('admin/dashboard.html',
-                         total_users=total_users,
-                         total_fillups=total_fillups,
-                         total_vehicles=total_vehicles,
-                         total_tripoints=total_tripoints,
+                         total_users=counts[User.__tablename__],
+                         total_fillups=counts[FillUp.__tablename__],
+                         total_vehicles=counts[Vehicle.__tablename__],
+                         total_tripoints=counts[TriPoint.__tablename__],
                          recent_users=recent_users,
                          recent_fillups=recent_fillups)
 
 
+@main.route('/admin/ingest')
+@login_required
+@admin_required
+def admin_ingest_report():
+    """GPS fixes received vs stored by this process, per ingest filter, and the
+    write-behind queue depth and flush latency
+    """
+    return jsonify(dict(ingest_totals.as_dict(), filters=ingest.enabled_stages(current_app.config),
+                        writer=point_writer.metrics()))
+
+
 @main.route('/admin/users')
 @login_required
 @admin_required
@@ -807,12 +1095,24 @@ def delete_user(user_id):
         flash(_('Өөрийн бүртгэлээ устгах боломжгүй.'), 'error')
     else:
         # Delete related data
+        TankState.query.filter_by(user_id=user_id).delete()
+        UserFuelStats.query.filter_by(user_id=user_id).delete()
+        UserTripStats.query.filter_by(user_id=user_id).delete()
+        Trip.query.filter_by(user_id=user_id).delete()
+        HeatmapCell.query.filter_by(user_id=user_id).delete()
+        UserDataVersion.query.filter_by(user_id=user_id).delete()
+        FillUpInterval.query.filter_by(user_id=user_id).delete()
+        OdometerCalibration.query.filter_by(user_id=user_id).delete()
+        TriPointRollup.query.filter_by(user_id=user_id).delete()
         FillUp.query.filter_by(user_id=user_id).delete()
         TriPoint.query.filter_by(user_id=user_id).delete()
         Vehicle.query.filter_by(user_id=user_id).delete()
         
         db.session.delete(user)
         db.session.commit()
+        # The bulk deletes above bypass the ORM hooks
+        admin_stats.invalidate()
+        last_points.invalidate(user_id)
         flash(_('Хэрэглэгч %(license)s амжилттай устгагдлаа.', license=user.license_number), 'success')
     return redirect(url_for('main.admin_users'))
 
@@ -864,87 +1164,35 @@ def reset_user_password(user_id):
 def vehicle_chart():
     """Display vehicles grouped by fuel type with statistics and filtering"""
     
-    # Get selected fuel type from query parameter
+    # Get selected fuel type and page from query parameters
     selected_fuel_type = request.args.get('fuel_type', 'all')
+    page = request.args.get('page', 1, type=int)
     
-    # Get all users
-    all_users = User.query.all()
+    # Totals per fuel type, grouped in the database
+    fuel_types_list = Vehicle.get_fuel_type_totals()
     
-    # Build statistics for all vehicles and group by fuel type
-    all_vehicles_stats = []
-    fuel_types_dict = {}
+    # One page of vehicles, filtered on the server
+    fuel_type_filter = selected_fuel_type if selected_fuel_type != 'all' else None
+    vehicles, pagination = Vehicle.get_fleet_page(fuel_type_filter, page=page, per_page=20)
     
-    for user in all_users:
-        vehicle = Vehicle.get_current_vehicle(user.id)
-        fillups = FillUp.query.filter_by(user_id=user.id).order_by(FillUp.date.asc()).all()
-        
-        # Calculate statistics
-        vehicle_stats = {
-            'user_id': user.id,
-            'vehicle_id': vehicle.id,
-            'name': vehicle.name,
-            'fuel_type': vehicle.fuel_type,
-            'tank_capacity': vehicle.tank_capacity_liters,
-            'total_fillups': len(fillups),
-            'total_spent': sum(f.total_cost for f in fillups),
-            'total_liters': sum(f.fuel_liters for f in fillups),
-            'average_cost': (sum(f.total_cost for f in fillups) / len(fillups)) if fillups else 0,
-            'average_price_per_liter': (sum(f.price_per_liter for f in fillups) / len(fillups)) if fillups else 0,
-            'average_efficiency': FillUp.get_average_efficiency(user.id),
-            'fillups': fillups,
-        }
-        all_vehicles_stats.append(vehicle_stats)
-        
-        # Group by fuel type
-        fuel_type = vehicle.fuel_type
-        if fuel_type not in fuel_types_dict:
-            fuel_types_dict[fuel_type] = {
-                'vehicles': [],
-                'total_vehicles': 0,
-                'total_fillups': 0,
-                'total_spent': 0,
-                'total_liters': 0,
-                'average_price_per_liter': 0,
-                'average_efficiency_values': []
-            }
-        
-        fuel_types_dict[fuel_type]['vehicles'].append(vehicle_stats)
-        fuel_types_dict[fuel_type]['total_vehicles'] += 1
-        fuel_types_dict[fuel_type]['total_fillups'] += vehicle_stats['total_fillups']
-        fuel_types_dict[fuel_type]['total_spent'] += vehicle_stats['total_spent']
-        fuel_types_dict[fuel_type]['total_liters'] += vehicle_stats['total_liters']
-        if vehicle_stats['average_price_per_liter'] > 0:
-            fuel_types_dict[fuel_type]['average_price_per_liter'] += vehicle_stats['average_price_per_liter']
-        if vehicle_stats['average_efficiency']:
-            fuel_types_dict[fuel_type]['average_efficiency_values'].append(vehicle_stats['average_efficiency'])
-    
-    # Calculate fuel type statistics
-    fuel_types_list = []
-    for fuel_type, data in fuel_types_dict.items():
-        avg_price = data['average_price_per_liter'] / data['total_vehicles'] if data['total_vehicles'] > 0 else 0
-        avg_eff = sum(data['average_efficiency_values']) / len(data['average_efficiency_values']) if data['average_efficiency_values'] else 0
-        
-        fuel_types_list.append({
-            'fuel_type': fuel_type,
-            'total_vehicles': data['total_vehicles'],
-            'total_fillups': data['total_fillups'],
-            'total_spent': data['total_spent'],
-            'total_liters': data['total_liters'],
-            'average_price_per_liter': avg_price,
-            'average_efficiency': avg_eff,
-            'vehicles': data['vehicles']
-        })
-    
-    # Filter by selected fuel type
-    if selected_fuel_type != 'all':
-        filtered_vehicles = [v for v in all_vehicles_stats if v['fuel_type'] == selected_fuel_type]
+    if fuel_type_filter:
         fuel_type_data = next((f for f in fuel_types_list if f['fuel_type'] == selected_fuel_type), None)
+        shown_types = [fuel_type_data] if fuel_type_data else []
     else:
-        filtered_vehicles = all_vehicles_stats
         fuel_type_data = None
+        shown_types = fuel_types_list
+    
+    fleet_totals = {
+        'total_vehicles': sum(f['total_vehicles'] for f in shown_types),
+        'total_fillups': sum(f['total_fillups'] for f in shown_types),
+        'total_liters': sum(f['total_liters'] for f in shown_types),
+        'total_spent': sum(f['total_spent'] for f in shown_types),
+    }
     
     return render_template('vehicle_chart.html', 
-                         all_vehicles=filtered_vehicles,
+                         all_vehicles=vehicles,
+                         pagination=pagination,
+                         fleet_totals=fleet_totals,
                          fuel_types=fuel_types_list,
                          selected_fuel_type=selected_fuel_type,
                          fuel_type_data=fuel_type_data)
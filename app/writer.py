@@ -0,0 +1,205 @@
+"""Opt-in write-behind ingestion of GPS points (LOCATION_WRITE_BEHIND).
+
+POST /api/location and /api/location/batch validate the fixes, put them on
+a bounded in-process queue and return 202. A writer thread per worker
+process drains the queue and stores everything that arrived within
+LOCATION_WRITE_FLUSH_MS (or LOCATION_WRITE_BATCH_POINTS points) with one
+multi-row INSERT per user and a single commit, instead of one commit per
+request. When the queue is full, requests wait up to
+LOCATION_WRITE_ENQUEUE_TIMEOUT_MS and then get 503.
+
+Queued points are lost if the process dies before they are flushed; a
+normal shutdown flushes them (atexit). A user's fixes must all reach the
+same worker for the odometer chain, as with the in-process last-point
+cache.
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class PointWriter:
+    """GPS цэгүүдийг дараалалд авч, арын thread-ээр багцалж хадгалах бичигч"""
+
+    def __init__(self):
+        self.app = None
+        self.queue = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.reset_metrics()
+        atexit.register(self.stop)
+
+    def init_app(self, app):
+        self.app = app
+        self.queue = queue.Queue(maxsize=app.config['LOCATION_WRITE_QUEUE_SIZE'])
+        self._thread = None
+        self.reset_metrics()
+
+    @property
+    def enabled(self):
+        return self.app is not None and self.app.config.get('LOCATION_WRITE_BEHIND', False)
+
+    def reset_metrics(self):
+        # written_points counts stored rows, after the ingest filters. The
+        # metrics are updated by request threads and the writer thread, so
+        # every change holds _lock
+        with self._lock:
+            self.counts = {'enqueued_points': 0, 'written_points': 0, 'failed_points': 0,
+                           'rejected_requests': 0, 'flushes': 0}
+            self.max_queue_depth = 0
+            self.flush_ms_total = 0.0
+            self.flush_ms_max = 0.0
+            self.last_flush_ms = None
+
+    def submit(self, user_id, points):
+        """Queue a user's ordered points; False if the queue stayed full"""
+        self._ensure_started()
+        timeout = self.app.config['LOCATION_WRITE_ENQUEUE_TIMEOUT_MS'] / 1000.0
+        try:
+            self.queue.put((user_id, points), timeout=timeout)
+        except queue.Full:
+            with self._lock:
+                self.counts['rejected_requests'] += 1
+            return False
+        with self._lock:
+            self.counts['enqueued_points'] += len(points)
+            self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+        return True
+
+    def drain(self):
+        """Block until everything queued so far has been flushed"""
+        if self.queue is not None:
+            self.queue.join()
+
+    def stop(self):
+        """Flush what is queued and stop the writer thread"""
+        thread = self._thread
+        if thread is not None and thread.is_alive() and self._pid == os.getpid():
+            self.queue.put(_STOP)
+            thread.join()
+        self._thread = None
+
+    def metrics(self):
+        with self._lock:
+            flushes = self.counts['flushes']
+            return dict(
+                self.counts,
+                enabled=self.enabled,
+                queue_depth=self.queue.qsize() if self.queue is not None else 0,
+                queue_capacity=self.queue.maxsize if self.queue is not None else 0,
+                max_queue_depth=self.max_queue_depth,
+                last_flush_ms=self.last_flush_ms,
+                avg_flush_ms=round(self.flush_ms_total / flushes, 2) if flushes else None,
+                max_flush_ms=round(self.flush_ms_max, 2),
+            )
+
+    def _ensure_started(self):
+        # Started lazily so that each forked worker gets its own thread
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='point-writer', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        batch_points = self.app.config['LOCATION_WRITE_BATCH_POINTS']
+        flush_seconds = self.app.config['LOCATION_WRITE_FLUSH_MS'] / 1000.0
+        while True:
+            first = self.queue.get()
+            if first is _STOP:
+                self.queue.task_done()
+                return
+            items = [first]
+            size = len(first[1])
+            deadline = time.monotonic() + flush_seconds
+            stopping = False
+            while size < batch_points:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                items.append(item)
+                size += len(item[1])
+            try:
+                self._flush(items)
+            finally:
+                for _ in range(len(items) + stopping):
+                    self.queue.task_done()
+            if stopping:
+                return
+
+    def _flush(self, items):
+        started = time.perf_counter()
+        by_user = {}
+        for user_id, points in items:
+            by_user.setdefault(user_id, []).extend(points)
+        with self.app.app_context():
+            try:
+                written = self._write(by_user)
+            except Exception:
+                # Retry user by user so one bad batch does not lose the rest
+                self._session().rollback()
+                written = 0
+                for user_id, points in by_user.items():
+                    try:
+                        written += self._write({user_id: points})
+                    except Exception:
+                        self._session().rollback()
+                        with self._lock:
+                            self.counts['failed_points'] += len(points)
+                        logger.exception('Dropped %d queued points of user %s', len(points), user_id)
+            finally:
+                self._session().remove()
+        elapsed_ms = (time.perf_counter() - started) * 1000.0
+        with self._lock:
+            self.counts['written_points'] += written
+            self.counts['flushes'] += 1
+            self.last_flush_ms = round(elapsed_ms, 2)
+            self.flush_ms_total += elapsed_ms
+            self.flush_ms_max = max(self.flush_ms_max, elapsed_ms)
+
+    def _write(self, by_user):
+        """Store each user's points like the batch endpoint, in one commit"""
+        from app import ingest
+        from app.cache import last_points
+        from app.ingest import ingest_totals
+        from app.models import TriPoint
+
+        reports = []
+        for user_id, points in by_user.items():
+            last_point = last_points.get(user_id)
+            filtered, context = ingest.run(points, last_point, self.app.config)
+            TriPoint.bulk_insert(user_id, filtered, last_point, context.anchor_dwell_until)
+            reports.append(ingest.report(len(points), filtered, context))
+        self._session().commit()
+        for report in reports:
+            ingest_totals.add(report)
+        return sum(report[ingest.SAVED] for report in reports)
+
+    @staticmethod
+    def _session():
+        from app.models import db
+        return db.session
+
+
+point_writer = PointWriter()
+
+
+def init_app(app):
+    point_writer.stop()
+    point_writer.init_app(app)
@@ -0,0 +1,70 @@
+"""Benchmark the /charts aggregation: Python grouping over ORM rows vs SQL GROUP BY.
+
+Usage: python bench_charts.py [fillups_per_user]
+"""
+import calendar
+import sys
+import time
+from collections import defaultdict
+
+from app import create_app, db
+from app.models import FillUp, User, Vehicle
+from config import Config
+from test_fuel_calculation import add_fillups
+
+
+class BenchConfig(Config):
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+
+
+def legacy_charts(user_id):
+    """What charts() did before: load every fill-up and group in Python"""
+    fillups = FillUp.query.filter_by(user_id=user_id).order_by(FillUp.date.asc()).all()
+    monthly_spending = defaultdict(float)
+    monthly_volume = defaultdict(float)
+    for fillup in fillups:
+        month_key = fillup.date.strftime('%Y-%m')
+        monthly_spending[month_key] += fillup.total_cost
+        monthly_volume[month_key] += fillup.fuel_liters
+    efficiencies = [f.efficiency_l_per_100km for f in fillups if f.efficiency_l_per_100km]
+    avg_price = sum(f.price_per_liter for f in fillups) / len(fillups)
+    return monthly_spending, monthly_volume, min(efficiencies), max(efficiencies), avg_price
+
+
+def sql_charts(user_id):
+    summary = FillUp.get_chart_summary(user_id)
+    labels = [calendar.month_abbr[int(m['month'][5:])] for m in FillUp.get_monthly_totals(user_id)]
+    return summary, labels
+
+
+def timed(fn, *args, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        db.session.expunge_all()
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    app = create_app(BenchConfig)
+    with app.app_context():
+        db.create_all()
+        user = User(license_number='BENCH', password_hash='x')
+        db.session.add(user)
+        db.session.commit()
+        db.session.add(Vehicle(user_id=user.id))
+        db.session.commit()
+        add_fillups(user, count)
+        user_id = user.id
+
+        months = len(FillUp.get_monthly_totals(user_id))
+        print(f"{count} fill-ups over {months} months")
+        print(f"python grouping: {timed(legacy_charts, user_id):8.2f} ms")
+        print(f"sql group by:    {timed(sql_charts, user_id):8.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Benchmark per-request CPU of /api/trips/stats at 2k, 50k and 500k points.
+
+Compares the old per-pair loop over ORM objects with app.geo over column
+tuples (pure Python, and NumPy when installed), then times the endpoint
+itself.
+
+Usage: python bench_geo.py [sizes...]
+"""
+import sys
+import time
+from datetime import datetime, timedelta
+
+from app import create_app, db, geo
+from app.models import TriPoint, User, Vehicle
+from config import Config
+
+
+class BenchConfig(Config):
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+
+
+def legacy_stats(user_id, limit):
+    """What trips_stats did before: ORM objects and a scalar haversine per pair"""
+    points = TriPoint.query.filter_by(user_id=user_id).order_by(TriPoint.trip_date.desc()).limit(limit).all()
+    points = list(reversed(points))
+    total = moving = idle = 0.0
+    for i in range(1, len(points)):
+        p1, p2 = points[i - 1], points[i]
+        dt = (p2.trip_date - p1.trip_date).total_seconds()
+        if dt <= 0:
+            continue
+        d_km = geo.haversine_km(p1.lat, p1.lon, p2.lat, p2.lon)
+        if d_km < 0.005:
+            d_km = 0.0
+        total += d_km
+        if d_km > 0:
+            if d_km / dt * 3600.0 >= 2.0:
+                moving += dt
+            else:
+                idle += dt
+    return total, moving, idle
+
+
+def geo_stats(user_id, limit, use_numpy):
+    rows = db.session.query(TriPoint.lat, TriPoint.lon, TriPoint.trip_date).filter(
+        TriPoint.user_id == user_id
+    ).order_by(TriPoint.trip_date.desc()).limit(limit).all()
+    rows.reverse()
+    lats, lons, dates = zip(*rows)
+    return geo.summarize_movement(lats, lons, dates, 0.005, 2.0, stationary_is_idle=False, use_numpy=use_numpy)
+
+
+def cpu_ms(fn, *args, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        db.session.expunge_all()
+        start = time.process_time()
+        fn(*args)
+        best = min(best, time.process_time() - start)
+    return best * 1000
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [2000, 50000, 500000]
+    app = create_app(BenchConfig)
+    with app.app_context():
+        db.create_all()
+        user = User(license_number='BENCH', password_hash='x')
+        db.session.add(user)
+        db.session.commit()
+        db.session.add(Vehicle(user_id=user.id))
+        db.session.commit()
+        user_id = user.id
+
+        start = datetime(2024, 1, 1)
+        db.session.execute(db.insert(TriPoint), [{
+            'user_id': user_id,
+            'lat': 47.9 + (i % 1000) * 0.0001,
+            'lon': 106.9 + (i // 1000) * 0.0001,
+            'odometer_km': 0.0,
+            'trip_date': start + timedelta(seconds=i),
+        } for i in range(max(sizes))])
+        db.session.commit()
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+
+    print(f"numpy available: {geo.HAVE_NUMPY}")
+    print(f"{'points':>8} {'legacy':>10} {'geo py':>10} {'geo numpy':>10} {'request':>10}  (CPU ms)")
+    for size in sizes:
+        with app.app_context():
+            legacy = cpu_ms(legacy_stats, user_id, size)
+            python = cpu_ms(geo_stats, user_id, size, False)
+            vectorized = cpu_ms(geo_stats, user_id, size, True) if geo.HAVE_NUMPY else float('nan')
+
+        start = time.process_time()
+        assert client.get(f'/api/trips/stats?limit={size}').status_code == 200
+        request_ms = (time.process_time() - start) * 1000
+
+        print(f"{size:>8} {legacy:>10.1f} {python:>10.1f} {vectorized:>10.1f} {request_ms:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""Benchmark GPS ingestion: one POST /api/location per fix vs POST /api/location/batch.
+
+Runs against a file-backed SQLite database so every COMMIT pays for a real
+journal write, as it does in production.
+
+Usage: python bench_location_ingest.py [points] [batch_size]
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from app import create_app, db
+from app.models import TriPoint, User, Vehicle
+from config import Config
+
+
+def make_points(count, start):
+    """A 1 Hz drive heading north-east at roughly 40 km/h"""
+    return [{
+        'lat': 47.9 + i * 0.00008,
+        'lon': 106.9 + i * 0.00008,
+        'accuracy': 5.0,
+        'timestamp': (start + timedelta(seconds=i)).isoformat(),
+    } for i in range(count)]
+
+
+def run(app, user_id, points, batch_size):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+
+    start = time.perf_counter()
+    if batch_size == 1:
+        for point in points:
+            assert client.post('/api/location', json=point).status_code == 201
+    else:
+        for i in range(0, len(points), batch_size):
+            response = client.post('/api/location/batch', json={'points': points[i:i + batch_size]})
+            assert response.status_code == 201
+    return time.perf_counter() - start
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    with tempfile.TemporaryDirectory() as tmp:
+        class BenchConfig(Config):
+            SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(tmp, 'bench.db')
+
+        app = create_app(BenchConfig)
+        with app.app_context():
+            db.create_all()
+            users = []
+            for name in ('SINGLE', 'BATCH'):
+                user = User(license_number=name, password_hash='x')
+                db.session.add(user)
+                db.session.commit()
+                db.session.add(Vehicle(user_id=user.id))
+                db.session.commit()
+                users.append(user.id)
+
+        points = make_points(count, datetime(2024, 1, 1))
+        single = run(app, users[0], points, 1)
+        batched = run(app, users[1], points, batch_size)
+
+        with app.app_context():
+            odometers = [
+                TriPoint.get_last_point(user_id).odometer_km for user_id in users
+            ]
+
+    print(f"{count} points, batch size {batch_size}")
+    print(f"single:  {single:8.2f} s  {count / single:10.0f} points/s")
+    print(f"batched: {batched:8.2f} s  {count / batched:10.0f} points/s  ({single / batched:.1f}x)")
+    print(f"final odometer: single {odometers[0]:.3f} km, batched {odometers[1]:.3f} km")
+
+
+if __name__ == '__main__':
+    main()
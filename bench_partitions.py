@@ -0,0 +1,88 @@
+"""Benchmark hot-window tri_point queries before and after monthly partitioning.
+
+Needs a scratch PostgreSQL database: its tables are dropped and recreated.
+
+Usage: BENCH_DATABASE_URL=postgresql://... python bench_partitions.py [months] [points_per_month]
+"""
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+from app import create_app, db, partitions
+from app.models import TriPoint, User
+from config import Config
+
+USERS = 20
+
+
+class BenchConfig(Config):
+    SQLALCHEMY_DATABASE_URI = os.environ.get('BENCH_DATABASE_URL')
+
+
+def hot_queries(user_id, now):
+    """What the app runs against recent data on every map poll / ingest"""
+    return {
+        'latest point': lambda: TriPoint.query.filter_by(user_id=user_id).order_by(
+            TriPoint.trip_date.desc()).first(),
+        'last 2000 points': lambda: db.session.query(TriPoint.lat, TriPoint.lon, TriPoint.trip_date).filter(
+            TriPoint.user_id == user_id).order_by(TriPoint.trip_date.desc()).limit(2000).all(),
+        'last 24h': lambda: TriPoint.iter_track(user_id, since=now - timedelta(days=1)).all(),
+        'last 24h, all users': lambda: db.session.query(db.func.count()).select_from(TriPoint).filter(
+            TriPoint.trip_date >= now - timedelta(days=1)).scalar(),
+    }
+
+
+def timed(fn, repeat=20):
+    best = float('inf')
+    for _ in range(repeat):
+        db.session.expunge_all()
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    if not BenchConfig.SQLALCHEMY_DATABASE_URI or not BenchConfig.SQLALCHEMY_DATABASE_URI.startswith('postgresql'):
+        sys.exit('Set BENCH_DATABASE_URL to a scratch PostgreSQL database')
+    months = int(sys.argv[1]) if len(sys.argv) > 1 else 24
+    per_month = int(sys.argv[2]) if len(sys.argv) > 2 else 200000
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        users = [User(license_number=f'B{i:04d}', password_hash='x') for i in range(USERS)]
+        db.session.add_all(users)
+        db.session.commit()
+
+        now = datetime.utcnow()
+        start = now - timedelta(days=30 * months)
+        step = timedelta(days=30) / per_month
+        for month in range(months):
+            db.session.execute(db.insert(TriPoint), [{
+                'user_id': users[i % USERS].id, 'lat': 47.9, 'lon': 106.9, 'odometer_km': float(i),
+                'trip_date': start + step * (month * per_month + i),
+            } for i in range(per_month)])
+            db.session.commit()
+        db.session.execute(db.text('ANALYZE tri_point'))
+        db.session.commit()
+
+        queries = hot_queries(users[0].id, now)
+        before = {name: timed(fn) for name, fn in queries.items()}
+
+        partitions.convert_to_partitioned(months_ahead=2)
+        db.session.commit()
+        db.session.execute(db.text('ANALYZE tri_point'))
+        db.session.commit()
+        after = {name: timed(fn) for name, fn in queries.items()}
+
+    print(f"{months * per_month} points over {months} months, {USERS} users")
+    print(f"{'query':<22} {'unpartitioned':>14} {'partitioned':>12}  (best of 20, ms)")
+    for name in queries:
+        print(f"{name:<22} {before[name]:>14.2f} {after[name]:>12.2f}")
+
+
+if __name__ == '__main__':
+    main()
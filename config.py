@@ -31,6 +31,68 @@ class Config:
     REMEMBER_COOKIE_DURATION = timedelta(days=30)
     SESSION_PERMANENT = True
 
+    # Admin dashboard counts: how long cached counts live, and which tables
+    # are counted from PostgreSQL's planner estimate instead of COUNT(*)
+    # (comma separated, e.g. "tri_point")
+    ADMIN_STATS_TTL_SECONDS = int(os.environ.get('ADMIN_STATS_TTL_SECONDS', 300))
+    ADMIN_STATS_ESTIMATED_TABLES = [t for t in os.environ.get('ADMIN_STATS_ESTIMATED_TABLES', '').split(',') if t]
+
+    # Largest point array accepted by POST /api/location/batch
+    LOCATION_BATCH_MAX_POINTS = int(os.environ.get('LOCATION_BATCH_MAX_POINTS', 1000))
+
+    # Most vertices GET /api/location returns in simplified (?zoom=/?tolerance_m=) mode
+    TRACK_SIMPLIFY_MAX_POINTS = int(os.environ.get('TRACK_SIMPLIFY_MAX_POINTS', 2000))
+    # Most recent points a simplified read starts from; older ones in the
+    # requested range are left out (X-Track-Source-Truncated)
+    TRACK_SIMPLIFY_MAX_SOURCE_POINTS = int(os.environ.get('TRACK_SIMPLIFY_MAX_SOURCE_POINTS', 50000))
+
+    # Rows fetched per round trip when streaming /api/location/export
+    TRACK_EXPORT_CHUNK_SIZE = int(os.environ.get('TRACK_EXPORT_CHUNK_SIZE', 1000))
+
+    # `flask downsample-tri-points`: raw points older than this many days are
+    # thinned to one per TRIPOINT_ROLLUP_SECONDS
+    TRIPOINT_RAW_RETENTION_DAYS = int(os.environ.get('TRIPOINT_RAW_RETENTION_DAYS', 90))
+    TRIPOINT_ROLLUP_SECONDS = int(os.environ.get('TRIPOINT_ROLLUP_SECONDS', 60))
+
+    # Filters GPS fixes pass through before they are stored, in order
+    # (comma separated; empty, the default, stores every fix): "accuracy"
+    # drops fixes less accurate than INGEST_MAX_ACCURACY_M, "outlier" drops
+    # spikes faster than INGEST_MAX_SPEED_KMH, and "stationary" folds fixes
+    # within INGEST_STATIONARY_RADIUS_M of the last stored one into it as
+    # dwell time
+    INGEST_FILTERS = os.environ.get('INGEST_FILTERS', '')
+    INGEST_MAX_ACCURACY_M = int(os.environ.get('INGEST_MAX_ACCURACY_M', 100))
+    INGEST_MAX_SPEED_KMH = int(os.environ.get('INGEST_MAX_SPEED_KMH', 300))
+    INGEST_STATIONARY_RADIUS_M = int(os.environ.get('INGEST_STATIONARY_RADIUS_M', 5))
+
+    # Write-behind ingest: POST /api/location(/batch) queue points and return
+    # 202; a writer thread per worker stores them every
+    # LOCATION_WRITE_BATCH_POINTS points or LOCATION_WRITE_FLUSH_MS. A full
+    # queue (in requests) makes requests wait up to the enqueue timeout, then 503
+    LOCATION_WRITE_BEHIND = os.environ.get('LOCATION_WRITE_BEHIND', '').lower() in ('1', 'true', 'yes')
+    LOCATION_WRITE_QUEUE_SIZE = int(os.environ.get('LOCATION_WRITE_QUEUE_SIZE', 10000))
+    LOCATION_WRITE_BATCH_POINTS = int(os.environ.get('LOCATION_WRITE_BATCH_POINTS', 500))
+    LOCATION_WRITE_FLUSH_MS = int(os.environ.get('LOCATION_WRITE_FLUSH_MS', 200))
+    LOCATION_WRITE_ENQUEUE_TIMEOUT_MS = int(os.environ.get('LOCATION_WRITE_ENQUEUE_TIMEOUT_MS', 1000))
+
+    # GET /api/trips/stream (SSE): seconds between keepalives (and re-checks
+    # of the stored totals), seconds before the stream is closed for the
+    # browser to reconnect, and the reconnect delay it is told to use.
+    # Off by default and the map polls instead: each open stream holds a
+    # worker thread, so enable it only with threaded or gevent gunicorn
+    # workers (e.g. gunicorn -k gthread --threads 8)
+    STATS_STREAM_ENABLED = os.environ.get('STATS_STREAM_ENABLED', '').lower() in ('1', 'true', 'yes')
+    STATS_STREAM_KEEPALIVE_SECONDS = float(os.environ.get('STATS_STREAM_KEEPALIVE_SECONDS', 15))
+    STATS_STREAM_MAX_SECONDS = int(os.environ.get('STATS_STREAM_MAX_SECONDS', 300))
+    STATS_STREAM_RETRY_MS = int(os.environ.get('STATS_STREAM_RETRY_MS', 5000))
+
+    # Last GPS fix per user, used to chain the odometer on ingest. Read from
+    # the database by default; set LAST_POINT_CACHE_URL (redis://...) to
+    # cache it for all gunicorn workers, or LAST_POINT_CACHE_SIZE > 0 for an
+    # in-process LRU when there is a single worker
+    LAST_POINT_CACHE_SIZE = int(os.environ.get('LAST_POINT_CACHE_SIZE', 0))
+    LAST_POINT_CACHE_URL = os.environ.get('LAST_POINT_CACHE_URL')
+
     # Flask-Babel configuration for internationalization
     BABEL_DEFAULT_LOCALE = 'mn'
     BABEL_DEFAULT_TIMEZONE = 'UTC'
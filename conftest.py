@@ -0,0 +1,42 @@
+import pytest
+
+from app import create_app, db
+from app.models import User, Vehicle
+from config import Config
+
+
+class TestConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    WTF_CSRF_ENABLED = False
+
+
+@pytest.fixture
+def app():
+    app = create_app(TestConfig)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def user(app):
+    user = User(license_number='1234УБА')
+    user.set_password('secret')
+    db.session.add(user)
+    db.session.commit()
+    db.session.add(Vehicle(user_id=user.id, tank_capacity_liters=60.0))
+    db.session.commit()
+    return user
+
+
+@pytest.fixture
+def client(app, user):
+    """Test client already logged in as `user`"""
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user.id)
+        session['_fresh'] = True
+    return client
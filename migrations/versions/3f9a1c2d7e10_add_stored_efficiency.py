@@ -0,0 +1,29 @@
+"""Add stored efficiency columns to FillUp
+
+Revision ID: 3f9a1c2d7e10
+Revises: add_fuel_type
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9a1c2d7e10'
+down_revision = 'add_fuel_type'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Populate existing rows afterwards with `flask backfill-efficiency`
+    with op.batch_alter_table('fill_up', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('efficiency_l_per_100km', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('distance_since_prev_km', sa.Float(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('fill_up', schema=None) as batch_op:
+        batch_op.drop_column('distance_since_prev_km')
+        batch_op.drop_column('efficiency_l_per_100km')
@@ -0,0 +1,38 @@
+"""Add TankState table
+
+Revision ID: 5e7c0a3b9d21
+Revises: c41d7e9b2a58
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e7c0a3b9d21'
+down_revision = 'c41d7e9b2a58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Users without a row fall back to computing the state on read
+    # until their next fill-up write
+    op.create_table('tank_state',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('last_fillup_id', sa.Integer(), nullable=True),
+    sa.Column('last_fillup_date', sa.DateTime(), nullable=False),
+    sa.Column('last_fillup_odometer_km', sa.Float(), nullable=False),
+    sa.Column('fuel_after_fillup', sa.Float(), nullable=False),
+    sa.Column('efficiency_l_per_100km', sa.Float(), nullable=True),
+    sa.Column('current_odometer_km', sa.Float(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['last_fillup_id'], ['fill_up.id'], ondelete='SET NULL'),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+
+
+def downgrade():
+    op.drop_table('tank_state')
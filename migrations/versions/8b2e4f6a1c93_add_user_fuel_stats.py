@@ -0,0 +1,35 @@
+"""Add UserFuelStats snapshot table
+
+Revision ID: 8b2e4f6a1c93
+Revises: 3f9a1c2d7e10
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b2e4f6a1c93'
+down_revision = '3f9a1c2d7e10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Build the snapshots afterwards with `flask backfill-efficiency` followed by `flask check-fuel-stats`
+    op.create_table('user_fuel_stats',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('fillup_count', sa.Integer(), nullable=False),
+    sa.Column('total_spent', sa.Float(), nullable=False),
+    sa.Column('total_liters', sa.Float(), nullable=False),
+    sa.Column('total_distance_km', sa.Float(), nullable=False),
+    sa.Column('efficiency_fuel_liters', sa.Float(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+
+
+def downgrade():
+    op.drop_table('user_fuel_stats')
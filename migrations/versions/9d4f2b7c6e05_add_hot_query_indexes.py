@@ -0,0 +1,28 @@
+"""Add composite indexes for per-user FillUp and TriPoint queries
+
+Revision ID: 9d4f2b7c6e05
+Revises: 5e7c0a3b9d21
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d4f2b7c6e05'
+down_revision = '5e7c0a3b9d21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_fill_up_user_id_odometer_km', 'fill_up', ['user_id', 'odometer_km'], unique=False)
+    op.create_index('ix_fill_up_user_id_date', 'fill_up', ['user_id', 'date'], unique=False)
+    op.create_index('ix_tri_point_user_id_trip_date', 'tri_point', ['user_id', 'trip_date'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_tri_point_user_id_trip_date', table_name='tri_point')
+    op.drop_index('ix_fill_up_user_id_date', table_name='fill_up')
+    op.drop_index('ix_fill_up_user_id_odometer_km', table_name='fill_up')
@@ -0,0 +1,38 @@
+"""Add UserTripStats running totals table
+
+Revision ID: a7d3e5f9c104
+Revises: e2a6c8d4f317
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d3e5f9c104'
+down_revision = 'e2a6c8d4f317'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Build the totals afterwards with `flask rebuild-trip-stats`
+    op.create_table('user_trip_stats',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('point_count', sa.Integer(), nullable=False),
+    sa.Column('total_distance_km', sa.Float(), nullable=False),
+    sa.Column('moving_seconds', sa.Float(), nullable=False),
+    sa.Column('idle_seconds', sa.Float(), nullable=False),
+    sa.Column('max_speed_kmh', sa.Float(), nullable=False),
+    sa.Column('speed_sum_kmh', sa.Float(), nullable=False),
+    sa.Column('moving_segments', sa.Integer(), nullable=False),
+    sa.Column('last_point_date', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+
+
+def downgrade():
+    op.drop_table('user_trip_stats')
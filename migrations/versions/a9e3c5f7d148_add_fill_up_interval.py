@@ -0,0 +1,55 @@
+"""Add fill_up_interval aggregates and the running best efficiency
+
+Revision ID: a9e3c5f7d148
+Revises: f4c9a1e7b352
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a9e3c5f7d148'
+down_revision = 'f4c9a1e7b352'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user_fuel_stats', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('best_efficiency_l_per_100km', sa.Float(), nullable=True))
+    op.execute(
+        "UPDATE user_fuel_stats SET best_efficiency_l_per_100km = ("
+        "SELECT min(efficiency_l_per_100km) FROM fill_up WHERE fill_up.user_id = user_fuel_stats.user_id)"
+    )
+
+    # Fill it for existing fill-ups with `flask rebuild-fillup-intervals`;
+    # until then /api/motor_hour computes the interval from the points
+    op.create_table('fill_up_interval',
+    sa.Column('start_fillup_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('end_fillup_id', sa.Integer(), nullable=True),
+    sa.Column('start_date', sa.DateTime(), nullable=False),
+    sa.Column('end_date', sa.DateTime(), nullable=True),
+    sa.Column('distance_km', sa.Float(), nullable=False),
+    sa.Column('moving_seconds', sa.Float(), nullable=False),
+    sa.Column('idle_seconds', sa.Float(), nullable=False),
+    sa.Column('point_count', sa.Integer(), nullable=False),
+    sa.Column('last_point_date', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['start_fillup_id'], ['fill_up.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['end_fillup_id'], ['fill_up.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('start_fillup_id')
+    )
+    op.create_index('ix_fill_up_interval_user_id_end_date', 'fill_up_interval', ['user_id', 'end_date'], unique=False)
+    op.create_index('ix_fill_up_interval_end_fillup_id', 'fill_up_interval', ['end_fillup_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_fill_up_interval_end_fillup_id', table_name='fill_up_interval')
+    op.drop_index('ix_fill_up_interval_user_id_end_date', table_name='fill_up_interval')
+    op.drop_table('fill_up_interval')
+    with op.batch_alter_table('user_fuel_stats', schema=None) as batch_op:
+        batch_op.drop_column('best_efficiency_l_per_100km')
@@ -0,0 +1,51 @@
+"""Add Trip table segmented from GPS points
+
+Revision ID: b5e1f7a2d806
+Revises: a7d3e5f9c104
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5e1f7a2d806'
+down_revision = 'a7d3e5f9c104'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Segment existing points afterwards with `flask rebuild-trips`
+    op.create_table('trip',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('is_open', sa.Boolean(), nullable=False),
+    sa.Column('start_time', sa.DateTime(), nullable=False),
+    sa.Column('end_time', sa.DateTime(), nullable=False),
+    sa.Column('start_lat', sa.Float(), nullable=False),
+    sa.Column('start_lon', sa.Float(), nullable=False),
+    sa.Column('end_lat', sa.Float(), nullable=False),
+    sa.Column('end_lon', sa.Float(), nullable=False),
+    sa.Column('distance_km', sa.Float(), nullable=False),
+    sa.Column('moving_seconds', sa.Float(), nullable=False),
+    sa.Column('idle_seconds', sa.Float(), nullable=False),
+    sa.Column('max_speed_kmh', sa.Float(), nullable=False),
+    sa.Column('speed_sum_kmh', sa.Float(), nullable=False),
+    sa.Column('moving_segments', sa.Integer(), nullable=False),
+    sa.Column('fuel_liters', sa.Float(), nullable=False),
+    sa.Column('pending_idle_seconds', sa.Float(), nullable=False),
+    sa.Column('pending_distance_km', sa.Float(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_trip_user_id_start_time', 'trip', ['user_id', 'start_time'], unique=False)
+    op.create_index('ix_trip_user_id_is_open', 'trip', ['user_id', 'is_open'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_trip_user_id_is_open', table_name='trip')
+    op.drop_index('ix_trip_user_id_start_time', table_name='trip')
+    op.drop_table('trip')
@@ -0,0 +1,38 @@
+"""Add odometer_calibration, the per-user GPS to fill-up odometer mapping
+
+Revision ID: b6d2f8a4c519
+Revises: a9e3c5f7d148
+Create Date: 2026-10-18 22:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6d2f8a4c519'
+down_revision = 'a9e3c5f7d148'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Filled by `flask reconcile-odometers`
+    op.create_table('odometer_calibration',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('anchor_fillup_id', sa.Integer(), nullable=True),
+    sa.Column('anchor_date', sa.DateTime(), nullable=True),
+    sa.Column('anchor_gps_km', sa.Float(), nullable=True),
+    sa.Column('anchor_odometer_km', sa.Float(), nullable=True),
+    sa.Column('scale', sa.Float(), nullable=False),
+    sa.Column('offset_km', sa.Float(), nullable=False),
+    sa.Column('last_point_id', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['anchor_fillup_id'], ['fill_up.id'], ondelete='SET NULL'),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+
+
+def downgrade():
+    op.drop_table('odometer_calibration')
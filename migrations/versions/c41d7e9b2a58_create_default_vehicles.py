@@ -0,0 +1,30 @@
+"""Create the default vehicle for users that have none
+
+Revision ID: c41d7e9b2a58
+Revises: 8b2e4f6a1c93
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c41d7e9b2a58'
+down_revision = '8b2e4f6a1c93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Vehicle.get_current_vehicle no longer inserts on read
+    op.execute(
+        'INSERT INTO vehicle (user_id, name, tank_capacity_liters, fuel_type, updated_at) '
+        "SELECT u.id, 'My Vehicle', 50.0, 'Petrol', CURRENT_TIMESTAMP FROM \"user\" u "
+        'WHERE NOT EXISTS (SELECT 1 FROM vehicle v WHERE v.user_id = u.id)'
+    )
+
+
+def downgrade():
+    # The inserted rows are indistinguishable from user-created defaults
+    pass
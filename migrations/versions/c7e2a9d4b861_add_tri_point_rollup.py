@@ -0,0 +1,32 @@
+"""Add tri_point_rollup, the per-user watermark of downsample-tri-points
+
+Revision ID: c7e2a9d4b861
+Revises: b6d2f8a4c519
+Create Date: 2026-10-18 23:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7e2a9d4b861'
+down_revision = 'b6d2f8a4c519'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Filled by `flask downsample-tri-points`
+    op.create_table('tri_point_rollup',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('thinned_until', sa.DateTime(), nullable=False),
+    sa.Column('bucket_seconds', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+
+
+def downgrade():
+    op.drop_table('tri_point_rollup')
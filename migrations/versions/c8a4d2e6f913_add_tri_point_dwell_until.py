@@ -0,0 +1,26 @@
+"""Add dwell_until to tri_point for coalesced stationary fixes
+
+Revision ID: c8a4d2e6f913
+Revises: b5e1f7a2d806
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c8a4d2e6f913'
+down_revision = 'b5e1f7a2d806'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('tri_point', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('dwell_until', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('tri_point', schema=None) as batch_op:
+        batch_op.drop_column('dwell_until')
@@ -0,0 +1,41 @@
+"""Add geohash to tri_point and the heatmap_cell counts table
+
+Revision ID: d3b7e9f1a625
+Revises: c8a4d2e6f913
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3b7e9f1a625'
+down_revision = 'c8a4d2e6f913'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Fill in existing rows and their heatmap afterwards with `flask backfill-geohash`
+    with op.batch_alter_table('tri_point', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('geohash', sa.String(length=12), nullable=True))
+        batch_op.create_index('ix_tri_point_user_id_geohash', ['user_id', 'geohash'], unique=False)
+
+    op.create_table('heatmap_cell',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('precision', sa.Integer(), nullable=False),
+    sa.Column('cell', sa.String(length=12), nullable=False),
+    sa.Column('point_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'precision', 'cell')
+    )
+    op.create_index('ix_heatmap_cell_precision_cell', 'heatmap_cell', ['precision', 'cell'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_heatmap_cell_precision_cell', table_name='heatmap_cell')
+    op.drop_table('heatmap_cell')
+    with op.batch_alter_table('tri_point', schema=None) as batch_op:
+        batch_op.drop_index('ix_tri_point_user_id_geohash')
+        batch_op.drop_column('geohash')
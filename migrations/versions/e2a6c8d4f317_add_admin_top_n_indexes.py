@@ -0,0 +1,26 @@
+"""Add indexes for the admin dashboard top-N lists
+
+Revision ID: e2a6c8d4f317
+Revises: 9d4f2b7c6e05
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2a6c8d4f317'
+down_revision = '9d4f2b7c6e05'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_user_created_at', 'user', ['created_at'], unique=False)
+    op.create_index('ix_fill_up_date', 'fill_up', ['date'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_fill_up_date', table_name='fill_up')
+    op.drop_index('ix_user_created_at', table_name='user')
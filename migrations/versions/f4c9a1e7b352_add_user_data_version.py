@@ -0,0 +1,31 @@
+"""Add the user_data_version counters behind the API ETags
+
+Revision ID: f4c9a1e7b352
+Revises: d3b7e9f1a625
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f4c9a1e7b352'
+down_revision = 'd3b7e9f1a625'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Rows are created on the first change; a missing row means version 0
+    op.create_table('user_data_version',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('points_version', sa.Integer(), nullable=False),
+    sa.Column('fillups_version', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+
+
+def downgrade():
+    op.drop_table('user_data_version')
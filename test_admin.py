@@ -0,0 +1,91 @@
+from datetime import datetime
+
+import pytest
+
+from app import db
+from app.cache import admin_stats
+from app.models import TriPoint, User, Vehicle
+from test_fuel_calculation import add_fillups
+from test_vehicle import count_queries
+
+
+@pytest.fixture(autouse=True)
+def fresh_admin_stats():
+    # the cache is process-wide and would otherwise carry counts between tests
+    admin_stats.invalidate()
+    yield
+    admin_stats.invalidate()
+
+
+@pytest.fixture
+def admin_client(app, user):
+    user.is_admin = True
+    db.session.commit()
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user.id)
+    return client
+
+
+def add_points(user, count):
+    db.session.add_all(
+        TriPoint(user_id=user.id, lat=47.9, lon=106.9, odometer_km=0.0, trip_date=datetime(2024, 1, 1))
+        for _ in range(count)
+    )
+    db.session.commit()
+
+
+def test_counts_follow_committed_writes(app, user):
+    counts = admin_stats.get_counts(ttl_seconds=3600)
+    assert counts['tri_point'] == 0
+
+    add_points(user, 3)
+    add_fillups(user, 2)
+    db.session.add(TriPoint(user_id=user.id, lat=0, lon=0, odometer_km=0))
+    db.session.rollback()
+    db.session.delete(TriPoint.query.first())
+    db.session.commit()
+
+    with count_queries() as statements:
+        counts = admin_stats.get_counts(ttl_seconds=3600)
+
+    assert statements == []
+    assert counts == {'user': 1, 'fill_up': 2, 'vehicle': 1, 'tri_point': 2}
+
+
+def test_counts_reload_after_ttl(app, user):
+    admin_stats.get_counts(ttl_seconds=3600)
+    TriPoint.query.delete()
+    db.session.execute(TriPoint.__table__.insert(), [
+        {'user_id': user.id, 'lat': 0, 'lon': 0, 'odometer_km': 0, 'trip_date': datetime(2024, 1, 1)}
+    ] * 4)
+    db.session.commit()
+
+    assert admin_stats.get_counts(ttl_seconds=3600)['tri_point'] == 0
+    assert admin_stats.get_counts(ttl_seconds=0)['tri_point'] == 4
+
+
+def test_dashboard_is_constant_in_table_size(admin_client, user):
+    assert admin_client.get('/admin').status_code == 200
+    add_points(user, 500)
+
+    with count_queries() as statements:
+        response = admin_client.get('/admin')
+
+    assert response.status_code == 200
+    assert not [s for s in statements if 'count(' in s.lower()]
+
+
+def test_delete_user_invalidates_counts(admin_client, user):
+    other = User(license_number='0001ТСТ', password_hash='x')
+    db.session.add(other)
+    db.session.commit()
+    add_fillups(other, 3)
+    admin_stats.get_counts(ttl_seconds=3600)
+
+    admin_client.post(f'/admin/users/{other.id}/delete')
+
+    counts = admin_stats.get_counts(ttl_seconds=3600)
+    assert counts['user'] == 1
+    assert counts['fill_up'] == 0
+    assert counts['vehicle'] == Vehicle.query.count()
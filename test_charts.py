@@ -0,0 +1,49 @@
+from collections import defaultdict
+
+import pytest
+
+from app.models import FillUp
+from test_fuel_calculation import add_fillups
+
+
+def test_monthly_totals_match_python_grouping(user):
+    fillups = add_fillups(user, 120)
+    spent = defaultdict(float)
+    liters = defaultdict(float)
+    efficiencies = defaultdict(list)
+    for fillup in fillups:
+        month = fillup.date.strftime('%Y-%m')
+        spent[month] += fillup.total_cost
+        liters[month] += fillup.fuel_liters
+        if fillup.efficiency_l_per_100km is not None:
+            efficiencies[month].append(fillup.efficiency_l_per_100km)
+
+    totals = FillUp.get_monthly_totals(user.id)
+
+    assert [t['month'] for t in totals] == sorted(spent)
+    for t in totals:
+        assert t['spent'] == pytest.approx(spent[t['month']])
+        assert t['liters'] == pytest.approx(liters[t['month']])
+        expected = efficiencies[t['month']]
+        assert t['efficiency'] == (pytest.approx(sum(expected) / len(expected)) if expected else None)
+
+
+def test_chart_summary(user):
+    fillups = add_fillups(user, 30)
+    efficiencies = [f.efficiency_l_per_100km for f in fillups if f.efficiency_l_per_100km]
+
+    summary = FillUp.get_chart_summary(user.id)
+
+    assert summary['fillup_count'] == 30
+    assert summary['best_efficiency'] == min(efficiencies)
+    assert summary['worst_efficiency'] == max(efficiencies)
+    assert summary['avg_price'] == pytest.approx(sum(f.price_per_liter for f in fillups) / 30)
+    assert summary['total_distance'] == pytest.approx(fillups[-1].odometer_km - fillups[0].odometer_km)
+
+
+def test_charts_page(client, user):
+    assert client.get('/charts').status_code == 200
+    add_fillups(user, 40)
+    response = client.get('/charts')
+    assert response.status_code == 200
+    assert b'spending-labels' in response.data
@@ -0,0 +1,113 @@
+from datetime import datetime, timedelta
+
+from flask import g
+
+from app import db, polyline
+from app.models import UserDataVersion
+from test_fuel_calculation import add_fillups
+from test_last_point_cache import login, make_users
+from test_location import make_points
+from test_vehicle import count_queries
+
+START = datetime(2025, 3, 1, 8, 0, 0)
+
+
+def get(client, url, etag=None, **headers):
+    g.pop('_login_user', None)
+    if etag:
+        headers['If-None-Match'] = etag
+    return client.get(url, headers=headers)
+
+
+def post_points(client, points):
+    g.pop('_login_user', None)
+    response = client.post('/api/location/batch', json={'points': points})
+    assert response.status_code == 201
+    db.session.expire_all()
+
+
+def test_matching_etag_returns_304_before_any_query(app):
+    user, = make_users(1, 'ETAG')
+    add_fillups(user, 4)
+    client = login(app, user)
+    # Between the last two fill-ups, so /api/motor_hour has an interval
+    post_points(client, make_points(20, start=datetime(2024, 1, 8)))
+
+    for url in ('/api/location', '/api/trips/stats', '/api/last_fillup', '/api/motor_hour'):
+        first = get(client, url)
+        assert first.status_code == 200, url
+        etag = first.headers['ETag']
+        assert etag.startswith('W/"')
+        assert first.headers['Cache-Control'] == 'private, no-cache'
+
+        with count_queries() as statements:
+            again = get(client, url, etag)
+        assert again.status_code == 304, url
+        assert again.data == b''
+        assert again.headers['ETag'] == etag
+        # Loading the logged-in user aside, only the version lookup runs
+        assert [s for s in statements if 'FROM user ' not in s and 'FROM "user"' not in s] == [
+            s for s in statements if 'FROM user_data_version' in s
+        ]
+        assert any('FROM user_data_version' in s for s in statements)
+
+
+def test_etag_changes_with_points_and_fillups(app):
+    user, = make_users(1, 'ETAGCHG')
+    add_fillups(user, 2)
+    client = login(app, user)
+    post_points(client, make_points(5))
+
+    location_etag = get(client, '/api/location').headers['ETag']
+    fillup_etag = get(client, '/api/last_fillup').headers['ETag']
+
+    post_points(client, make_points(5, start=START + timedelta(minutes=5)))
+    assert get(client, '/api/location', location_etag).status_code == 200
+    # New points leave fill-up data alone
+    assert get(client, '/api/last_fillup', fillup_etag).status_code == 304
+
+    stats_etag = get(client, '/api/trips/stats').headers['ETag']
+    add_fillups(user, 1, seed=2)
+    assert get(client, '/api/last_fillup', fillup_etag).status_code == 200
+    assert get(client, '/api/trips/stats', stats_etag).status_code == 200
+    # One bump per transaction that touched fill-ups
+    assert UserDataVersion.get_versions(user.id)[1] == 2
+
+
+def test_track_formats_and_users_get_distinct_etags(app):
+    first_user, second_user = make_users(2, 'ETAGVAR')
+    client = login(app, first_user)
+    post_points(client, make_points(5))
+
+    plain = get(client, '/api/location')
+    compact = get(client, '/api/location', Accept=polyline.MIMETYPE)
+    assert plain.headers['ETag'] != compact.headers['ETag']
+    assert 'Accept' in compact.headers['Vary']
+    assert get(client, '/api/location', plain.headers['ETag'], Accept=polyline.MIMETYPE).status_code == 200
+
+    other = login(app, second_user)
+    assert get(other, '/api/location', plain.headers['ETag']).status_code == 200
+
+
+def test_version_bump_is_one_upsert(app):
+    user_id = make_users(1, 'BUMP')[0].id
+    with count_queries() as statements:
+        UserDataVersion.bump(user_id, points=True)
+        UserDataVersion.bump(user_id, points=True, fillups=True)
+
+    assert [s.split()[0] for s in statements] == ['INSERT', 'INSERT']
+    assert UserDataVersion.get_versions(user_id) == (2, 1)
+
+
+def test_capacity_change_bumps_the_version_once(app):
+    user, = make_users(1, 'TANK')
+    add_fillups(user, 20)
+    before = UserDataVersion.get_versions(user.id)
+
+    client = login(app, user)
+    with count_queries() as statements:
+        client.post('/vehicle_settings', data={'name': 'Prius', 'fuel_type': 'Petrol', 'tank_capacity_liters': 35})
+    db.session.expire_all()
+
+    assert len([s for s in statements if 'user_data_version' in s]) == 1
+    assert UserDataVersion.get_versions(user.id) == (before[0], before[1] + 1)
@@ -0,0 +1,130 @@
+from datetime import datetime, timedelta
+
+import pytest
+from flask import g
+
+from app import db
+from app.models import FillUp, FillUpInterval, UserFuelStats
+from test_location import make_points
+from test_vehicle import count_queries
+
+DAY = datetime(2024, 6, 1)
+
+
+def post_fillup(client, day, odometer_km, fuel_liters=30):
+    g.pop('_login_user', None)
+    response = client.post('/add_fillup', data={
+        'date': (DAY + timedelta(days=day)).date().isoformat(), 'odometer_km': odometer_km,
+        'fuel_liters': fuel_liters, 'price_per_liter': 2900, 'is_full_tank': 'y',
+    })
+    assert response.status_code == 302
+    db.session.expire_all()
+
+
+def post_points(client, day, count=60):
+    g.pop('_login_user', None)
+    # Every 30 s, so the track has both moving and idle steps
+    points = make_points(count, start=DAY + timedelta(days=day, hours=8))
+    for i, point in enumerate(points):
+        point['timestamp'] = (DAY + timedelta(days=day, hours=8, seconds=30 * i)).isoformat()
+    response = client.post('/api/location/batch', json={'points': points})
+    assert response.status_code == 201
+    db.session.expire_all()
+
+
+def assert_matches_rebuild(user_id):
+    stored = [
+        (i.start_fillup_id, i.end_fillup_id, i.start_date, i.end_date, i.point_count,
+         pytest.approx(i.distance_km), pytest.approx(i.moving_seconds), pytest.approx(i.idle_seconds))
+        for i in FillUpInterval.query.filter_by(user_id=user_id).order_by(FillUpInterval.start_date)
+    ]
+    FillUpInterval.rebuild(user_id)
+    db.session.flush()
+    rebuilt = [
+        (i.start_fillup_id, i.end_fillup_id, i.start_date, i.end_date, i.point_count,
+         i.distance_km, i.moving_seconds, i.idle_seconds)
+        for i in FillUpInterval.query.filter_by(user_id=user_id).order_by(FillUpInterval.start_date)
+    ]
+    db.session.rollback()
+    assert stored == rebuilt
+
+
+def test_intervals_follow_points_and_fillups(client, user):
+    post_fillup(client, 0, 1000)
+    post_points(client, 1)
+    post_fillup(client, 3, 1300)
+    post_points(client, 4)
+    post_points(client, 5)
+    post_fillup(client, 6, 1650, fuel_liters=40)
+    post_points(client, 7)
+
+    intervals = FillUpInterval.query.filter_by(user_id=user.id).order_by(FillUpInterval.start_date).all()
+    assert [i.point_count for i in intervals] == [60, 120, 60]
+    assert [i.is_open for i in intervals] == [False, False, True]
+    assert intervals[1].distance_km > 0 and intervals[1].idle_seconds > 0
+    assert_matches_rebuild(user.id)
+
+    # A fill-up entered after later points splits the open interval
+    post_points(client, 9)
+    post_fillup(client, 8, 2000)
+    counts = [i.point_count for i in FillUpInterval.query.filter_by(user_id=user.id).order_by(FillUpInterval.start_date)]
+    assert counts == [60, 120, 60, 60]
+    assert_matches_rebuild(user.id)
+
+    # Deleting it merges them again
+    latest = FillUp.query.filter_by(user_id=user.id, odometer_km=2000).one()
+    g.pop('_login_user', None)
+    client.post(f'/delete_fillup/{latest.id}')
+    db.session.expire_all()
+    counts = [i.point_count for i in FillUpInterval.query.filter_by(user_id=user.id).order_by(FillUpInterval.start_date)]
+    assert counts == [60, 120, 120]
+    assert_matches_rebuild(user.id)
+
+
+def test_motor_hour_reads_stored_intervals(client, user):
+    post_fillup(client, 0, 1000)
+    post_points(client, 1)
+    post_fillup(client, 3, 1300)
+    post_points(client, 4)
+    post_fillup(client, 6, 1650, fuel_liters=40)
+    first, second = FillUp.query.filter_by(user_id=user.id).order_by(FillUp.date).all()[1:]
+
+    g.pop('_login_user', None)
+    with count_queries() as statements:
+        latest = client.get('/api/motor_hour').get_json()
+    assert not [s for s in statements if 'tri_point' in s]
+    assert latest['end_fillup_id'] == second.id
+
+    g.pop('_login_user', None)
+    past = client.get(f'/api/motor_hour?fillup_id={first.id}').get_json()
+    interval = db.session.get(FillUpInterval, past['start_fillup_id'])
+    assert past['end_fillup_id'] == first.id
+    assert past['distance_km'] == round(interval.distance_km, 3)
+    assert past['idle_hours'] == round(interval.idle_seconds / 3600.0, 2)
+
+    g.pop('_login_user', None)
+    assert client.get('/api/motor_hour?fillup_id=999999').status_code == 404
+
+
+def stored_best(user_id):
+    return min(f.efficiency_l_per_100km for f in FillUp.query.filter_by(user_id=user_id)
+               if f.efficiency_l_per_100km is not None)
+
+
+def test_best_efficiency_is_a_running_minimum(client, user):
+    for day, odometer_km, fuel_liters in ((0, 1000, 30), (1, 1400, 20), (2, 1700, 45), (3, 2100, 50)):
+        post_fillup(client, day, odometer_km, fuel_liters)
+        if day:
+            stats = db.session.get(UserFuelStats, user.id)
+            assert stats.best_efficiency_l_per_100km == pytest.approx(stored_best(user.id))
+
+    # Removing the best interval's fill-up re-pairs its neighbour
+    best = min((f for f in FillUp.query.filter_by(user_id=user.id) if f.efficiency_l_per_100km),
+               key=lambda f: f.efficiency_l_per_100km)
+    g.pop('_login_user', None)
+    client.post(f'/delete_fillup/{best.id}')
+    db.session.expire_all()
+    stats = db.session.get(UserFuelStats, user.id)
+    assert stats.best_efficiency_l_per_100km == pytest.approx(stored_best(user.id))
+    assert stats.best_efficiency_l_per_100km != pytest.approx(best.efficiency_l_per_100km)
+    assert UserFuelStats.rebuild(user.id) == {}
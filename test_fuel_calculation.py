@@ -0,0 +1,142 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from app.models import FillUp, TankState, Vehicle
+
+
+def add_fillups(user, count, seed=1):
+    """Insert `count` fill-ups with a mix of full/partial tanks and known levels"""
+    rng = random.Random(seed)
+    odometer = 10000.0
+    start = datetime(2024, 1, 1)
+    fillups = []
+    for i in range(count):
+        odometer += rng.uniform(150, 600)
+        liters = rng.uniform(10, 55)
+        price = rng.uniform(2500, 3200)
+        fillups.append(FillUp(
+            user_id=user.id,
+            date=start + timedelta(days=i * 3),
+            odometer_km=round(odometer, 1),
+            fuel_liters=liters,
+            is_full_tank=rng.random() < 0.5,
+            fuel_before_fillup=rng.choice([None, rng.uniform(0, 30), 70.0]),
+            price_per_liter=price,
+            total_cost=liters * price,
+        ))
+    db.session.add_all(fillups)
+    db.session.flush()
+    vehicle = Vehicle.get_current_vehicle(user.id)
+    FillUp.refresh_all_stored_efficiency(user.id, vehicle.tank_capacity_liters)
+    TankState.refresh(user.id, vehicle)
+    db.session.commit()
+    return fillups
+
+
+def legacy_average_efficiency(user_id):
+    """The pairwise loop get_average_efficiency used before the stored columns"""
+    fillups = FillUp.query.filter_by(user_id=user_id).order_by(FillUp.odometer_km, FillUp.id).all()
+    total_distance = total_fuel = 0
+    for i in range(1, len(fillups)):
+        distance = fillups[i].odometer_km - fillups[i - 1].odometer_km
+        if distance > 0:
+            total_distance += distance
+            total_fuel += fillups[i].fuel_liters
+    return (total_fuel / total_distance) * 100 if total_distance > 0 else None
+
+
+def efficiency_map(user_id):
+    """{fill-up id: efficiency} from one walk_intervals pass over the user's fill-ups"""
+    fillups = FillUp.query.filter_by(user_id=user_id).all()
+    tank_capacity = Vehicle.get_current_vehicle(user_id).tank_capacity_liters
+    return {fillup.id: efficiency for fillup, efficiency, _ in FillUp.walk_intervals(fillups, tank_capacity)}
+
+
+def assert_stored_matches(user_id):
+    efficiencies = efficiency_map(user_id)
+    for fillup in FillUp.query.filter_by(user_id=user_id):
+        assert fillup.efficiency_l_per_100km == efficiencies[fillup.id]
+
+
+def test_walk_intervals_matches_calculate_efficiency(user):
+    fillups = add_fillups(user, 200)
+    # Shuffle insertion order relative to odometer order
+    random.Random(2).shuffle(fillups)
+
+    efficiencies = efficiency_map(user.id)
+
+    assert len(efficiencies) == len(fillups)
+    for fillup in fillups:
+        expected = fillup.calculate_efficiency()
+        actual = efficiencies[fillup.id]
+        if expected is None:
+            assert actual is None
+        else:
+            assert actual == expected
+
+
+def test_walk_intervals_skips_equal_odometer(user):
+    fillups = add_fillups(user, 3)
+    fillups[2].odometer_km = fillups[1].odometer_km
+    fillups[1].is_full_tank = fillups[2].is_full_tank = True
+    fillups[0].is_full_tank = True
+    db.session.commit()
+
+    efficiencies = efficiency_map(user.id)
+
+    # Both rows share an odometer, so both pair with the first fill-up
+    assert efficiencies[fillups[1].id] == fillups[1].calculate_efficiency()
+    assert efficiencies[fillups[2].id] == fillups[2].calculate_efficiency()
+
+
+def test_history_page_renders_efficiencies(client, user):
+    add_fillups(user, 20)
+
+    response = client.get('/history')
+
+    assert response.status_code == 200
+    assert 'л/100км'.encode() in response.data
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 1000])
+def test_refresh_all_stored_efficiency_in_chunks(user, chunk_size):
+    fillups = add_fillups(user, 50)
+    # Duplicate odometers around chunk boundaries
+    for i in (6, 7, 13, 14, 20):
+        fillups[i].odometer_km = fillups[i - 1].odometer_km
+    FillUp.query.update({FillUp.efficiency_l_per_100km: None, FillUp.distance_since_prev_km: None})
+    db.session.commit()
+
+    updated = FillUp.refresh_all_stored_efficiency(user.id, 60.0, chunk_size=chunk_size)
+
+    assert updated == 50
+    assert_stored_matches(user.id)
+    assert FillUp.get_average_efficiency(user.id) == pytest.approx(legacy_average_efficiency(user.id))
+
+
+def test_add_and_delete_fillup_refresh_neighbours(client, user):
+    fillups = add_fillups(user, 10)
+    response = client.post('/add_fillup', data={
+        'date': '2024-02-01', 'odometer_km': fillups[-1].odometer_km + 400, 'fuel_liters': 20,
+        'price_per_liter': 2800, 'is_full_tank': 'y',
+    })
+    assert response.status_code == 302
+    assert FillUp.query.count() == 11
+    assert_stored_matches(user.id)
+
+    client.post(f'/delete_fillup/{fillups[3].id}')
+    assert FillUp.query.count() == 10
+    assert_stored_matches(user.id)
+    assert FillUp.get_average_efficiency(user.id) == pytest.approx(legacy_average_efficiency(user.id))
+
+
+def test_tank_capacity_change_refreshes_all(client, user):
+    add_fillups(user, 20)
+
+    client.post('/vehicle_settings', data={'name': 'Prius', 'fuel_type': 'Petrol', 'tank_capacity_liters': 35})
+
+    assert Vehicle.get_current_vehicle(user.id).tank_capacity_liters == 35
+    assert_stored_matches(user.id)
@@ -0,0 +1,52 @@
+import pytest
+
+from app import db
+from app.models import FillUp, UserFuelStats
+from test_fuel_calculation import add_fillups, legacy_average_efficiency
+
+
+def post_fillup(client, odometer_km, fuel_liters=30, price=2900):
+    return client.post('/add_fillup', data={
+        'date': '2024-06-01', 'odometer_km': odometer_km, 'fuel_liters': fuel_liters,
+        'price_per_liter': price, 'is_full_tank': 'y',
+    })
+
+
+def test_snapshot_follows_inserts_and_deletes(client, user):
+    for i in range(8):
+        assert post_fillup(client, 1000 + i * 350, fuel_liters=25 + i).status_code == 302
+    fillups = FillUp.query.order_by(FillUp.odometer_km).all()
+    client.post(f'/delete_fillup/{fillups[3].id}')
+    client.post(f'/delete_fillup/{fillups[0].id}')
+
+    stats = db.session.get(UserFuelStats, user.id)
+    db.session.refresh(stats)
+
+    assert stats.fillup_count == 6
+    assert UserFuelStats.rebuild(user.id) == {}
+    assert stats.average_efficiency == pytest.approx(legacy_average_efficiency(user.id))
+
+
+def test_rebuild_reports_drift(app, user):
+    add_fillups(user, 10)
+    assert UserFuelStats.rebuild(user.id)['fillup_count'] == (0, 10)
+    db.session.commit()
+
+    stats = db.session.get(UserFuelStats, user.id)
+    stats.total_spent += 500
+    db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=['check-fuel-stats'])
+
+    assert 'total_spent' in result.output
+    assert UserFuelStats.rebuild(user.id) == {}
+
+
+def test_index_reads_snapshot(client, user):
+    post_fillup(client, 1000)
+    post_fillup(client, 1400, fuel_liters=40)
+
+    response = client.get('/')
+
+    assert response.status_code == 200
+    assert '10.0 L/100km'.encode() in response.data
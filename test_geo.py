@@ -0,0 +1,142 @@
+import math
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import geo
+from app.models import FillUp, TriPoint
+from app import db
+from test_fuel_calculation import add_fillups
+
+
+def random_track(count, seed=3):
+    """Drive with stops, jitter, repeated fixes and a clock step backwards"""
+    rng = random.Random(seed)
+    lat, lon, when = 47.9, 106.9, datetime(2024, 1, 1)
+    lats, lons, dates = [], [], []
+    for i in range(count):
+        mode = rng.random()
+        if mode < 0.6:
+            lat += rng.uniform(0.0001, 0.001)
+            lon += rng.uniform(-0.0005, 0.0005)
+        elif mode < 0.8:
+            lat += rng.uniform(-0.00002, 0.00002)
+        when += timedelta(seconds=rng.choice([1, 1, 2, 5, 30, 0]) if i % 50 else -3)
+        lats.append(lat)
+        lons.append(lon)
+        dates.append(when)
+    return lats, lons, dates
+
+
+def legacy_trips_stats(lats, lons, dates):
+    """The per-pair loop trips_stats ran before app.geo"""
+    total = moving = idle = max_speed = speed_sum = 0.0
+    samples = 0
+    for i in range(1, len(lats)):
+        dt = (dates[i] - dates[i - 1]).total_seconds()
+        if dt <= 0:
+            continue
+        d_km = geo.haversine_km(lats[i - 1], lons[i - 1], lats[i], lons[i])
+        if d_km < 0.005:
+            d_km = 0.0
+        total += d_km
+        if d_km > 0:
+            speed = d_km / dt * 3600.0
+            if speed >= 2.0:
+                moving += dt
+                max_speed = max(max_speed, speed)
+                speed_sum += speed
+                samples += 1
+            else:
+                idle += dt
+    return total, moving, idle, max_speed, speed_sum / samples if samples else 0.0
+
+
+def legacy_motor_hour(lats, lons, dates):
+    """The per-pair loop motor_hour_norm ran before app.geo"""
+    total = idle = 0.0
+    for i in range(1, len(lats)):
+        dt = (dates[i] - dates[i - 1]).total_seconds()
+        if dt <= 0:
+            continue
+        d_km = geo.haversine_km(lats[i - 1], lons[i - 1], lats[i], lons[i])
+        if d_km < 0.01:
+            d_km = 0.0
+        total += d_km
+        if d_km / dt * 3600.0 < 2.0:
+            idle += dt
+    return total, idle
+
+
+BACKENDS = [False] + ([True] if geo.HAVE_NUMPY else [])
+
+
+@pytest.mark.parametrize('use_numpy', BACKENDS)
+def test_summarize_movement_matches_legacy_loops(use_numpy):
+    lats, lons, dates = random_track(3000)
+
+    stats = geo.summarize_movement(lats, lons, dates, 0.005, 2.0, stationary_is_idle=False, use_numpy=use_numpy)
+    expected = legacy_trips_stats(lats, lons, dates)
+    actual = (stats['distance_km'], stats['moving_seconds'], stats['idle_seconds'],
+              stats['max_speed_kmh'], stats['avg_speed_kmh'])
+    assert actual == pytest.approx(expected, rel=1e-9)
+
+    stats = geo.summarize_movement(lats, lons, dates, 0.01, 2.0, use_numpy=use_numpy)
+    assert (stats['distance_km'], stats['idle_seconds']) == pytest.approx(legacy_motor_hour(lats, lons, dates), rel=1e-9)
+
+
+@pytest.mark.parametrize('use_numpy', BACKENDS)
+def test_chain_odometer_matches_stepwise_sum(use_numpy):
+    lats, lons, _ = random_track(500)
+
+    readings = geo.chain_odometer(12.5, lats, lons, TriPoint.JITTER_KM, use_numpy=use_numpy)
+
+    odometer = 12.5
+    for i, reading in enumerate(readings, start=1):
+        odometer += TriPoint.step_km(lats[i - 1], lons[i - 1], lats[i], lons[i])
+        assert reading == pytest.approx(odometer, rel=1e-12)
+    assert len(readings) == len(lats) - 1
+
+
+def test_short_tracks():
+    assert geo.summarize_movement([47.9], [106.9], [datetime(2024, 1, 1)], 0.005, 2.0)['distance_km'] == 0.0
+    assert list(geo.chain_odometer(0.0, [47.9], [106.9], 0.005)) == []
+    # One degree of latitude
+    assert geo.haversine_km(0.0, 0.0, 1.0, 0.0) == pytest.approx(math.pi * 6371.0 / 180)
+
+
+def test_trips_stats_endpoint(client, user):
+    lats, lons, dates = random_track(300)
+    db.session.add_all(TriPoint(user_id=user.id, lat=lat, lon=lon, odometer_km=0.0, trip_date=when)
+                       for lat, lon, when in zip(lats, lons, dates))
+    db.session.commit()
+
+    stats = client.get('/api/trips/stats').get_json()
+
+    ordered = sorted(zip(dates, lats, lons), key=lambda p: p[0])
+    total, moving, idle, max_speed, _ = legacy_trips_stats([p[1] for p in ordered], [p[2] for p in ordered],
+                                                           [p[0] for p in ordered])
+    assert stats['total_points'] == 300
+    assert stats['total_distance_km'] == round(total, 3)
+    assert stats['moving_time_minutes'] == round(moving / 60.0, 1)
+    assert stats['idle_time_minutes'] == round(idle / 60.0, 1)
+    assert stats['max_speed_kmh'] == round(max_speed, 1)
+    assert stats['last_update'] == ordered[-1][0].isoformat()
+
+
+def test_motor_hour_endpoint(client, user):
+    add_fillups(user, 3)
+    prev, curr = FillUp.query.filter_by(user_id=user.id).order_by(FillUp.date).all()[-2:]
+    lats, lons, _ = random_track(200)
+    step = (curr.date - prev.date) / 250
+    dates = [prev.date + step * i for i in range(200)]
+    db.session.add_all(TriPoint(user_id=user.id, lat=lat, lon=lon, odometer_km=0.0, trip_date=when)
+                       for lat, lon, when in zip(lats, lons, dates))
+    db.session.commit()
+
+    result = client.get('/api/motor_hour').get_json()
+
+    distance, idle = legacy_motor_hour(lats, lons, dates)
+    assert result['distance_km'] == round(distance, 3)
+    assert result['idle_hours'] == round(idle / 3600.0, 2)
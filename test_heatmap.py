@@ -0,0 +1,108 @@
+from datetime import datetime, timedelta
+
+import pytest
+from flask import g
+
+from app import db, geo
+from app.models import HeatmapCell, TriPoint
+from test_last_point_cache import login, make_users
+from test_vehicle import count_queries
+
+START = datetime(2024, 1, 1, 8)
+
+
+def grid(count, lat=47.9, lon=106.9, step=0.001, start=START):
+    """count x count fixes ~110 m apart, one second apart"""
+    return [{'lat': lat + row * step, 'lon': lon + col * step,
+             'timestamp': (start + timedelta(seconds=row * count + col)).isoformat()}
+            for row in range(count) for col in range(count)]
+
+
+@pytest.mark.parametrize('lat, lon', [(47.9185, 106.9176), (-33.8688, 151.2093), (0.0, 0.0), (89.99, -179.99)])
+def test_geohash_cells_contain_their_points(lat, lon):
+    for precision in range(1, 10):
+        cell = geo.geohash_encode(lat, lon, precision)
+        south, west, north, east = geo.geohash_bounds(cell)
+        assert south <= lat <= north and west <= lon <= east
+        assert geo.geohash_encode(lat, lon, 9).startswith(cell)
+
+
+def test_cover_ranges_contain_every_point_in_the_box():
+    south, west, north, east = 47.905, 106.905, 47.912, 106.918
+    precision, cells = geo.geohash_cover(south, west, north, east, 9, max_cells=32)
+    assert len(cells) <= 32
+    ranges = geo.geohash_ranges(cells)
+    assert len(ranges) <= len(cells)
+    for point in grid(30, lat=47.9, lon=106.9, step=0.0007):
+        geohash = geo.geohash_encode(point['lat'], point['lon'], 9)
+        inside = south <= point['lat'] <= north and west <= point['lon'] <= east
+        if inside:
+            assert any(low <= geohash < high for low, high in ranges)
+
+
+def test_viewport_returns_only_points_inside(client, user):
+    client.post('/api/location/batch', json=grid(20))
+    g.pop('_login_user', None)
+
+    bbox = '106.9045,47.9045,106.9105,47.9125'
+    with count_queries() as statements:
+        points = client.get(f'/api/location?bbox={bbox}&limit=1000').get_json()
+
+    expected = [(p.lat, p.lon) for p in TriPoint.query.filter(
+        TriPoint.lat.between(47.9045, 47.9125), TriPoint.lon.between(106.9045, 106.9105)
+    ).order_by(TriPoint.trip_date)]
+    assert [(p['lat'], p['lon']) for p in points] == expected
+    assert len(expected) == 6 * 8
+    sql = next(s for s in statements if 'FROM tri_point' in s)
+    assert 'geohash >=' in sql
+
+    since = (START + timedelta(seconds=10 * 20)).isoformat()
+    later = client.get(f'/api/location?bbox={bbox}&since={since}&limit=1000').get_json()
+    assert [(p['lat'], p['lon']) for p in later] == expected[-3 * 6:]
+
+    assert client.get('/api/location?bbox=1,2,3').status_code == 400
+    assert client.get('/api/location?bbox=170,0,-170,10').status_code == 400
+
+
+def test_heatmap_counts_match_a_rebuild(app, client, user):
+    client.post('/api/location/batch', json=grid(15)[:100])
+    for point in grid(15)[100:110]:
+        client.post('/api/location', json=point)
+    client.post('/api/location/batch', json=grid(15)[110:])
+
+    def cells():
+        return sorted((c.precision, c.cell, c.point_count) for c in HeatmapCell.query.filter_by(user_id=user.id))
+    incremental = cells()
+    HeatmapCell.rebuild(user.id)
+    assert cells() == incremental
+    assert sum(count for precision, _, count in incremental if precision == 7) == 225
+
+
+def test_heatmap_endpoint_by_zoom_and_fleet(app, client, user):
+    client.post('/api/location/batch', json=grid(10))
+    other, = make_users(1, 'HEAT')
+    other_client = login(app, other)
+    other_client.post('/api/location/batch', json=grid(10, start=START + timedelta(days=1)))
+
+    bbox = '106.85,47.85,106.95,47.95'
+    g.pop('_login_user', None)
+    with count_queries() as statements:
+        mine = other_client.get(f'/api/heatmap?bbox={bbox}&zoom=15').get_json()
+    assert not [s for s in statements if 'FROM tri_point' in s]
+    assert mine['scope'] == 'user'
+    assert mine['precision'] == 7
+    assert sum(cell['count'] for cell in mine['cells']) == 100
+
+    coarse = other_client.get(f'/api/heatmap?bbox={bbox}&zoom=8').get_json()
+    assert coarse['precision'] < mine['precision']
+    assert [cell['count'] for cell in coarse['cells']] == [100]
+
+    assert other_client.get(f'/api/heatmap?bbox={bbox}&scope=fleet').status_code == 403
+    other.is_admin = True
+    db.session.commit()
+    g.pop('_login_user', None)
+    fleet = other_client.get(f'/api/heatmap?bbox={bbox}&precision=5&scope=fleet').get_json()
+    assert sum(cell['count'] for cell in fleet['cells']) == 200
+
+    assert other_client.get('/api/heatmap').status_code == 400
+    assert other_client.get(f'/api/heatmap?bbox={bbox}&precision=9').status_code == 400
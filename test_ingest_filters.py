@@ -0,0 +1,137 @@
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from app.cache import NoCacheBackend, last_points
+from app.ingest import ingest_totals
+from app.models import FillUp, FillUpInterval, TriPoint, Trip
+from test_fillup_intervals import assert_matches_rebuild as assert_interval_matches_rebuild
+from test_trip_stats import assert_matches_rebuild
+from test_trips import START, route, snapshot
+
+
+@pytest.fixture(autouse=True)
+def filters(app):
+    app.config['INGEST_FILTERS'] = 'accuracy,outlier,stationary'
+    ingest_totals.reset()
+    yield
+    ingest_totals.reset()
+
+
+def parked(count, lat, start, seconds=10):
+    """Fixes wobbling 1-2 m around one spot"""
+    return [{'lat': lat + (0.00001 if i % 2 else -0.00001), 'lon': 106.9, 'accuracy': 8.0,
+             'timestamp': (start + timedelta(seconds=seconds * (i + 1))).isoformat()} for i in range(count)]
+
+
+def stored(user):
+    db.session.expire_all()
+    return TriPoint.query.filter_by(user_id=user.id).order_by(TriPoint.trip_date).all()
+
+
+def test_parking_is_stored_as_one_row_with_a_dwell(client, user):
+    drive = route((20, 0.0001, 5))
+    arrived = datetime.fromisoformat(drive[-1]['timestamp'])
+    wait = parked(60, drive[-1]['lat'], arrived)
+    leave = route((20, 0.0001, 5), start=arrived + timedelta(minutes=10))
+    for point in leave:
+        point['lat'] += drive[-1]['lat'] - 47.9
+
+    client.post('/api/location/batch', json=drive + wait[:30])
+    for point in wait[30:40]:
+        response = client.post('/api/location', json=point)
+        assert response.status_code == 200
+        assert response.get_json()['saved'] == 0
+    report = client.post('/api/location/batch', json=wait[40:] + leave).get_json()
+
+    assert report['received'] == 40
+    assert report['saved'] == 20
+    assert report['dropped']['stationary'] == 20
+    rows = stored(user)
+    assert len(rows) == 40
+    stop = rows[19]
+    assert stop.dwell_until == datetime.fromisoformat(wait[-1]['timestamp'])
+    assert stop.dwell_seconds == 600
+    assert rows[20].odometer_km > stop.odometer_km > 0
+
+    assert_matches_rebuild(user.id)
+    incremental = snapshot(user.id)
+    Trip.rebuild(user.id)
+    assert snapshot(user.id) == incremental
+    # Ten minutes parked ends the first trip
+    assert len(incremental) == 2
+
+
+def test_a_cold_cache_does_not_count_a_dwell_twice(client, user):
+    db.session.add(FillUp(user_id=user.id, date=START - timedelta(days=1), odometer_km=1000, fuel_liters=30,
+                          is_full_tank=True, price_per_liter=2900, total_cost=87000))
+    FillUpInterval.rebuild(user.id)
+    db.session.commit()
+    # Every fix reads the last point back from the database
+    last_points.backend = NoCacheBackend()
+    drive = route((20, 0.0001, 5))
+    wait = parked(30, drive[-1]['lat'], datetime.fromisoformat(drive[-1]['timestamp']))
+
+    client.post('/api/location/batch', json=drive + wait[:10])
+    for point in wait[10:]:
+        client.post('/api/location', json=point)
+
+    interval = FillUpInterval.query.filter_by(user_id=user.id).one()
+    assert interval.idle_seconds == pytest.approx(300)
+    assert_interval_matches_rebuild(user.id)
+
+
+def test_inaccurate_fixes_and_spikes_are_dropped(client, user):
+    points = route((30, 0.0001, 5))
+    points[10]['accuracy'] = 500.0
+    points[20]['lat'] += 0.05  # 5.5 km away for one fix
+
+    report = client.post('/api/location/batch', json=points).get_json()
+
+    assert report['received'] == 30
+    assert report['saved'] == 28
+    assert report['dropped'] == {'accuracy': 1, 'outlier': 1, 'stationary': 0}
+    assert max(row.odometer_km for row in stored(user)) == pytest.approx(29 * 0.0001 * 111.19, rel=0.01)
+
+    totals = ingest_totals.as_dict()
+    assert totals['received'] == 30 and totals['saved'] == 28
+
+
+def test_a_long_gap_resyncs_the_outlier_filter(client, user):
+    client.post('/api/location/batch', json=route((5, 0.0001, 5)))
+    # Reappears 20 km away an hour later, e.g. tracking was off on the road
+    later = route((5, 0.0001, 5), start=START + timedelta(hours=1))
+    for point in later:
+        point['lat'] += 0.2
+    assert client.post('/api/location/batch', json=later).get_json()['saved'] == 5
+
+
+def test_filters_can_be_turned_off(app, client, user):
+    app.config['INGEST_FILTERS'] = ''
+    report = client.post('/api/location/batch', json=parked(10, 47.9, START)).get_json()
+    assert report['saved'] == 10
+    assert report['dropped'] == {}
+
+
+def test_totals_add_up_across_threads():
+    report = {'received': 3, 'saved': 2, 'dropped': {'stationary': 1}}
+    threads = [threading.Thread(target=lambda: [ingest_totals.add(report) for _ in range(2000)]) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    totals = ingest_totals.as_dict()
+    assert (totals['received'], totals['saved'], totals['dropped']) == (48000, 32000, {'stationary': 16000})
+
+
+def test_admin_report_totals_the_process(client, user):
+    client.post('/api/location/batch', json=parked(10, 47.9, START))
+    user.is_admin = True
+    db.session.commit()
+
+    totals = client.get('/admin/ingest').get_json()
+    assert totals['filters'] == ['accuracy', 'outlier', 'stationary']
+    assert (totals['received'], totals['saved'], totals['saved_ratio']) == (10, 1, 0.1)
@@ -0,0 +1,117 @@
+import random
+from datetime import datetime, timedelta
+
+from flask import g
+
+from app import db
+from app.cache import LocalLRUBackend, NoCacheBackend, last_points
+from app.models import TriPoint, User
+from test_location import make_points, stored_points
+from test_vehicle import count_queries
+
+
+def make_users(count, prefix):
+    users = [User(license_number=f'{prefix}{i:03d}', password_hash='x') for i in range(count)]
+    db.session.add_all(users)
+    db.session.commit()
+    return users
+
+
+def login(app, user):
+    # Requests share the fixture's app context, so drop the cached login
+    g.pop('_login_user', None)
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user.id)
+    return client
+
+
+def replay(app, users, plan):
+    """Send each (user index, kind, points) step of plan as that user"""
+    clients = [login(app, user) for user in users]
+    for index, kind, points in plan:
+        g.pop('_login_user', None)
+        if kind == 'single':
+            for point in points:
+                assert clients[index].post('/api/location', json=point).status_code == 201
+        else:
+            assert clients[index].post('/api/location/batch', json=points).status_code == 201
+    return [[p.odometer_km for p in stored_points(user)] for user in users]
+
+
+def test_last_point_is_read_from_the_database_by_default(client, user):
+    points = make_points(3)
+    client.post('/api/location', json=points[0])
+
+    with count_queries() as statements:
+        client.post('/api/location', json=points[1])
+
+    assert isinstance(last_points.backend, NoCacheBackend)
+    assert any(s.lstrip().upper().startswith('SELECT') and 'tri_point' in s for s in statements)
+
+
+def test_ingest_does_not_read_tri_point_in_steady_state(client, user):
+    last_points.backend = LocalLRUBackend()
+    points = make_points(5)
+    client.post('/api/location', json=points[0])
+
+    with count_queries() as statements:
+        client.post('/api/location', json=points[1])
+        client.post('/api/location/batch', json=points[2:])
+
+    reads = [s for s in statements if s.lstrip().upper().startswith('SELECT') and 'tri_point' in s]
+    assert reads == []
+    assert last_points.get(user.id).odometer_km == stored_points(user)[-1].odometer_km
+
+
+def test_interleaved_requests_match_uncached_ingest(app):
+    rng = random.Random(7)
+    streams = [make_points(40, start=datetime(2024, 1, 1) + timedelta(hours=i), step=0.0005 * (i + 1))
+               for i in range(3)]
+    # A late fix, older than what is already stored, must not become the
+    # point the next fix is chained from
+    late = dict(streams[1][10], timestamp=(datetime(2024, 1, 1, 1) - timedelta(minutes=5)).isoformat())
+    streams[1].insert(25, late)
+
+    plan = []
+    cursors = [0, 0, 0]
+    while any(cursor < len(stream) for cursor, stream in zip(cursors, streams)):
+        index = rng.choice([i for i in range(3) if cursors[i] < len(streams[i])])
+        size = rng.randint(1, 6)
+        chunk = streams[index][cursors[index]:cursors[index] + size]
+        cursors[index] += size
+        plan.append((index, rng.choice(['single', 'batch']), chunk))
+
+    # Two entries for three users keeps evicting, so misses are exercised too
+    last_points.backend = LocalLRUBackend(maxsize=2)
+    cached = replay(app, make_users(3, 'C'), plan)
+    last_points.backend = NoCacheBackend()
+    uncached = replay(app, make_users(3, 'U'), plan)
+
+    assert cached == uncached
+    assert all(len(odometers) > 0 for odometers in cached)
+
+
+def test_rolled_back_insert_is_not_cached(client, user):
+    client.post('/api/location', json=make_points(1)[0])
+    before = last_points.get(user.id)
+
+    last_points.remember(db.session, user.id, 48.5, 107.5, 999.0, datetime(2030, 1, 1))
+    db.session.rollback()
+
+    assert last_points.get(user.id) == before
+
+
+def test_delete_user_invalidates_last_point(app, client, user):
+    admin = make_users(1, 'A')[0]
+    admin.is_admin = True
+    db.session.commit()
+    last_points.backend = LocalLRUBackend()
+    client.post('/api/location', json=make_points(1)[0])
+    assert last_points.backend.get(user.id) is not None
+
+    user_id = user.id
+    login(app, admin).post(f'/admin/users/{user_id}/delete')
+
+    assert last_points.backend.get(user_id) is None
+    assert TriPoint.query.filter_by(user_id=user_id).count() == 0
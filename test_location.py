@@ -0,0 +1,110 @@
+from datetime import datetime, timedelta
+
+from app import db
+from app.cache import last_points
+from app.models import TankState, TriPoint
+from test_fuel_calculation import add_fillups
+from test_vehicle import count_queries
+
+START = datetime(2024, 1, 1, 8, 0)
+
+
+def make_points(count, start=START, step=0.001):
+    # ~110 m north per point, with every third point repeating the previous
+    # fix so the jitter threshold is exercised too
+    points = []
+    lat = 47.9
+    for i in range(count):
+        if i % 3 != 2:
+            lat += step
+        points.append({
+            'lat': lat,
+            'lon': 106.9,
+            'accuracy': 5.0,
+            'timestamp': (start + timedelta(seconds=i)).isoformat(),
+        })
+    return points
+
+
+def stored_points(user):
+    return TriPoint.query.filter_by(user_id=user.id).order_by(TriPoint.trip_date, TriPoint.id).all()
+
+
+def test_batch_matches_single_point_ingestion(client, user):
+    points = make_points(12)
+    for point in points[:6]:
+        assert client.post('/api/location', json=point).status_code == 201
+    expected = [p.odometer_km for p in stored_points(user)]
+    TriPoint.query.delete()
+    db.session.commit()
+    last_points.invalidate(user.id)
+
+    response = client.post('/api/location/batch', json={'points': points[:6]})
+
+    assert response.status_code == 201
+    assert response.get_json()['saved'] == 6
+    assert [p.odometer_km for p in stored_points(user)] == expected
+
+
+def test_single_fix_reports_its_row(client, user):
+    points = make_points(2)
+    client.post('/api/location', json=points[0])
+
+    body = client.post('/api/location', json=points[1]).get_json()
+
+    latest = stored_points(user)[-1]
+    assert body['point_id'] == latest.id
+    assert body['odometer_km'] == body['incremental_km'] == latest.odometer_km > 0
+
+
+def test_batch_continues_from_last_stored_point(client, user):
+    add_fillups(user, 1)
+    points = make_points(10)
+    for point in points:
+        client.post('/api/location', json=point)
+    expected = [p.odometer_km for p in stored_points(user)]
+    TriPoint.query.delete()
+    db.session.commit()
+    last_points.invalidate(user.id)
+
+    client.post('/api/location', json=points[0])
+    client.post('/api/location/batch', json=points[1:5])
+    response = client.post('/api/location/batch', json={'points': points[5:]})
+
+    stored = stored_points(user)
+    assert [p.odometer_km for p in stored] == expected
+    assert response.get_json()['odometer_km'] == expected[-1]
+    assert stored[-1].accuracy == 5.0
+    db.session.expire_all()
+    assert db.session.get(TankState, user.id).current_odometer_km == expected[-1]
+
+
+def test_batch_is_one_insert_and_one_commit(client, user):
+    with count_queries() as statements:
+        response = client.post('/api/location/batch', json={'points': make_points(50)})
+
+    assert response.status_code == 201
+    inserts = [s for s in statements if s.lstrip().upper().startswith('INSERT INTO TRI_POINT')]
+    assert len(inserts) == 1
+    assert len(stored_points(user)) == 50
+
+
+def test_batch_rejects_bad_input(client, app, user):
+    assert client.post('/api/location/batch', json={'points': []}).status_code == 400
+
+    response = client.post('/api/location/batch', json=[{'lat': 1.0, 'lon': 2.0}, {'lat': 1.0}])
+    assert response.status_code == 400
+    assert response.get_json()['invalid_indexes'] == [1]
+
+    app.config['LOCATION_BATCH_MAX_POINTS'] = 5
+    assert client.post('/api/location/batch', json=make_points(6)).status_code == 413
+    assert stored_points(user) == []
+
+
+def test_map_page_buffers_uploads(client):
+    response = client.get('/map')
+
+    assert response.status_code == 200
+    page = response.get_data(as_text=True)
+    assert page.count('function flushLocations()') == 1
+    assert '/api/location/batch' in page
@@ -0,0 +1,120 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from app.models import FillUp, OdometerCalibration, TankState, TriPoint, User
+from test_vehicle import count_queries
+
+START = datetime(2024, 6, 1, 8, 0, 0)
+
+
+def add_points(user, gps_kms, start=START):
+    """One point per hour with the given GPS odometer values"""
+    db.session.add_all(TriPoint(user_id=user.id, lat=47.9, lon=106.9, odometer_km=km,
+                                trip_date=start + timedelta(hours=i))
+                       for i, km in enumerate(gps_kms))
+    db.session.commit()
+
+
+def add_fillup(user, when, odometer_km):
+    fillup = FillUp(user_id=user.id, date=when, odometer_km=odometer_km, fuel_liters=30, is_full_tank=True,
+                    price_per_liter=2900, total_cost=30 * 2900)
+    db.session.add(fillup)
+    db.session.commit()
+    return fillup
+
+
+def reconcile(app, user):
+    """Run the job and return the user's calibration"""
+    result = app.test_cli_runner().invoke(args=['reconcile-odometers'])
+    assert '✅' in result.output, result.output
+    db.session.expire_all()
+    return db.session.get(OdometerCalibration, user.id)
+
+
+def test_anchors_fillups_and_rescales(app, user):
+    # The GPS odometer starts at 0 while the vehicle reads 50 000 km
+    add_points(user, [0, 10, 20, 30])
+    add_fillup(user, START + timedelta(hours=1, minutes=30), 50000)
+    calibration = reconcile(app, user)
+    assert calibration.scale == 1.0
+    assert calibration.to_odometer(10) == pytest.approx(50000)
+    assert calibration.to_odometer(30) == pytest.approx(50020)
+
+    # The GPS track undercounted the next 100 km by 10 %
+    add_points(user, [40, 60, 100, 110], start=START + timedelta(hours=4))
+    add_fillup(user, START + timedelta(hours=6, minutes=30), 50100)
+    calibration = reconcile(app, user)
+    assert calibration.scale == pytest.approx(100 / 90)
+    assert calibration.to_odometer(100) == pytest.approx(50100)
+    assert calibration.to_odometer(109) == pytest.approx(50110)
+
+
+def test_implausible_ratio_keeps_the_previous_scale(app, user):
+    add_points(user, [0, 10, 20, 30])
+    add_fillup(user, START, 50000)
+    add_fillup(user, START + timedelta(hours=2, minutes=30), 50500)
+
+    calibration = reconcile(app, user)
+
+    # 500 km on the odometer against 20 km of GPS track: tracking was off
+    assert calibration.scale == 1.0
+    assert calibration.anchor_odometer_km == 50500
+    assert calibration.to_odometer(20) == pytest.approx(50500)
+
+
+def test_job_reads_only_new_points(app, user):
+    other = User(license_number='9999ОДО', password_hash='x')
+    db.session.add(other)
+    db.session.commit()
+    add_points(user, [0, 10])
+    add_points(other, [0, 5])
+    reconcile(app, user)
+    assert OdometerCalibration.pending_users() == {}
+
+    add_points(user, [20], start=START + timedelta(hours=2))
+    assert list(OdometerCalibration.pending_users()) == [user.id]
+
+    # A fill-up entered after its points were seen is still picked up
+    reconcile(app, user)
+    add_fillup(user, START + timedelta(hours=1), 50000)
+    assert list(OdometerCalibration.pending_users()) == [user.id]
+    assert reconcile(app, user).anchor_odometer_km == 50000
+
+
+def test_day_only_fillups_anchor_to_the_end_of_their_day(app, user):
+    # The fill-up form stores the day only, at midnight. Points run from
+    # 08:00 on 1 June to 11:00 on 2 June, 10 km an hour.
+    add_points(user, [i * 10 for i in range(28)])
+    first = add_fillup(user, datetime(2024, 6, 1), 50000)
+    calibration = reconcile(app, user)
+    assert calibration.anchor_fillup_id == first.id
+    # The last point of 1 June is 23:00, 150 km into the track
+    assert calibration.anchor_gps_km == 150
+
+    # A second fill-up on the same day, entered after the first was anchored
+    second = add_fillup(user, datetime(2024, 6, 1), 50001)
+    assert list(OdometerCalibration.pending_users()) == [user.id]
+    calibration = reconcile(app, user)
+    assert calibration.anchor_fillup_id == second.id
+    assert calibration.anchor_odometer_km == 50001
+    assert OdometerCalibration.pending_users() == {}
+
+
+def test_fuel_status_uses_the_calibrated_odometer(client, user):
+    add_points(user, [0, 10, 20])
+    fillup = add_fillup(user, START + timedelta(minutes=30), 50000)
+    db.session.add(TankState(user_id=user.id, last_fillup_id=fillup.id, last_fillup_date=fillup.date,
+                             last_fillup_odometer_km=50000, fuel_after_fillup=50,
+                             efficiency_l_per_100km=10, current_odometer_km=20))
+    db.session.commit()
+    reconcile(client.application, user)
+
+    with count_queries() as statements:
+        status = FillUp.get_current_fuel_status(user.id)
+
+    assert status['current_odometer'] == pytest.approx(50020)
+    assert status['distance_driven'] == pytest.approx(20)
+    assert status['remaining_fuel'] == pytest.approx(48)
+    assert not [s for s in statements if 'tri_point' in s or 'fill_up' in s]
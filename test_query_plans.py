@@ -0,0 +1,77 @@
+"""EXPLAIN QUERY PLAN checks for the hot per-user queries.
+
+A plan that scans a whole table or index, or sorts in a temporary B-tree,
+means a composite index is missing or no longer matches the query.
+"""
+from datetime import datetime
+
+import pytest
+
+from app import db, geo
+from app.models import FillUp, HeatmapCell, TriPoint, Trip, User, geohash_filter
+
+USER_ID = 1
+WHEN = datetime(2024, 1, 1)
+BBOX = (47.9, 106.9, 47.95, 106.95)
+
+HOT_QUERIES = {
+    'fillups_by_odometer': lambda: FillUp.query.filter_by(user_id=USER_ID).order_by(FillUp.odometer_km.asc()),
+    'latest_fillup': lambda: FillUp.query.filter_by(user_id=USER_ID).order_by(FillUp.odometer_km.desc()).limit(1),
+    'previous_fillup': lambda: FillUp.query.filter(
+        FillUp.user_id == USER_ID, FillUp.odometer_km < 1000.0
+    ).order_by(FillUp.odometer_km.desc(), FillUp.id.desc()).limit(1),
+    'fillup_keyset_chunk': lambda: FillUp.query.filter(
+        FillUp.user_id == USER_ID, FillUp.odometer_km >= 1000.0
+    ).order_by(FillUp.odometer_km, FillUp.id).limit(1000),
+    'fillups_by_date': lambda: FillUp.query.filter_by(user_id=USER_ID).order_by(FillUp.date.asc()),
+    'efficiency_sums': lambda: db.session.query(
+        db.func.sum(FillUp.distance_since_prev_km), db.func.sum(FillUp.fuel_liters)
+    ).filter(FillUp.user_id == USER_ID, FillUp.distance_since_prev_km > 0),
+    'latest_point': lambda: TriPoint.query.filter_by(user_id=USER_ID).order_by(TriPoint.trip_date.desc()).limit(1),
+    'recent_points': lambda: TriPoint.query.filter_by(user_id=USER_ID).order_by(TriPoint.trip_date.desc()).limit(2000),
+    'track_export_page': lambda: TriPoint.iter_track(USER_ID, after=(WHEN, 10), limit=1001),
+    'points_between_fillups': lambda: TriPoint.query.filter(
+        TriPoint.trip_date >= WHEN, TriPoint.trip_date <= WHEN, TriPoint.user_id == USER_ID
+    ).order_by(TriPoint.trip_date.asc()),
+    'open_trip': lambda: Trip.query.filter_by(user_id=USER_ID, is_open=True).limit(1),
+    'trips_page': lambda: Trip.query.filter(
+        Trip.user_id == USER_ID, Trip.start_time < WHEN
+    ).order_by(Trip.start_time.desc()).limit(20),
+    'viewport_points': lambda: TriPoint.filter_bbox(TriPoint.query.filter(TriPoint.user_id == USER_ID), *BBOX),
+    'heatmap_user_cells': lambda: db.session.query(HeatmapCell.cell, HeatmapCell.point_count).filter(
+        HeatmapCell.user_id == USER_ID, HeatmapCell.precision == 5,
+        geohash_filter(HeatmapCell.cell, geo.geohash_cover(*BBOX, 5)[1])
+    ),
+    'heatmap_fleet_cells': lambda: db.session.query(HeatmapCell.cell, db.func.sum(HeatmapCell.point_count)).filter(
+        HeatmapCell.precision == 5, geohash_filter(HeatmapCell.cell, geo.geohash_cover(*BBOX, 5)[1])
+    ).group_by(HeatmapCell.cell),
+}
+
+# Global "newest N" lists walk an index in order and stop after LIMIT rows;
+# the scan is fine, the sort is what must not happen.
+TOP_N_QUERIES = {
+    'admin_recent_users': lambda: User.query.order_by(User.created_at.desc()).limit(5),
+    'admin_recent_fillups': lambda: FillUp.query.order_by(FillUp.date.desc()).limit(5),
+}
+
+
+def explain(query):
+    sql = query.statement.compile(db.engine, compile_kwargs={'literal_binds': True})
+    rows = db.session.execute(db.text(f'EXPLAIN QUERY PLAN {sql}')).all()
+    return [row[-1] for row in rows]
+
+
+@pytest.mark.parametrize('name', sorted(HOT_QUERIES))
+def test_hot_query_uses_index(app, name):
+    plan = explain(HOT_QUERIES[name]())
+
+    assert any('USING' in step and 'INDEX' in step for step in plan), plan
+    assert not [step for step in plan if step.startswith('SCAN') or 'TEMP B-TREE' in step], plan
+
+
+@pytest.mark.parametrize('name', sorted(TOP_N_QUERIES))
+def test_top_n_query_reads_index_in_order(app, name):
+    plan = explain(TOP_N_QUERIES[name]())
+
+    assert any('USING INDEX' in step for step in plan), plan
+    assert not [step for step in plan if 'TEMP B-TREE' in step], plan
@@ -0,0 +1,126 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db, geo, partitions
+from app.cache import admin_stats
+from app.models import TriPoint, HeatmapCell, UserTripStats, TriPointRollup
+
+NOW = datetime.utcnow().replace(microsecond=0)
+
+
+def store_drive(user, start, seconds):
+    """A 1 Hz drive with its odometer chained like ingest does"""
+    db.session.execute(db.insert(TriPoint), [{
+        'user_id': user.id, 'lat': 47.9 + i * 1e-4, 'lon': 106.9, 'odometer_km': i * 0.011,
+        'trip_date': start + timedelta(seconds=i),
+    } for i in range(seconds)])
+    db.session.commit()
+
+
+def odometers(user, before=None):
+    query = TriPoint.query.filter_by(user_id=user.id)
+    if before:
+        query = query.filter(TriPoint.trip_date < before)
+    return [p.odometer_km for p in query.order_by(TriPoint.trip_date, TriPoint.id)]
+
+
+def test_downsample_keeps_one_point_per_minute(app, user):
+    old_start = datetime(2024, 3, 1, 8, 0, 30)
+    store_drive(user, old_start, 600)
+    store_drive(user, NOW - timedelta(hours=1), 120)
+    recent_before = odometers(user)[600:]
+    cutoff = NOW - timedelta(days=30)
+
+    deleted = TriPoint.downsample(user.id, cutoff)
+    db.session.commit()
+
+    kept = TriPoint.query.filter(TriPoint.trip_date < cutoff).order_by(TriPoint.trip_date).all()
+    # 600 s starting at :30 touch 11 minutes; the last fix of each is kept
+    assert len(kept) == 11
+    assert deleted == 589
+    assert [p.trip_date.second for p in kept[:-1]] == [59] * 10
+    assert kept[-1].trip_date == old_start + timedelta(seconds=599)
+    # Distance between first and last kept point is the full drive
+    assert kept[-1].odometer_km == 599 * 0.011
+    assert odometers(user)[11:] == recent_before
+
+    assert TriPoint.downsample(user.id, cutoff) == 0
+
+
+def test_cli_downsamples_in_daily_chunks(app, user):
+    store_drive(user, datetime(2024, 3, 1, 23, 58), 300)
+    store_drive(user, NOW - timedelta(minutes=10), 60)
+    admin_stats.invalidate()
+    assert admin_stats.get_counts(ttl_seconds=3600)['tri_point'] == 360
+
+    result = app.test_cli_runner().invoke(args=['downsample-tri-points', '--older-than-days', '7'])
+
+    assert '✅' in result.output
+    assert TriPoint.query.filter(TriPoint.trip_date < NOW - timedelta(days=7)).count() == 5
+    assert TriPoint.query.count() == 65
+    assert admin_stats.get_counts(ttl_seconds=3600)['tri_point'] == 65
+    admin_stats.invalidate()
+
+
+def heatmap(user):
+    return sorted((c.precision, c.cell, c.point_count) for c in HeatmapCell.query.filter_by(user_id=user.id))
+
+
+def test_downsample_keeps_distance_dwells_and_heatmap(app, user):
+    # Starts and ends on the last second of a minute, so both ends are kept
+    start = datetime(2024, 3, 1, 8, 0, 59)
+    # Weaving out and back along a street, parked at the far end
+    lats = [47.9 + min(i, 600 - i) * 1e-4 for i in range(601)]
+    lons = [106.9 + (i % 2) * 1e-4 for i in range(601)]
+    odometers = [0.0] + geo.chain_odometer(0.0, lats, lons, TriPoint.JITTER_KM)
+    db.session.execute(db.insert(TriPoint), [{
+        'user_id': user.id, 'lat': lats[i], 'lon': lons[i], 'odometer_km': odometers[i],
+        'trip_date': start + timedelta(seconds=i + (300 if i > 300 else 0)),
+        'dwell_until': start + timedelta(seconds=600) if i == 300 else None,
+    } for i in range(601)])
+    db.session.commit()
+    HeatmapCell.rebuild(user.id)
+    before = UserTripStats.rebuild(user.id).total_distance_km
+    db.session.commit()
+
+    TriPoint.downsample(user.id, NOW - timedelta(days=30))
+    db.session.commit()
+
+    parked = TriPoint.query.filter(TriPoint.dwell_until.is_not(None)).one()
+    assert parked.trip_date == start + timedelta(seconds=300)
+    assert UserTripStats.get_stats(user.id).point_count == TriPoint.query.count() < 30
+    assert before == pytest.approx(odometers[-1])
+    assert UserTripStats.rebuild(user.id).total_distance_km == pytest.approx(before)
+    counts = heatmap(user)
+    HeatmapCell.rebuild(user.id)
+    assert counts == heatmap(user)
+
+
+def test_cli_resumes_from_its_watermark(app, user):
+    runner = app.test_cli_runner()
+    store_drive(user, datetime(2024, 3, 1, 8), 300)
+    runner.invoke(args=['downsample-tri-points', '--older-than-days', '7'])
+    assert db.session.get(TriPointRollup, user.id).thinned_until == datetime(2024, 3, 2)
+
+    # Raw points behind the watermark are only reached by --full
+    store_drive(user, datetime(2024, 2, 1, 8), 300)
+    runner.invoke(args=['downsample-tri-points', '--older-than-days', '7'])
+    assert TriPoint.query.count() == 305
+    runner.invoke(args=['downsample-tri-points', '--older-than-days', '7', '--full'])
+    assert TriPoint.query.count() == 10
+    admin_stats.invalidate()
+
+
+def test_partitioning_is_a_noop_on_sqlite(app, user):
+    runner = app.test_cli_runner()
+
+    assert not partitions.is_partitioned()
+    assert partitions.create_future_partitions(3) == []
+    assert 'PostgreSQL' in runner.invoke(args=['partition-tri-point']).output
+    assert 'PostgreSQL' in runner.invoke(args=['create-tri-point-partitions']).output
+
+
+def test_partition_month_arithmetic():
+    assert partitions.add_months(datetime(2024, 11, 1).date(), 3).isoformat() == '2025-02-01'
+    assert partitions.partition_name(datetime(2025, 2, 1)) == 'tri_point_y2025m02'
@@ -0,0 +1,95 @@
+import json
+
+import pytest
+from flask import g
+
+from app import db
+from app.events import stats_events
+from test_last_point_cache import login, make_users
+from test_location import make_points
+
+
+@pytest.fixture
+def stream_config(app):
+    app.config.update(STATS_STREAM_ENABLED=True, STATS_STREAM_KEEPALIVE_SECONDS=0.05, STATS_STREAM_MAX_SECONDS=60)
+
+
+def open_stream(client):
+    response = client.get('/api/trips/stream')
+    assert response.mimetype == 'text/event-stream'
+    return response, iter(response.response)
+
+
+def next_event(chunks):
+    """Next stats payload, or None for a keepalive"""
+    chunk = next(chunks)
+    while chunk.startswith(b'retry:'):
+        chunk = next(chunks)
+    if chunk.startswith(b':'):
+        return None
+    event, data = chunk.decode().strip().split('\n')
+    assert event == 'event: stats'
+    return json.loads(data[len('data: '):])
+
+
+def test_stream_pushes_stats_when_points_are_committed(app, client, user, stream_config):
+    points = make_points(20)
+    client.post('/api/location/batch', json=points[:10])
+    response, chunks = open_stream(client)
+
+    first = next_event(chunks)
+    assert first['total_points'] == 10
+    assert stats_events.subscriber_count(user.id) == 1
+
+    # Nothing new: only keepalives
+    assert next_event(chunks) is None
+
+    g.pop('_login_user', None)
+    client.post('/api/location/batch', json=points[10:])
+    pushed = next_event(chunks)
+    assert pushed['total_points'] == 20
+    assert pushed['total_distance_km'] > first['total_distance_km']
+    assert pushed['odometer_km'] == pytest.approx(pushed['total_distance_km'], abs=0.001)
+
+    response.close()
+    assert stats_events.subscriber_count(user.id) == 0
+
+
+def test_other_users_points_do_not_wake_the_stream(app, client, user, stream_config):
+    other, = make_users(1, 'SSE')
+    other_client = login(app, other)
+    g.pop('_login_user', None)
+    response, chunks = open_stream(client)
+    assert next_event(chunks)['total_points'] == 0
+
+    g.pop('_login_user', None)
+    other_client.post('/api/location/batch', json=make_points(5))
+    assert next_event(chunks) is None
+    response.close()
+
+
+def test_rolled_back_ingest_publishes_nothing(app, user):
+    subscription = stats_events.subscribe(user.id)
+    try:
+        stats_events.mark_changed(db.session, user.id)
+        db.session.rollback()
+        assert subscription.empty()
+
+        stats_events.mark_changed(db.session, user.id)
+        db.session.commit()
+        assert subscription.get_nowait() == user.id
+    finally:
+        stats_events.unsubscribe(user.id, subscription)
+
+
+def test_stream_ends_for_the_browser_to_reconnect(app, client, user):
+    app.config.update(STATS_STREAM_ENABLED=True, STATS_STREAM_KEEPALIVE_SECONDS=0.01, STATS_STREAM_MAX_SECONDS=0.05)
+    response, chunks = open_stream(client)
+    assert len(list(chunks)) >= 2
+    assert stats_events.subscriber_count(user.id) == 0
+
+
+def test_stream_is_off_by_default(client, user):
+    assert client.get('/api/trips/stream').status_code == 404
+    assert stats_events.subscriber_count(user.id) == 0
+    assert 'const STATS_STREAM_ENABLED = false;' in client.get('/map').get_data(as_text=True)
@@ -0,0 +1,64 @@
+from datetime import datetime
+
+import pytest
+
+from app import db
+from app.models import TankState, Vehicle
+from test_fuel_calculation import add_fillups
+from test_fuel_stats import post_fillup
+from test_vehicle import count_queries, get_fresh
+
+
+STATE_COLUMNS = ('last_fillup_id', 'last_fillup_date', 'last_fillup_odometer_km',
+                 'fuel_after_fillup', 'efficiency_l_per_100km', 'current_odometer_km')
+
+
+def assert_state_matches_rows(user_id):
+    stored = db.session.get(TankState, user_id)
+    db.session.refresh(stored)
+    computed = TankState.compute(user_id, Vehicle.get_current_vehicle(user_id))
+    for column in STATE_COLUMNS:
+        expected = getattr(computed, column)
+        if isinstance(expected, float):
+            expected = pytest.approx(expected)
+        assert getattr(stored, column) == expected, column
+
+
+def test_state_advances_with_fillups_and_gps(client, user):
+    post_fillup(client, 1000)
+    post_fillup(client, 1500, fuel_liters=40)
+    assert_state_matches_rows(user.id)
+
+    for lat in (47.90, 47.91, 47.92):
+        client.post('/api/location', json={'lat': lat, 'lon': 106.90, 'timestamp': datetime.utcnow().isoformat()})
+    assert_state_matches_rows(user.id)
+
+    latest = db.session.get(TankState, user.id).last_fillup_id
+    client.post(f'/delete_fillup/{latest}')
+    assert_state_matches_rows(user.id)
+    assert db.session.get(TankState, user.id).last_fillup_odometer_km == 1000
+
+
+def test_fuel_status_uses_gps_distance(app, user):
+    state = TankState(user_id=user.id, last_fillup_date=datetime.utcnow(), last_fillup_odometer_km=1000,
+                      fuel_after_fillup=50, efficiency_l_per_100km=10, current_odometer_km=1200)
+
+    status = state.fuel_status(60.0)
+
+    assert status['distance_driven'] == 200
+    assert status['remaining_fuel'] == pytest.approx(30)
+    assert status['predicted_range'] == pytest.approx(300)
+
+
+def test_fuel_status_reads_are_constant(client, user):
+    add_fillups(user, 5)
+    with count_queries() as few:
+        assert get_fresh(client, '/api/last_fillup').json['success']
+        assert get_fresh(client, '/test_fuel_calculation').json['success']
+
+    add_fillups(user, 300, seed=2)
+    with count_queries() as many:
+        assert get_fresh(client, '/api/last_fillup').json['success']
+        assert get_fresh(client, '/test_fuel_calculation').json['success']
+
+    assert len(many) == len(few)
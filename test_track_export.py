@@ -0,0 +1,77 @@
+import json
+import tracemalloc
+from datetime import datetime, timedelta
+
+from app import db
+from app.models import TriPoint
+
+
+def store(user, count, start=datetime(2024, 1, 1)):
+    # Two points per timestamp so paging has to break ties on id
+    db.session.execute(db.insert(TriPoint), [{
+        'user_id': user.id, 'lat': 47.9 + i * 1e-5, 'lon': 106.9, 'odometer_km': i * 0.01,
+        'trip_date': start + timedelta(seconds=i // 2),
+    } for i in range(count)])
+    db.session.commit()
+
+
+def read_lines(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_pages_cover_every_point_once_in_order(client, user):
+    store(user, 1001)
+
+    seen = []
+    url = '/api/location/export?limit=100'
+    while True:
+        response = client.get(url)
+        assert response.mimetype == 'application/x-ndjson'
+        lines = read_lines(response)
+        if 'next_cursor' in lines[-1]:
+            seen.extend(lines[:-1])
+            url = f"/api/location/export?limit=100&after={lines[-1]['next_cursor']}"
+        else:
+            seen.extend(lines)
+            break
+
+    expected = TriPoint.query.order_by(TriPoint.trip_date, TriPoint.id).all()
+    assert [p['id'] for p in seen] == [p.id for p in expected]
+
+
+def test_time_bounds_and_unpaged_stream(client, user):
+    store(user, 40)
+
+    lines = read_lines(client.get('/api/location/export?since=2024-01-01T00:00:05&until=2024-01-01T00:00:09'))
+
+    assert len(lines) == 10
+    assert lines[0]['date'] == '2024-01-01T00:00:05'
+    assert lines[-1]['date'] == '2024-01-01T00:00:09'
+    assert len(read_lines(client.get('/api/location/export'))) == 40
+
+
+def test_bad_cursor_is_rejected(client, user):
+    assert client.get('/api/location/export?after=nonsense').status_code == 400
+    assert client.get('/api/location/export?since=soon').status_code == 400
+
+
+def test_streaming_memory_is_flat(client, user, app):
+    app.config['TRACK_EXPORT_CHUNK_SIZE'] = 500
+
+    def peak_while_streaming():
+        tracemalloc.start()
+        response = client.get('/api/location/export')
+        count = sum(1 for chunk in response.response if chunk)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        response.close()
+        return count, peak
+
+    store(user, 2000)
+    small_count, small_peak = peak_while_streaming()
+    store(user, 38000, start=datetime(2024, 2, 1))
+    large_count, large_peak = peak_while_streaming()
+
+    assert (small_count, large_count) == (2000, 40000)
+    # Twenty times the points, nowhere near twenty times the memory
+    assert large_peak < small_peak * 3
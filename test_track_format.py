@@ -0,0 +1,77 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db, polyline
+from app.models import TriPoint
+from test_track_simplify import winding_track
+
+COMPACT = {'Accept': polyline.MIMETYPE}
+
+
+def store_drive(user, count):
+    lats, lons = winding_track(count)
+    odometer = 0.0
+    rows = []
+    for i, (lat, lon) in enumerate(zip(lats, lons)):
+        odometer += 0.0123
+        rows.append({
+            'user_id': user.id, 'lat': lat, 'lon': lon, 'odometer_km': odometer,
+            'trip_date': datetime(2024, 1, 1, 6) + timedelta(seconds=i, milliseconds=250 * (i % 4)),
+            'accuracy': None if i % 7 == 0 else 3.0 + i % 20,
+        })
+    db.session.execute(db.insert(TriPoint), rows)
+    db.session.commit()
+
+
+def test_google_reference_polyline():
+    encoded = polyline.encode_polyline([38.5, 40.7, 43.252], [-120.2, -120.95, -126.453])
+
+    assert encoded == '_p~iF~ps|U_ulLnnqC_mqNvxq`@'
+    assert polyline.decode_polyline(encoded) == ([38.5, 40.7, 43.252], [-120.2, -120.95, -126.453])
+
+
+def test_values_round_trip():
+    values = [0, 1, -1, 31, 32, -1000000, 1704067200000, 1704067200250, 3]
+    assert polyline.decode_values(polyline.encode_values(values)) == values
+
+
+def test_compact_track_round_trips_against_json(client, user):
+    store_drive(user, 10000)
+
+    as_json = client.get('/api/location?limit=10000')
+    compact = client.get('/api/location?limit=10000', headers=COMPACT)
+
+    assert compact.headers['Content-Type'] == polyline.MIMETYPE
+    assert len(as_json.data) / len(compact.data) >= 10
+    expected = as_json.get_json()
+    decoded = polyline.decode_track(compact.get_json())
+    assert len(decoded) == len(expected) == 10000
+    for got, want in zip(decoded, expected):
+        assert got['id'] == want['id']
+        assert got['date'] == datetime.fromisoformat(want['date']).isoformat()
+        assert got['lat'] == pytest.approx(want['lat'], abs=0.5e-5)
+        assert got['lon'] == pytest.approx(want['lon'], abs=0.5e-5)
+        assert got['odometer_km'] == pytest.approx(want['odometer_km'], abs=0.0005 + 1e-9)
+        if want['accuracy'] is None:
+            assert got['accuracy'] is None
+        else:
+            assert got['accuracy'] == pytest.approx(want['accuracy'], abs=0.5)
+
+
+def test_format_negotiation(client, user):
+    store_drive(user, 20)
+
+    assert isinstance(client.get('/api/location').get_json(), list)
+    assert isinstance(client.get('/api/location', headers={'Accept': '*/*'}).get_json(), list)
+    assert client.get('/api/location?format=polyline').get_json()['count'] == 20
+    simplified = client.get('/api/location?zoom=15', headers=COMPACT)
+    assert simplified.headers['Vary'] == 'Accept'
+    assert polyline.decode_track(simplified.get_json())[0]['date'] == '2024-01-01T06:00:00'
+
+
+def test_empty_track(client, user):
+    payload = client.get('/api/location', headers=COMPACT).get_json()
+
+    assert payload['count'] == 0
+    assert polyline.decode_track(payload) == []
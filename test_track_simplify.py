@@ -0,0 +1,130 @@
+import math
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db, geo
+from app.models import TriPoint
+
+
+def winding_track(count, seed=11):
+    """A city drive: mostly straight runs with turns and 3 m GPS noise"""
+    rng = random.Random(seed)
+    lat, lon, heading = 47.9, 106.9, 0.0
+    lats, lons = [], []
+    for i in range(count):
+        if i % 200 == 0:
+            heading += rng.uniform(-1.5, 1.5)
+        step = 0.00008
+        lat += step * math.cos(heading) + rng.gauss(0, 0.00003)
+        lon += step * math.sin(heading) + rng.gauss(0, 0.00003)
+        lats.append(lat)
+        lons.append(lon)
+    return lats, lons
+
+
+def store(user, lats, lons, start=datetime(2024, 1, 1)):
+    db.session.execute(db.insert(TriPoint), [{
+        'user_id': user.id, 'lat': lat, 'lon': lon, 'odometer_km': 0.0,
+        'trip_date': start + timedelta(seconds=i),
+    } for i, (lat, lon) in enumerate(zip(lats, lons))])
+    db.session.commit()
+
+
+def max_error_m(lats, lons, kept):
+    """Largest distance of a dropped point from the simplified line, meters"""
+    xs, ys = geo._project_m(lats, lons)
+    worst = 0.0
+    for first, last in zip(kept, kept[1:]):
+        offsets = geo._segment_offsets_m(xs, ys, first, last, False)
+        if offsets:
+            worst = max(worst, max(offsets))
+    return worst
+
+
+BACKENDS = [False] + ([True] if geo.HAVE_NUMPY else [])
+
+
+@pytest.mark.parametrize('use_numpy', BACKENDS)
+def test_simplified_track_stays_within_tolerance(use_numpy):
+    lats, lons = winding_track(5000)
+
+    kept = geo.simplify_indexes(lats, lons, 15.0, use_numpy=use_numpy)
+
+    assert kept[0] == 0 and kept[-1] == len(lats) - 1
+    assert len(kept) < len(lats) / 5
+    assert max_error_m(lats, lons, kept) <= 15.0
+
+
+def test_bounded_simplification_raises_tolerance_to_fit():
+    lats, lons = winding_track(5000)
+
+    kept, tolerance = geo.simplify_bounded(lats, lons, 0.5, max_points=100)
+
+    assert len(kept) <= 100
+    assert tolerance > 0.5
+    assert max_error_m(lats, lons, kept) <= tolerance
+
+
+def test_zoom_mode_payload_is_bounded(client, user, app):
+    app.config['TRACK_SIMPLIFY_MAX_POINTS'] = 300
+    lats, lons = winding_track(20000)
+    store(user, lats, lons)
+
+    response = client.get('/api/location?zoom=12')
+
+    points = response.get_json()
+    assert response.headers['X-Track-Source-Points'] == '20000'
+    assert 2 <= len(points) <= 300
+    assert len(response.data) < 300 * 200
+    # Every raw point is within the reported tolerance of the returned line
+    tolerance = float(response.headers['X-Track-Tolerance-M'])
+    ids = [p['id'] for p in points]
+    first_id = TriPoint.query.order_by(TriPoint.id).first().id
+    assert max_error_m(lats, lons, [i - first_id for i in ids]) <= tolerance + 0.01
+
+
+def test_bounded_simplification_matches_plain_douglas_peucker():
+    lats, lons = winding_track(3000)
+
+    kept, tolerance = geo.simplify_bounded(lats, lons, 3.0, max_points=10000)
+
+    assert tolerance == 3.0
+    assert kept == geo.simplify_indexes(lats, lons, 3.0, use_numpy=False)
+
+
+def test_simplified_read_is_capped_to_the_latest_points(client, user, app, monkeypatch):
+    monkeypatch.setitem(app.config, 'TRACK_SIMPLIFY_MAX_SOURCE_POINTS', 1000)
+    lats, lons = winding_track(3000)
+    store(user, lats, lons)
+
+    response = client.get('/api/location?zoom=12')
+
+    assert response.headers['X-Track-Source-Points'] == '1000'
+    assert response.headers['X-Track-Source-Truncated'] == '1'
+    first_kept = TriPoint.query.order_by(TriPoint.trip_date).offset(2000).first()
+    assert response.get_json()[0]['date'] == first_kept.trip_date.isoformat()
+
+
+def test_tolerance_mode_honours_time_range(client, user):
+    lats, lons = winding_track(3000)
+    store(user, lats, lons)
+
+    points = client.get('/api/location?tolerance_m=5&since=2024-01-01T00:10:00&until=2024-01-01T00:20:00Z').get_json()
+
+    assert points[0]['date'] == '2024-01-01T00:10:00'
+    assert points[-1]['date'] == '2024-01-01T00:20:00'
+    assert len(points) < 601
+    assert client.get('/api/location?zoom=10&since=yesterday').status_code == 400
+
+
+def test_raw_mode_is_unchanged(client, user):
+    lats, lons = winding_track(50)
+    store(user, lats, lons)
+
+    points = client.get('/api/location?limit=20').get_json()
+
+    assert len(points) == 20
+    assert points[-1]['date'] == '2024-01-01T00:00:49'
+    assert set(points[0]) == {'id', 'lat', 'lon', 'odometer_km', 'date', 'accuracy'}
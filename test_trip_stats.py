@@ -0,0 +1,86 @@
+from datetime import datetime, timedelta
+
+import pytest
+from flask import g
+
+from app import db
+from app.cache import LocalLRUBackend, last_points
+from app.models import TriPoint, UserTripStats
+from test_location import make_points
+from test_vehicle import count_queries
+
+TOTALS = ('point_count', 'total_distance_km', 'moving_seconds', 'idle_seconds',
+          'max_speed_kmh', 'speed_sum_kmh', 'moving_segments', 'last_point_date')
+
+
+def drive(count, start=datetime(2024, 1, 1, 8)):
+    """A drive with a stop in the middle and some 1-2 m jitter"""
+    points = make_points(count, start=start, step=0.0002)
+    for i in range(count // 3, count // 2):
+        points[i]['lat'] = points[count // 3]['lat'] + (0.00001 if i % 2 else 0.0)
+    return points
+
+
+def assert_matches_rebuild(user_id):
+    stored = {column: getattr(db.session.get(UserTripStats, user_id), column) for column in TOTALS}
+    computed = UserTripStats.compute(user_id)
+    assert stored.pop('last_point_date') == computed['last_point_date']
+    for column, value in stored.items():
+        assert value == pytest.approx(computed[column], rel=1e-9), column
+
+
+def test_running_totals_follow_single_and_batch_ingest(client, user):
+    points = drive(60)
+    for point in points[:10]:
+        assert client.post('/api/location', json=point).status_code == 201
+    client.post('/api/location/batch', json=points[10:35])
+    for point in points[35:40]:
+        client.post('/api/location', json=point)
+    client.post('/api/location/batch', json={'points': points[40:]})
+
+    db.session.expire_all()
+    assert db.session.get(UserTripStats, user.id).point_count == 60
+    assert_matches_rebuild(user.id)
+
+
+def test_stats_endpoint_reads_no_points(client, user):
+    # The odometer comes from the last-point cache once one is configured
+    last_points.backend = LocalLRUBackend()
+    client.post('/api/location/batch', json=drive(30))
+    g.pop('_login_user', None)
+
+    with count_queries() as statements:
+        stats = client.get('/api/trips/stats').get_json()
+
+    assert not [s for s in statements if 'FROM tri_point' in s]
+    assert stats['mode'] == 'running'
+    assert stats['total_points'] == 30
+    assert stats['total_distance_km'] > 0
+    assert stats['moving_time_minutes'] > 0
+
+
+def test_window_mode_recomputes_last_points(client, user):
+    points = drive(40)
+    client.post('/api/location/batch', json=points)
+
+    window = client.get('/api/trips/stats?limit=10').get_json()
+    running = client.get('/api/trips/stats').get_json()
+
+    assert window['mode'] == 'window'
+    assert window['total_points'] == 10
+    assert window['total_distance_km'] < running['total_distance_km']
+    assert window['last_update'] == running['last_update'] == datetime.fromisoformat(points[-1]['timestamp']).isoformat()
+
+
+def test_missing_totals_are_built_on_first_ingest(client, user):
+    db.session.add_all(TriPoint(user_id=user.id, lat=47.9 + i * 0.001, lon=106.9, odometer_km=0.0,
+                                trip_date=datetime(2024, 1, 1) + timedelta(minutes=i)) for i in range(5))
+    db.session.commit()
+    assert db.session.get(UserTripStats, user.id) is None
+    assert client.get('/api/trips/stats').get_json()['total_points'] == 5
+
+    client.post('/api/location', json={'lat': 47.91, 'lon': 106.9, 'timestamp': '2024-01-01T00:10:00Z'})
+
+    db.session.expire_all()
+    assert db.session.get(UserTripStats, user.id).point_count == 6
+    assert_matches_rebuild(user.id)
@@ -0,0 +1,110 @@
+from datetime import datetime, timedelta
+
+import pytest
+from flask import g
+
+from app import db
+from app.models import Trip
+from test_last_point_cache import login, make_users
+from test_vehicle import count_queries
+
+START = datetime(2024, 1, 1, 8)
+
+COLUMNS = ('start_time', 'end_time', 'start_lat', 'end_lat', 'distance_km', 'moving_seconds',
+           'idle_seconds', 'max_speed_kmh', 'speed_sum_kmh', 'moving_segments', 'is_open')
+
+
+def route(*legs, start=START):
+    """Points for legs of (count, degrees north per fix, seconds per fix)"""
+    points = []
+    lat, when = 47.9, start
+    for count, step, seconds in legs:
+        for _ in range(count):
+            lat += step
+            when += timedelta(seconds=seconds)
+            points.append({'lat': lat, 'lon': 106.9, 'timestamp': when.isoformat()})
+    return points
+
+
+def trips(user_id):
+    db.session.expire_all()
+    return Trip.query.filter_by(user_id=user_id).order_by(Trip.start_time).all()
+
+
+def snapshot(user_id):
+    return [{column: getattr(trip, column) for column in COLUMNS} for trip in trips(user_id)]
+
+
+def assert_matches_rebuild(user_id):
+    incremental = snapshot(user_id)
+    Trip.rebuild(user_id)
+    rebuilt = snapshot(user_id)
+    assert len(incremental) == len(rebuilt)
+    for ours, theirs in zip(incremental, rebuilt):
+        for column, value in ours.items():
+            if isinstance(value, float):
+                assert value == pytest.approx(theirs[column]), column
+            else:
+                assert value == theirs[column], column
+
+
+def test_gap_and_long_stop_split_trips(client, user):
+    # ~11 m every 5 s (~8 km/h), a 60 s stop, more driving, a 10 minute
+    # stop with the tracker still on, then tracking off for an hour
+    points = route((20, 0.0001, 5), (6, 0.0, 10), (20, 0.0001, 5), (60, 0.0, 10), (20, 0.0001, 5))
+    points += route((20, 0.0001, 5), start=START + timedelta(hours=2))
+    client.post('/api/location/batch', json=points[:30])
+    for point in points[30:50]:
+        client.post('/api/location', json=point)
+    client.post('/api/location/batch', json=points[50:])
+
+    first, second, third = trips(user.id)
+    assert not first.is_open and not second.is_open and third.is_open
+    # The short stop stays inside the first trip as idle time
+    assert first.idle_seconds == pytest.approx(60)
+    assert first.distance_km == pytest.approx(39 * 0.0001 * 111.19, rel=0.01)
+    # The long stop is cut off at the last moving fix
+    assert first.end_time == datetime.fromisoformat(points[45]['timestamp'])
+    assert second.start_time == datetime.fromisoformat(points[105]['timestamp'])
+    assert third.start_time == datetime.fromisoformat(points[126]['timestamp'])
+    assert first.fuel_liters > 0
+    assert_matches_rebuild(user.id)
+
+
+def test_jitter_alone_makes_no_trip(client, user):
+    points = route(*[(1, 0.00002 if i % 2 else -0.00002, 10) for i in range(40)])
+    client.post('/api/location/batch', json=points)
+    assert trips(user.id) == []
+
+
+def test_stop_tracking_closes_the_trip(client, user):
+    client.post('/api/location/batch', json=route((30, 0.0001, 5)))
+
+    response = client.post('/api/trips', json={})
+    assert response.status_code == 201
+    saved = response.get_json()
+    assert saved['data']['is_open'] is False
+    assert saved['data']['distance_km'] > 0.1
+    assert db.session.get(Trip, saved['trip_id']) is not None
+
+    assert client.post('/api/trips', json={}).get_json()['trip_id'] is None
+
+
+def test_listing_pages_newest_first_without_reading_points(app, client, user):
+    for hour in range(3):
+        client.post('/api/location/batch', json=route((20, 0.0001, 5), start=START + timedelta(hours=hour)))
+    g.pop('_login_user', None)
+
+    with count_queries() as statements:
+        page = client.get('/api/trips?limit=2').get_json()
+    assert not [s for s in statements if 'FROM tri_point' in s]
+    assert [t['start_time'][:13] for t in page['trips']] == ['2024-01-01T10', '2024-01-01T09']
+
+    rest = client.get(f"/api/trips?limit=2&before={page['next_before']}").get_json()
+    assert [t['start_time'][:13] for t in rest['trips']] == ['2024-01-01T08']
+    assert rest['next_before'] is None
+
+    other, = make_users(1, 'TRIP')
+    other_client = login(app, other)
+    assert other_client.get('/api/trips').get_json()['trips'] == []
+    assert other_client.get(f"/api/trips/{page['trips'][0]['id']}").status_code == 404
@@ -0,0 +1,134 @@
+from contextlib import contextmanager
+
+import pytest
+from flask import g
+from sqlalchemy import event
+
+from app import db
+from app.models import FillUp, User, Vehicle
+from test_fuel_calculation import add_fillups
+
+
+@contextmanager
+def count_queries():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def test_get_current_vehicle_does_not_write(app):
+    user = User(license_number='5678УНА', password_hash='x')
+    db.session.add(user)
+    db.session.commit()
+    user_id = user.id
+
+    with count_queries() as statements:
+        vehicle = Vehicle.get_current_vehicle(user_id)
+        again = Vehicle.get_current_vehicle(user_id)
+
+    assert vehicle is again
+    assert vehicle.id is None
+    assert vehicle.tank_capacity_liters == 50.0
+    assert len(statements) == 1
+    assert statements[0].lstrip().upper().startswith('SELECT')
+    assert Vehicle.query.count() == 0
+
+
+def test_register_creates_default_vehicle(app):
+    client = app.test_client()
+    client.post('/register', data={'license_number': '9012УБВ', 'password': 'secret1', 'password2': 'secret1'})
+
+    user = User.query.filter_by(license_number='9012УБВ').one()
+    assert Vehicle.query.filter_by(user_id=user.id).count() == 1
+
+
+def test_register_starts_with_an_empty_fuel_snapshot(app):
+    client = app.test_client()
+    with count_queries() as statements:
+        client.post('/register', data={'license_number': '3456УБГ', 'password': 'secret1', 'password2': 'secret1'})
+
+    assert not [s for s in statements if 'FROM fill_up' in s]
+    stats = User.query.filter_by(license_number='3456УБГ').one().fuel_stats
+    assert (stats.fillup_count, stats.total_spent, stats.best_efficiency_l_per_100km) == (0, 0, None)
+
+
+def get_fresh(client, url):
+    """GET with an empty request cache and session, as a real request would start with"""
+    # The fixtures keep one app context (and so one flask.g and session) around all requests
+    g.pop('_vehicles', None)
+    db.session.expire_all()
+    return client.get(url)
+
+
+def test_history_query_count_is_fixed(client, user):
+    add_fillups(user, 5)
+    with count_queries() as few:
+        assert get_fresh(client, '/history').status_code == 200
+
+    add_fillups(user, 495, seed=2)
+    with count_queries() as many:
+        assert get_fresh(client, '/history').status_code == 200
+
+    assert len(many) == len(few) == 4
+    assert not [s for s in many if not s.lstrip().upper().startswith('SELECT')]
+
+
+def make_fleet(count, fillups_each=6, start=0):
+    users = []
+    for i in range(start, start + count):
+        user = User(license_number=f'{i:04d}ФЛТ', password_hash='x')
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(Vehicle(user_id=user.id, fuel_type=('Petrol', 'Diesel', 'LPG')[i % 3]))
+        users.append(user)
+    db.session.commit()
+    for i, user in enumerate(users):
+        # Every fourth vehicle has no fill-ups
+        if i % 4:
+            add_fillups(user, fillups_each, seed=i)
+    return users
+
+
+def test_fleet_page_matches_per_user_stats(app):
+    users = make_fleet(12)
+
+    rows, pagination = Vehicle.get_fleet_page(page=1, per_page=100)
+
+    assert pagination.total == 12
+    for row in rows:
+        fillups = FillUp.query.filter_by(user_id=row['user_id']).all()
+        assert row['total_fillups'] == len(fillups)
+        assert row['total_spent'] == pytest.approx(sum(f.total_cost for f in fillups))
+        expected = FillUp.get_average_efficiency(row['user_id'])
+        assert row['average_efficiency'] == (pytest.approx(expected) if expected else None)
+
+    by_type = {t['fuel_type']: t for t in Vehicle.get_fuel_type_totals()}
+    assert sum(t['total_vehicles'] for t in by_type.values()) == 12
+    petrol = [r for r in rows if r['fuel_type'] == 'Petrol']
+    assert by_type['Petrol']['total_fillups'] == sum(r['total_fillups'] for r in petrol)
+    assert by_type['Petrol']['average_efficiency'] == pytest.approx(
+        sum(r['average_efficiency'] for r in petrol if r['average_efficiency'])
+        / len([r for r in petrol if r['average_efficiency']])
+    )
+
+
+def test_vehicle_chart_filters_and_pages(client, app):
+    make_fleet(45)
+
+    diesel = get_fresh(client, '/vehicle_chart?fuel_type=Diesel')
+    assert diesel.status_code == 200
+
+    with count_queries() as first:
+        assert get_fresh(client, '/vehicle_chart').status_code == 200
+    make_fleet(30, start=45)
+    with count_queries() as later:
+        assert get_fresh(client, '/vehicle_chart?page=3').status_code == 200
+
+    assert len(first) == len(later)
@@ -0,0 +1,86 @@
+import threading
+import time
+
+import pytest
+from flask import g
+
+from app import db, writer
+from app.models import TriPoint, UserTripStats
+from app.writer import point_writer
+from test_location import make_points, stored_points
+from test_trip_stats import assert_matches_rebuild
+
+
+@pytest.fixture
+def write_behind(app):
+    def configure(**settings):
+        app.config.update(LOCATION_WRITE_BEHIND=True, **settings)
+        writer.init_app(app)
+        return point_writer
+    yield configure
+    point_writer.stop()
+    app.config['LOCATION_WRITE_BEHIND'] = False
+
+
+def rows(user):
+    db.session.expire_all()
+    return TriPoint.query.filter_by(user_id=user.id).count()
+
+
+def test_queued_points_are_stored_like_synchronous_ones(app, client, user, write_behind):
+    queued = write_behind(LOCATION_WRITE_FLUSH_MS=50, LOCATION_WRITE_BATCH_POINTS=20)
+    points = make_points(60)
+    for point in points[:30]:
+        response = client.post('/api/location', json=point)
+        assert response.status_code == 202
+    assert client.post('/api/location/batch', json=points[30:]).status_code == 202
+    queued.drain()
+
+    g.pop('_login_user', None)
+    db.session.expire_all()
+    odometers = [p.odometer_km for p in stored_points(user)]
+    assert len(odometers) == 60
+    assert odometers == sorted(odometers) and odometers[-1] > 0
+    assert db.session.get(UserTripStats, user.id).point_count == 60
+    assert_matches_rebuild(user.id)
+
+    metrics = queued.metrics()
+    assert metrics['enqueued_points'] == metrics['written_points'] == 60
+    assert 1 <= metrics['flushes'] < 31
+    assert metrics['queue_depth'] == 0
+    assert metrics['avg_flush_ms'] > 0
+
+
+def test_full_queue_pushes_back(app, client, user, write_behind, monkeypatch):
+    queued = write_behind(LOCATION_WRITE_QUEUE_SIZE=1, LOCATION_WRITE_ENQUEUE_TIMEOUT_MS=50,
+                          LOCATION_WRITE_FLUSH_MS=1)
+    release = threading.Event()
+    real_flush = queued._flush
+    monkeypatch.setattr(queued, '_flush', lambda items: release.wait() and real_flush(items))
+    points = make_points(4)
+
+    try:
+        assert client.post('/api/location', json=points[0]).status_code == 202
+        while queued.queue.qsize():
+            time.sleep(0.001)
+        time.sleep(0.02)
+        # The writer is holding the first point; the second fills the queue
+        statuses = [client.post('/api/location', json=point).status_code for point in points[1:]]
+    finally:
+        release.set()
+    assert 503 in statuses
+    assert queued.metrics()['rejected_requests'] == statuses.count(503)
+
+    queued.drain()
+    assert rows(user) == statuses.count(202) + 1
+
+
+def test_shutdown_flushes_the_queue(app, client, user, write_behind):
+    queued = write_behind(LOCATION_WRITE_FLUSH_MS=60000, LOCATION_WRITE_BATCH_POINTS=1000)
+    for point in make_points(5):
+        client.post('/api/location', json=point)
+    assert rows(user) == 0
+
+    queued.stop()
+    assert rows(user) == 5
+    assert queued.metrics()['flushes'] == 1